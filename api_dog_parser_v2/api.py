@@ -0,0 +1,138 @@
+"""Async API to embed the parser into an asyncio application.
+
+Nothing here runs an event loop: the coroutines work in the caller's one,
+so several jobs can run concurrently in it. A job needs its own
+DownloadManager.
+
+    async def job(paths):
+        manager = DownloadManager(20, get_name=False,
+                                  is_folder_name_as_json=True,
+                                  progress=False, handle_sigint=False)
+        return await download(iter_photo_records(paths), manager)
+"""
+import logging
+from typing import (AsyncIterable, AsyncIterator, Dict, Iterable, Iterator,
+                    Optional, Union)
+
+import aiohttp
+
+from api_dog_parser_v2.constants_and_enum import (GrabbingFilter,
+                                                  VK_PROFILE_URL)
+from api_dog_parser_v2.parser_classes.async_iter import iterate_in_thread
+from api_dog_parser_v2.parser_classes.discovery import (DEFAULT_INCLUDE,
+                                                        FileDiscovery)
+from api_dog_parser_v2.parser_classes.download_manager import (
+    DownloadManager, DownloadResult)
+from api_dog_parser_v2.parser_classes.message_filter import MessageFilter
+from api_dog_parser_v2.parser_classes.metrics import metrics
+from api_dog_parser_v2.parser_classes.name_cache import NameCache
+from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+from api_dog_parser_v2.parser_classes.parse_cache import ParseCache
+from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+from api_dog_parser_v2.parser_classes.photo_store import PhotoRecord
+from api_dog_parser_v2.parser_classes.watch_state import WatchState
+
+
+def iter_parser_managers(
+        paths: Iterable[str],
+        *,
+        max_depth: Optional[int] = 0,
+        include: Iterable[str] = DEFAULT_INCLUDE,
+        exclude: Iterable[str] = (),
+        scan_threads: int = 16,
+        watch_state: Optional[WatchState] = None) -> Iterator[ParserManager]:
+    """Managers of the export folders found under the paths (blocking).
+
+    max_depth - depth of the recursive search (None - unlimited, 0 - only
+    the paths), watch_state - pass only new / changed exports (the last
+    messages are staged by watch_state.track after the parsing).
+    """
+    discovery = FileDiscovery(paths,
+                              max_depth=max_depth,
+                              include=include,
+                              exclude=exclude,
+                              workers=scan_threads)
+    folders = metrics.iter_stage('discovery', discovery.iter_folders())
+    if watch_state:
+        folders = watch_state.filter_changed(folders)
+    return (ParserManager(folder, files) for folder, files in folders)
+
+
+def iter_photo_records(
+        paths: Iterable[str],
+        grabbing_filter: GrabbingFilter = GrabbingFilter.ALL,
+        *,
+        message_filter: Optional[MessageFilter] = None,
+        max_depth: Optional[int] = 0,
+        include: Iterable[str] = DEFAULT_INCLUDE,
+        exclude: Iterable[str] = (),
+        scan_threads: int = 16,
+        parse_cache: Optional[ParseCache] = None,
+        watch_state: Optional[WatchState] = None,
+        queue_size: int = 1000) -> AsyncIterator[PhotoRecord]:
+    """Async generator of the photo records of the exports under the paths.
+
+    The files are found and parsed (streaming) in a thread, queue_size
+    records are buffered ahead of the consumer. Nothing is done before the
+    first record is requested. parse_cache is ignored with watch_state - the
+    photos of the new messages only must not be cached as the whole file.
+    """
+    if watch_state and parse_cache:
+        logging.warning('parse_cache is ignored with watch_state')
+        parse_cache = None
+    parsers = iter_parser_managers(paths,
+                                   max_depth=max_depth,
+                                   include=include,
+                                   exclude=exclude,
+                                   scan_threads=scan_threads,
+                                   watch_state=watch_state)
+    marks = None
+    if watch_state:
+        parsers = watch_state.track(parsers)
+        marks = watch_state.marks
+    records = (record for parser in parsers
+               for record in parser.iter_photo_records(
+                   grabbing_filter,
+                   parse_cache=parse_cache,
+                   marks=marks,
+                   message_filter=message_filter))
+    return iterate_in_thread(records, queue_size)
+
+
+async def download(records: AsyncIterable[PhotoRecord],
+                   manager: Optional[DownloadManager] = None,
+                   queue_size: int = 1000) -> DownloadResult:
+    """Download the records of any async iterable.
+
+    manager - configured manager of the job. The default one saves into
+    the folders of the exports (owner id folders), w/o progress bars and
+    the SIGINT handler.
+    """
+    if manager is None:
+        manager = DownloadManager(10,
+                                  get_name=False,
+                                  is_folder_name_as_json=True,
+                                  progress=False,
+                                  handle_sigint=False)
+    return await manager.download_records(records, queue_size)
+
+
+async def resolve_names(
+        ids: Iterable[Union[str, int]],
+        *,
+        limit: int = 10,
+        rate: float = 0,
+        name_cache: Optional[NameCache] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        profile_url: str = VK_PROFILE_URL) -> Dict[int, str]:
+    """VK id -> "id (name)" (the id if the name isn't available).
+
+    session - shared session of the application, an own one is opened if
+    it's None.
+    """
+    grabber = NameGrabber(limit,
+                          name_cache=name_cache,
+                          rate=rate,
+                          profile_url=profile_url,
+                          progress=False)
+    return await grabber.crawl(list(ids), session)
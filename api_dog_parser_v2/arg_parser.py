@@ -1,9 +1,19 @@
 import argparse
+import datetime
 import logging
 import os
 from typing import Dict, Any
 
-from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.constants_and_enum import (GrabbingFilter,
+                                                  MANIFEST_FILE_NAME)
+from api_dog_parser_v2.parser_classes.json_backends import (
+    BACKEND_NAMES, available_backends)
+from api_dog_parser_v2.parser_classes.metrics import STAGES
+from api_dog_parser_v2.parser_classes.name_cache import default_cache_path
+from api_dog_parser_v2.parser_classes.parse_cache import \
+    default_parse_cache_dir
+from api_dog_parser_v2.parser_classes.watch_state import \
+    default_watch_state_path
 
 
 def arg_parser():
@@ -16,6 +26,51 @@ def arg_parser():
             raise argparse.ArgumentTypeError(arg_error)
         return limit
 
+    def validate_positive(value: str):
+        if not value.isnumeric() or not int(value):
+            raise argparse.ArgumentTypeError(
+                'Incorrect value. Possible value - positive integer')
+        return int(value)
+
+    def validate_non_negative(value: str):
+        if not value.isnumeric():
+            raise argparse.ArgumentTypeError(
+                'Incorrect value. Possible value - non-negative integer')
+        return int(value)
+
+    def validate_positive_float(value: str):
+        try:
+            number = float(value)
+        except ValueError:
+            number = 0.0
+        # Not > 0 for nan too
+        if not 0 < number < float('inf'):
+            raise argparse.ArgumentTypeError(
+                'Incorrect value. Possible value - positive number')
+        return number
+
+    def validate_date(value: str):
+        if value.isnumeric():
+            return int(value)
+        for date_format in ('%Y-%m-%d', '%Y-%m-%d %H:%M'):
+            try:
+                date = datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            return int(date.timestamp())
+        raise argparse.ArgumentTypeError(
+            'Incorrect date. Possible value - YYYY-MM-DD[ HH:MM] (local '
+            'time) or unix time')
+
+    def validate_id_list(value: str):
+        try:
+            return frozenset(
+                int(vk_id) for vk_id in value.split(',') if vk_id.strip())
+        except ValueError as exp:
+            raise argparse.ArgumentTypeError(
+                'Incorrect value. Possible value - comma separated ids'
+            ) from exp
+
     parser = argparse.ArgumentParser('API dog dialog v2 parser')
     parser.add_argument('paths',
                         help='Path(s) for json scanning. '
@@ -29,12 +84,125 @@ def arg_parser():
                         'W/o the flag function is off',
                         action='store_true',
                         default=False)
+    parser.add_argument('--max-depth',
+                        type=validate_non_negative,
+                        help='Max depth of the recursive walking (with -r). '
+                        'Default - unlimited',
+                        default=None)
+    parser.add_argument('--include',
+                        action='append',
+                        metavar='PATTERN',
+                        help='Glob pattern of the JSON files (name or path '
+                        'relative to the root). Can be repeated. '
+                        'Default - *.json',
+                        default=[])
+    parser.add_argument('--exclude',
+                        action='append',
+                        metavar='PATTERN',
+                        help='Glob pattern of the files and folders to skip '
+                        '(name or path relative to the root). Excluded '
+                        'folders are not walked. Can be repeated',
+                        default=[])
+    parser.add_argument('--scan-threads',
+                        type=validate_positive,
+                        help='Count of the threads for the JSON header check'
+                        ' (useful for the network mounted archives). '
+                        'Default value - 16',
+                        default=16)
     parser.add_argument('-l',
                         '--limit',
                         type=validate_limit,
                         help='Download limit. '
                         'Default value - 50',
                         default=50)
+    parser.add_argument('--pool-size',
+                        type=validate_non_negative,
+                        help='Size of the shared HTTP connection pool '
+                        '(keep-alive connections are reused by all downloads).'
+                        ' 0 - unlimited. Default - equal to the limit',
+                        default=None)
+    parser.add_argument('--per-host-limit',
+                        type=validate_non_negative,
+                        help='Max connection count to the single host. '
+                        '0 - unlimited. Default value - 0',
+                        default=0)
+    parser.add_argument('--dns-ttl',
+                        type=validate_non_negative,
+                        help='Seconds to cache resolved DNS. '
+                        '0 - disable the cache. Default value - 300',
+                        default=300)
+    parser.add_argument('--chunk-size',
+                        type=validate_positive,
+                        help='Size of the chunk (KiB) for the streaming write'
+                        ' of the photo into the .part file. '
+                        'Default value - 64',
+                        default=64)
+    parser.add_argument('--memory-budget',
+                        type=validate_non_negative,
+                        help='Max size (MiB) of all download buffers in '
+                        'flight whatever the limit is. 0 - unlimited. '
+                        'Default value - 0',
+                        default=0)
+    parser.add_argument('--adaptive',
+                        help='Adaptive concurrency: the download count per '
+                        'host grows while the responses are fast and drops '
+                        'on 429/5xx and timeouts. --limit is the max',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--retries',
+                        type=validate_non_negative,
+                        help='Count of the retries of a failed download. '
+                        'Default value - 3',
+                        default=3)
+    parser.add_argument('--backoff',
+                        type=validate_positive_float,
+                        help='Delay (seconds) before the first retry, it is '
+                        'doubled for every next one and jittered. '
+                        'Retry-After of the server has priority. '
+                        'Default value - 0.5',
+                        default=0.5)
+    parser.add_argument('--backoff-max',
+                        type=validate_positive_float,
+                        help='Max delay (seconds) between the retries. '
+                        'Default value - 30',
+                        default=30.0)
+    parser.add_argument('--dedup',
+                        nargs='?',
+                        const='url',
+                        choices=('url', 'content'),
+                        default=None,
+                        help='Download the same photo once: paths with the '
+                        'same URL (w/o the CDN shard and the query order) '
+                        'are hardlinked (reflink / copy if it fails). '
+                        'content - also link the downloaded files with the '
+                        'same sha1. Default (w/o the flag) - off')
+    parser.add_argument('--sink',
+                        choices=('dir', 'tar', 'zip'),
+                        default='dir',
+                        help='Output of the photos. dir - a file per photo. '
+                        'tar / zip - photos are appended to the uncompressed '
+                        'archives (not compatible with --defer-names and '
+                        '--dedup). Default value - dir')
+    parser.add_argument('--archive-per',
+                        choices=('dialog', 'owner'),
+                        default='dialog',
+                        help='Archive per dialog folder (members are "owner '
+                        'folder/photo") or per owner folder (with --sink '
+                        'tar / zip). Default value - dialog')
+    parser.add_argument('--timeout',
+                        type=validate_positive,
+                        help='Seconds to wait for the connection or the next '
+                        'data of a photo. Default value - 60',
+                        default=60)
+    parser.add_argument('--verify',
+                        action='store_true',
+                        help='Check the existing photos against the server '
+                        'w/o their download: conditional GET with the '
+                        'validators (ETag / Last-Modified) kept in the '
+                        'manifest (-m), HEAD otherwise. Truncated photos are '
+                        'resumed, changed ones are downloaded again. Only '
+                        'with --sink dir. Interrupted downloads (.part) are '
+                        'resumed by Range requests in any mode')
 
     parser.add_argument(
         '-c',
@@ -49,6 +217,32 @@ def arg_parser():
         '(it is grabbing forwarding photos in fact). '
         'Can be useful if some one forward "leaked" content.'
         '\nall - grab all photos from dialog (groups photo albums excluded).')
+    parser.add_argument('--since',
+                        type=validate_date,
+                        help='Take only the messages sent at or after the '
+                        'date (YYYY-MM-DD[ HH:MM] or unix time). Forwarded '
+                        'photos go with their message. Default - no limit',
+                        default=None)
+    parser.add_argument('--until',
+                        type=validate_date,
+                        help='Take only the messages sent before the date '
+                        '(the same format). Default - no limit',
+                        default=None)
+    parser.add_argument('--date-ordered',
+                        action='store_true',
+                        help='The messages of the dialogs are ordered by '
+                        'date (either way): parsing stops at the first '
+                        'message out of the --since / --until range instead '
+                        'of reading the rest of the file (files are parsed '
+                        'in the streaming mode, --json-backend is ignored)',
+                        default=False)
+    parser.add_argument('--owner-ids',
+                        type=validate_id_list,
+                        metavar='IDS',
+                        help='Take only the photos of the owners (comma '
+                        'separated ids, use --owner-ids=-1,2 for group ids).'
+                        ' Applied along with --collect. Default - all',
+                        default=None)
 
     parser.add_argument('-n',
                         '--dont-get-names',
@@ -59,6 +253,164 @@ def arg_parser():
                         " it's a little bit faster)",
                         action='store_false',
                         default=True)
+    parser.add_argument('--defer-names',
+                        help='Start downloading at once into the id folders'
+                        ' and get names in parallel. Every id folder is '
+                        'renamed to "id (Name)" when its name is got',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--names-limit',
+                        type=validate_positive,
+                        help='Max count of the simultaneous name requests. '
+                        'Default value - 10',
+                        default=10)
+    parser.add_argument('--names-rate',
+                        type=float,
+                        help='Max count of the name requests per second. '
+                        '0 - unlimited. Default value - 10',
+                        default=10.0)
+    parser.add_argument('--name-cache',
+                        help='Path of the persistent name cache. '
+                        f'Default - {default_cache_path()}',
+                        default=None)
+    parser.add_argument('--name-cache-ttl',
+                        type=validate_non_negative,
+                        help='Days to trust cached names. 0 - disable the '
+                        'cache. Default value - 30',
+                        default=30)
+    parser.add_argument('-s',
+                        '--stream',
+                        help='Streaming parse: messages are read from JSON '
+                        'one by one instead of loading the whole file. '
+                        'Memory usage does not depend on the file size '
+                        '(useful for huge dialogs)',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=validate_positive,
+                        help='Count of the processes for JSON parsing. '
+                        'Files from all folders are spread over the '
+                        'process pool. Default value - 1 (w/o pool)',
+                        default=1)
+    parser.add_argument('--json-backend',
+                        choices=('auto', ) + BACKEND_NAMES,
+                        help='Decoder of the whole JSON files (not used by '
+                        'the streaming parse). auto - the fastest installed '
+                        'one (orjson > simdjson > ujson > json). Default '
+                        'value - auto',
+                        default='auto')
+    parser.add_argument('-p',
+                        '--pipeline',
+                        help='Pipeline mode: photos are downloaded while '
+                        'JSON files are still being parsed (streaming '
+                        'parse, --jobs is ignored). Names are got on the fly',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('--queue-size',
+                        type=validate_positive,
+                        help='Size of the parse -> download queue in the '
+                        'pipeline mode. Default value - 1000',
+                        default=1000)
+    parser.add_argument('-m',
+                        '--manifest',
+                        nargs='?',
+                        const='',
+                        default=None,
+                        help='Keep the download state in the SQLite manifest'
+                        ' (url, path, size, status, attempts). Done photos '
+                        'are skipped on the next runs w/o name grabbing and '
+                        'file checks, failed ones are retried. Optional '
+                        f'value - path of the manifest. Default - '
+                        f'{MANIFEST_FILE_NAME} in the common root of paths')
+    parser.add_argument('--parse-cache',
+                        nargs='?',
+                        const='',
+                        default=None,
+                        help='Cache parse results of every JSON file. '
+                        'Unchanged files (same path, size and mtime) are '
+                        'not parsed again. Optional value - cache folder. '
+                        f'Default - {default_parse_cache_dir()}')
+    parser.add_argument('--parse-cache-hash',
+                        help='Also compare the content hash (sha1) of the '
+                        'files with the cached one. Slower but safe with '
+                        'tools that keep mtime',
+                        action='store_true',
+                        default=False)
+    parser.add_argument('-w',
+                        '--watch',
+                        nargs='?',
+                        const=60,
+                        type=validate_positive,
+                        default=None,
+                        help='Watch mode: poll the paths every WATCH seconds '
+                        'and process new / changed exports. Only the '
+                        'messages after the last processed one of the dialog'
+                        ' are parsed and downloaded (--parse-cache is '
+                        'ignored). Default value of the interval - 60')
+    parser.add_argument('--watch-state',
+                        help='Path of the watch mode state (last messages of '
+                        'the dialogs and the seen exports). Default - '
+                        f'{default_watch_state_path()}',
+                        default=None)
+    queue_group = parser.add_mutually_exclusive_group()
+    queue_group.add_argument('--plan',
+                             help='Distributed mode, step 1: parse the '
+                             'paths, get the names and write the photos '
+                             'into the manifest (-m) as the work queue, '
+                             'nothing is downloaded. Failed photos are '
+                             'queued again',
+                             action='store_true',
+                             default=False)
+    queue_group.add_argument('--worker',
+                             help='Distributed mode, step 2: download the '
+                             'photos queued in the manifest (-m) by --plan. '
+                             'Any count of workers of the host can share '
+                             'the manifest, the paths are only used for its '
+                             'default path',
+                             action='store_true',
+                             default=False)
+    parser.add_argument('--batch-size',
+                        type=validate_positive,
+                        help='Photos claimed by the worker at once. '
+                        'Default value - 100',
+                        default=100)
+    parser.add_argument('--lease',
+                        type=validate_positive,
+                        help='Seconds of the worker lease of the claimed '
+                        'photos, it is renewed while the worker is alive. '
+                        'The photos of a crashed worker are claimed by the '
+                        'others when it expires. Default value - 300',
+                        default=300)
+    for export_format, description in (
+            ('jsonl', 'JSON lines (path, url, owner_id, date)'),
+            ('csv', 'CSV (path, url, owner_id, date)'),
+            ('aria2', 'input file of aria2c (aria2c -i PATH)')):
+        parser.add_argument(f'--export-{export_format}',
+                            metavar='PATH',
+                            help='Export mode: write the target path and the '
+                            f'url of every photo into the {description} '
+                            'instead of downloading. - is stdout. Can be '
+                            'combined with the other --export-* options',
+                            default=None)
+    parser.add_argument('--stats-json',
+                        metavar='PATH',
+                        help='Write counters and timing histograms (count, '
+                        'mean, p50/p90/p99) of every stage into the JSON '
+                        'file at exit. Download latency is split into '
+                        'connect / first byte / body',
+                        default=None)
+    parser.add_argument('--profile',
+                        choices=STAGES,
+                        help='Run the stage under cProfile and dump the '
+                        'stats at exit (the workers of --jobs are not '
+                        'profiled)',
+                        default=None)
+    parser.add_argument('--profile-output',
+                        metavar='PATH',
+                        help='Path of the profile dump. Default - '
+                        'api_dog_<stage>.prof in the current dir',
+                        default=None)
     path_group = parser.add_mutually_exclusive_group()
     path_group.description = (
         'json-name - folder with json '
@@ -73,29 +425,32 @@ def arg_parser():
     path_group.add_argument('--json-name', action='store_true')
     path_group.add_argument('--wo-sub-folder', action='store_true')
     path_group.add_argument('--custom-name', help='Name of the future folder')
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.backoff_max < args.backoff:
+        parser.error('--backoff-max must not be less than --backoff')
+    # The choices are all the known backends, not only the installed ones
+    if (args.json_backend != 'auto'
+            and args.json_backend not in available_backends()):
+        parser.error(f'--json-backend {args.json_backend} is not installed. '
+                     f'Installed - {", ".join(available_backends())}')
+    return args
 
 
 def collect_path_list(args_dict: dict):
 
-    paths = set(
-        os.path.abspath(path) for path in args_dict['paths']
-        if os.path.exists(path))
-    if args_dict.pop('recursive'):
-        for path in paths.copy():
-            for root_dir, dirnames, _ in os.walk(path):
-                paths |= {
-                    os.path.join(root_dir, dirname)
-                    for dirname in dirnames
-                }
-        _msg = (f'Script was collected {len(paths)} '
-                f'folders with --recursive flag')
+    paths = sorted(
+        set(
+            os.path.abspath(path) for path in args_dict['paths']
+            if os.path.exists(path)))
+    if not paths:
+        logging.warning('There are no existing paths!')
+        logging.warning('Check an argument with path (first arg).')
+        return []
+    if args_dict['recursive']:
+        _msg = (f'JSON files will be searched recursively in '
+                f'{len(paths)} paths')
         logging.info(_msg)
     else:
-        if not paths:
-            logging.warning('There are no existing paths!')
-            logging.warning('Check an argument with path (first arg).')
-            return []
         _paths = args_dict['paths']
         if len(_paths) == 1:
             abs_path = os.path.abspath(_paths[0])
@@ -107,7 +462,7 @@ def collect_path_list(args_dict: dict):
         else:
             _msg = f'JSON files will be searched in {len(_paths)} paths.'
         logging.info(_msg)
-    return list(paths)
+    return paths
 
 
 def parse_arguments():
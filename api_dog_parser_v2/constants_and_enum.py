@@ -2,7 +2,9 @@ import re
 from enum import Enum
 
 VERIFY_FILE_HEAD = '{"meta":{"v":"2.0"'
+MANIFEST_FILE_NAME = '.api_dog_manifest.sqlite3'
 TITLE_RE = re.compile('<title>(.*?)</title>')
+VK_PROFILE_URL = 'https://m.vk.com/id{vk_id}'
 HEADER = {
     'User-Agent': ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
                    '(KHTML, like Gecko) Chrome/84.0.4147.135 Safari/537.36')
@@ -15,3 +17,16 @@ class GrabbingFilter(Enum):
     PAIR = 'PAIR'
     ALL_EXCEPT_PAIR = 'ALL_EXCEPT_PAIR'
     ALL = 'ALL'
+
+
+class DownloadStatus(Enum):
+    DOWNLOADED = 'DOWNLOADED'
+    SKIPPED = 'SKIPPED'
+    LINKED = 'LINKED'
+    FAILED = 'FAILED'
+
+
+class ManifestStatus(Enum):
+    PENDING = 'PENDING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
@@ -1,47 +1,318 @@
 #!/usr/bin/env python3
 
+import asyncio
 import logging
+import os
 
+from api_dog_parser_v2.api import (download, iter_parser_managers,
+                                   iter_photo_records)
 from api_dog_parser_v2.arg_parser import parse_arguments
-from api_dog_parser_v2.constants_and_enum import (GrabbingFilter)
-from api_dog_parser_v2.parser_classes.download_manager import DownloadManager
+from api_dog_parser_v2.constants_and_enum import (GrabbingFilter,
+                                                  MANIFEST_FILE_NAME)
+from api_dog_parser_v2.parser_classes.dedup import PhotoDedup
+from api_dog_parser_v2.parser_classes.download_manager import (
+    DownloadManager, DownloadResult)
+from api_dog_parser_v2.parser_classes.flow_control import RetryPolicy
+from api_dog_parser_v2.parser_classes.http_session import PoolSettings
+from api_dog_parser_v2.parser_classes.manifest import DownloadManifest
+from api_dog_parser_v2.parser_classes.message_filter import MessageFilter
+from api_dog_parser_v2.parser_classes.metrics import metrics
+from api_dog_parser_v2.parser_classes.name_cache import NameCache
+from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+from api_dog_parser_v2.parser_classes.output_sink import (ArchiveSink,
+                                                          create_sink)
+from api_dog_parser_v2.parser_classes.parse_cache import ParseCache
 from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+from api_dog_parser_v2.parser_classes.record_export import (EXPORT_FORMATS,
+                                                            RecordExporter)
+from api_dog_parser_v2.parser_classes.watch_state import WatchState
 
 
-def _main_parse(*, parse_folders, download_limiter, get_names,
-                is_folder_name_as_json, folder_name, grabbing_filter):
+async def _main_parse(*, parse_folders, manifest_path, watch_options,
+                      queue_options, export_targets, **kwargs):
     if not parse_folders:
         logging.warning('Empty list with folder gotted!')
         logging.info('Exiting...')
         return
-    download_manager = DownloadManager(download_limiter, get_names,
-                                       is_folder_name_as_json, folder_name)
-    parsers = [ParserManager(folder) for folder in parse_folders]
+    if export_targets and queue_options['mode']:
+        _msg = f'--{queue_options["mode"]} is ignored in the export mode'
+        logging.warning(_msg)
+        queue_options = {**queue_options, 'mode': None}
+    if ((queue_options['mode'] or export_targets)
+            and watch_options['interval'] is not None):
+        logging.warning('--watch is ignored in the distributed and the '
+                        'export modes')
+        watch_options = {**watch_options, 'interval': None}
+    kwargs['queue_options'] = queue_options
+    kwargs['export_targets'] = export_targets
+    manifest = None
+    if manifest_path is not None:
+        manifest = DownloadManifest(manifest_path or os.path.join(
+            os.path.commonpath(parse_folders), MANIFEST_FILE_NAME))
+    try:
+        if watch_options['interval'] is None:
+            await _run(parse_folders=parse_folders,
+                       manifest=manifest,
+                       **kwargs)
+        else:
+            await _watch(parse_folders=parse_folders,
+                         manifest=manifest,
+                         **watch_options,
+                         **kwargs)
+    finally:
+        if manifest:
+            manifest.close()
+
+
+async def _watch(*, interval, state_path, parse_cache_options, **kwargs):
+    watch_state = WatchState(state_path)
+    if parse_cache_options['cache_dir'] is not None:
+        logging.warning('--parse-cache is ignored in the watch mode')
+        parse_cache_options = {**parse_cache_options, 'cache_dir': None}
+    _msg = f'Watch mode: the paths are polled every {interval} s'
+    logging.info(_msg)
+    while True:
+        try:
+            result = await _run(watch_state=watch_state,
+                                parse_cache_options=parse_cache_options,
+                                **kwargs)
+        except (OSError, ValueError) as exp:
+            # An export that is still being written, for example
+            _msg = f'Poll failed, it will be repeated - {exp}'
+            logging.warning(_msg)
+            watch_state.rollback()
+        else:
+            if result.stopped:
+                watch_state.rollback()
+                return
+            if result.failed:
+                logging.warning('New messages of the poll will be processed '
+                                'again - some photos were not downloaded')
+                watch_state.rollback()
+            elif watch_state.has_changes:
+                watch_state.commit()
+        await asyncio.sleep(interval)
+
+
+async def _run(*, parse_folders, download_limiter, get_names,
+               is_folder_name_as_json, folder_name, grabbing_filter,
+               streaming, jobs, pool_settings, pipeline, queue_size,
+               chunk_size, memory_budget, manifest, name_grabber_options,
+               defer_names, parse_cache_options, discovery_options,
+               retry_policy, adaptive, timeout, dedup, verify, sink_options,
+               message_filter, json_backend, queue_options, export_targets,
+               watch_state=None) -> DownloadResult:
+    parse_cache = None
+    if parse_cache_options['cache_dir'] is not None:
+        parse_cache = ParseCache(parse_cache_options['cache_dir'],
+                                 use_hash=parse_cache_options['use_hash'])
+    name_cache = None
+    if name_grabber_options['cache_ttl']:
+        name_cache = NameCache(name_grabber_options['cache_path'],
+                               ttl=name_grabber_options['cache_ttl'])
+    name_grabber = NameGrabber(name_grabber_options['limit'],
+                               pool_settings,
+                               name_cache=name_cache,
+                               rate=name_grabber_options['rate'])
+    queue_mode = queue_options['mode']
+    if queue_mode and sink_options['kind'] != 'dir':
+        # Archives have a single writer
+        logging.warning('--sink is ignored in the distributed mode')
+        sink_options = {**sink_options, 'kind': 'dir'}
+    if queue_mode and verify:
+        logging.warning('--verify is ignored in the distributed mode')
+        verify = False
+    if queue_mode == 'plan' and pipeline:
+        logging.warning('--pipeline is ignored by --plan')
+        pipeline = False
+    sink = create_sink(sink_options['kind'],
+                       per_owner=sink_options['per'] == 'owner')
+    if isinstance(sink, ArchiveSink):
+        if defer_names:
+            logging.warning('--defer-names is ignored with the archive sink')
+            defer_names = False
+        if dedup:
+            logging.warning('--dedup is ignored with the archive sink')
+            dedup = None
+        if verify:
+            logging.warning('--verify is ignored with the archive sink')
+            verify = False
+    photo_dedup = (PhotoDedup(by_content=dedup == 'content')
+                   if dedup else None)
+    download_manager = DownloadManager(download_limiter,
+                                       get_names,
+                                       is_folder_name_as_json,
+                                       folder_name,
+                                       pool_settings=pool_settings,
+                                       chunk_size=chunk_size,
+                                       memory_budget=memory_budget,
+                                       manifest=manifest,
+                                       name_grabber=name_grabber,
+                                       defer_names=defer_names,
+                                       retry_policy=retry_policy,
+                                       adaptive=adaptive,
+                                       timeout=timeout,
+                                       dedup=photo_dedup,
+                                       sink=sink,
+                                       verify=verify)
+    if queue_mode == 'worker':
+        print('\n')
+        return await download_manager.download_queue(
+            queue_options['batch_size'], queue_options['lease'])
+    if pipeline or export_targets:
+        records = iter_photo_records(parse_folders,
+                                     grabbing_filter,
+                                     message_filter=message_filter,
+                                     parse_cache=parse_cache,
+                                     watch_state=watch_state,
+                                     queue_size=queue_size,
+                                     **discovery_options)
+        if export_targets:
+            with RecordExporter(export_targets) as exporter:
+                await download_manager.export_records(records, exporter)
+            _msg = (f'{exporter.count} photos are exported into '
+                    f'{", ".join(export_targets.values())}')
+            logging.info(_msg)
+            return DownloadResult()
+        print('\n')
+        result = await download(records, download_manager, queue_size)
+        if parse_cache:
+            parse_cache.log_stats()
+        return result
+    parsers = iter_parser_managers(parse_folders,
+                                   watch_state=watch_state,
+                                   **discovery_options)
+    marks = watch_state.marks if watch_state else None
+    if jobs > 1:
+        parsers = ParserManager.parse_files_parallel(
+            parsers,
+            grabbing_filter,
+            jobs,
+            streaming=streaming,
+            parse_cache=parse_cache,
+            marks=marks,
+            message_filter=message_filter,
+            json_backend=json_backend)
+    if watch_state:
+        parsers = watch_state.track(parsers)
     for parser in parsers:
-        parser.parse_files(grabbing_filter)
+        if jobs == 1:
+            parser.parse_files(grabbing_filter,
+                               streaming=streaming,
+                               parse_cache=parse_cache,
+                               marks=marks,
+                               message_filter=message_filter,
+                               json_backend=json_backend)
         if not parser.has_content:
             continue
         download_manager.add_dict(parser.data_dict)
         download_manager.add_id_to_collection(parser.id_collection)
-    download_manager.download_photos()
+    if parse_cache:
+        parse_cache.log_stats()
+    if watch_state and not watch_state.has_changes:
+        # Quiet idle poll
+        return DownloadResult()
+    if queue_mode == 'plan':
+        await download_manager.plan()
+        return DownloadResult()
+    print('\n')
+    return await download_manager.download_all()
 
 
 def main():
     logging.basicConfig(level=logging.INFO)
     args = parse_arguments()
+    manifest_path = args['manifest']
+    if manifest_path is None and (args['plan'] or args['worker']):
+        # The manifest is the work queue of the distributed mode
+        manifest_path = ''
+    # Parsing stops at the first message out of the ordered date window
+    # only in the streaming mode, the others filter the whole file
+    date_window = args['since'] is not None or args['until'] is not None
+    streaming = args['stream'] or (args['date_ordered'] and date_window)
+    if streaming and not args['stream'] and args['json_backend'] != 'auto':
+        logging.warning('--json-backend is ignored with --date-ordered')
     kwargs = {
         'parse_folders': args['paths'],
         'download_limiter': args['limit'],
         'get_names': args['dont_get_names'],
         'grabbing_filter': GrabbingFilter(args['collect']),
+        'message_filter': MessageFilter(since=args['since'],
+                                        until=args['until'],
+                                        owner_ids=args['owner_ids'],
+                                        date_ordered=args['date_ordered']),
         'is_folder_name_as_json': args['json_name'],
-        'folder_name': args['custom_name']
+        'folder_name': args['custom_name'],
+        'streaming': streaming,
+        'jobs': args['jobs'],
+        'json_backend': args['json_backend'],
+        'pipeline': args['pipeline'],
+        'queue_size': args['queue_size'],
+        'chunk_size': args['chunk_size'] * 1024,
+        'memory_budget': args['memory_budget'] * 2**20,
+        'manifest_path': manifest_path,
+        'defer_names': args['defer_names'],
+        'retry_policy': RetryPolicy(retries=args['retries'],
+                                    base_delay=args['backoff'],
+                                    max_delay=args['backoff_max']),
+        'adaptive': args['adaptive'],
+        'timeout': args['timeout'],
+        'dedup': args['dedup'],
+        'verify': args['verify'],
+        'export_targets': {
+            export_format: args[f'export_{export_format}']
+            for export_format in EXPORT_FORMATS
+            if args[f'export_{export_format}'] is not None
+        },
+        'queue_options': {
+            'mode': ('plan' if args['plan'] else
+                     'worker' if args['worker'] else None),
+            'batch_size': args['batch_size'],
+            'lease': args['lease'],
+        },
+        'watch_options': {
+            'interval': args['watch'],
+            'state_path': args['watch_state'],
+        },
+        'sink_options': {
+            'kind': args['sink'],
+            'per': args['archive_per'],
+        },
+        'discovery_options': {
+            'max_depth': args['max_depth'] if args['recursive'] else 0,
+            'include': args['include'],
+            'exclude': args['exclude'],
+            'scan_threads': args['scan_threads'],
+        },
+        'parse_cache_options': {
+            'cache_dir': args['parse_cache'],
+            'use_hash': args['parse_cache_hash'],
+        },
+        'name_grabber_options': {
+            'limit': args['names_limit'],
+            'rate': args['names_rate'],
+            'cache_path': args['name_cache'],
+            'cache_ttl': args['name_cache_ttl'] * 24 * 3600,
+        },
+        'pool_settings': PoolSettings(
+            pool_size=(args['limit'] if args['pool_size'] is None else
+                       args['pool_size']),
+            per_host_limit=args['per_host_limit'],
+            dns_ttl=args['dns_ttl']),
     }
+    metrics.set_profile(args['profile'])
     try:
-        _main_parse(**kwargs)
+        # The only loop of the run, the rest is the async API
+        asyncio.get_event_loop().run_until_complete(_main_parse(**kwargs))
     except KeyboardInterrupt:
         print('\n')
         logging.info('Work cancelled...')
+    finally:
+        if args['stats_json']:
+            metrics.write_json(args['stats_json'])
+        if args['profile']:
+            metrics.dump_profile(args['profile_output']
+                                 or f'api_dog_{args["profile"]}.prof')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+from collections import deque
+from typing import AsyncIterator, Iterable, TypeVar
+
+T = TypeVar('T')
+
+
+class _End:
+    __slots__ = ('exception', )
+
+    def __init__(self, exception=None):
+        self.exception = exception
+
+
+async def iterate_in_thread(iterable: Iterable[T],
+                            queue_size: int = 1000) -> AsyncIterator[T]:
+    """Consume the blocking iterable in a thread, the loop is free meanwhile.
+
+    Not more than queue_size items are buffered ahead of the consumer, the
+    producer waits for the place. The items are handed over by the deque
+    with one wake up of the loop per batch (not per item). The producer
+    stops at the next item when the generator is closed.
+    A daemon thread instead of the default executor: the blocked producer
+    must not keep the interpreter alive after Ctrl-C.
+    """
+    loop = asyncio.get_event_loop()
+    buffer = deque()
+    space = threading.Semaphore(queue_size)
+    ready = asyncio.Event()
+    closed = threading.Event()
+    wake_pending = False
+
+    def _wake():
+        nonlocal wake_pending
+        wake_pending = False
+        ready.set()
+
+    def _push(item) -> bool:
+        nonlocal wake_pending
+        # A semaphore slot, released by the consumer
+        while not space.acquire(  # pylint: disable=consider-using-with
+                timeout=0.1):
+            if closed.is_set():
+                return False
+        if closed.is_set():
+            return False
+        buffer.append(item)
+        if not wake_pending:
+            wake_pending = True
+            try:
+                loop.call_soon_threadsafe(_wake)
+            except RuntimeError:
+                # The loop is closed
+                return False
+        return True
+
+    def _target():
+        try:
+            for item in iterable:
+                if not _push(item):
+                    return
+        except BaseException as exp:  # pylint: disable=broad-except
+            _push(_End(exp))
+        else:
+            _push(_End())
+
+    threading.Thread(target=_target, daemon=True).start()
+    try:
+        while True:
+            for _ in range(queue_size):
+                if not buffer:
+                    break
+                item = buffer.popleft()
+                space.release()
+                if isinstance(item, _End):
+                    if item.exception is not None:
+                        raise item.exception
+                    return
+                yield item
+            if buffer:
+                # A fast producer - let the other tasks run between batches
+                await asyncio.sleep(0)
+                continue
+            ready.clear()
+            if not buffer:
+                await ready.wait()
+    finally:
+        closed.set()
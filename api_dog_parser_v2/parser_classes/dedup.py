@@ -0,0 +1,142 @@
+import asyncio
+import errno
+import logging
+import os
+import re
+import shutil
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# The same photo is served by the numbered shards of the CDN
+_SHARD_HOST_RE = re.compile(r'^sun\d+-\d+\.(userapi\.com)$')
+# linux/fs.h
+_FICLONE = 0x40049409
+
+
+def normalize_url(url: str) -> str:
+    """Key of the photo: the fragment, the shard and the order of the query
+    parameters don't matter."""
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    host = _SHARD_HOST_RE.sub(r'\1', host)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), host, parts.path, query, ''))
+
+
+def _reflink(source, target):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'Reflink is not supported')
+    with open(source, 'rb') as source_fp, open(target, 'wb') as target_fp:
+        fcntl.ioctl(target_fp.fileno(), _FICLONE, source_fp.fileno())
+
+
+def link_or_copy(source, target) -> str:
+    """Create target as a hardlink / reflink / copy of the source.
+
+    The link is made under a temporary name and renamed, so the target is
+    a whole file or nothing. Returns the method that worked.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Not the .part of the sink - a download of the target may be resumed
+    tmp_name = f'{target}.link.tmp'
+    for method, function in (('hardlink', os.link), ('reflink', _reflink),
+                             ('copy', shutil.copyfile)):
+        try:
+            if os.path.lexists(tmp_name):
+                os.remove(tmp_name)
+            function(source, tmp_name)
+        except OSError:
+            if method == 'copy':
+                raise
+            continue
+        os.replace(tmp_name, target)
+        return method
+
+
+class PhotoDedup:
+    """Download every unique photo once, link the other paths to it.
+
+    Photos are grouped by the normalized URL. The first path of the URL is
+    downloaded, the others wait for it and are linked. With by_content the
+    downloaded files are also grouped by the content hash - the same image
+    under different URLs costs the traffic but not the disk.
+    """
+    def __init__(self, by_content: bool = False):
+        self.by_content = by_content
+        self._sources: Dict[str, 'asyncio.Future[Optional[str]]'] = {}
+        self._contents: Dict[str, str] = {}
+        # Folders merged by --defer-names: old -> new
+        self._moved_folders: Dict[str, str] = {}
+        self.linked_count = 0
+        self.saved_traffic = 0
+        self.saved_disk = 0
+
+    def claim(self, url) -> Tuple[bool, 'asyncio.Future[Optional[str]]']:
+        """(True, future) - the caller downloads the url and resolves the
+        future with the path (None - failed). (False, future) - somebody
+        else does it, await the future."""
+        key = normalize_url(url)
+        future = self._sources.get(key)
+        if future is not None and not (future.done()
+                                       and future.result() is None):
+            return False, future
+        future = asyncio.get_event_loop().create_future()
+        self._sources[key] = future
+        return True, future
+
+    def add_existing(self, url, path):
+        """Photo is already on the disk - the duplicates are linked to it."""
+        key = normalize_url(url)
+        if key not in self._sources:
+            future = asyncio.get_event_loop().create_future()
+            future.set_result(path)
+            self._sources[key] = future
+
+    def link(self, source, target, downloaded: bool = False) -> bool:
+        """downloaded - the target was fetched anyway (content dedup)."""
+        source = self._current_path(source)
+        try:
+            size = os.path.getsize(source)
+            method = link_or_copy(source, target)
+        except OSError as exp:
+            _msg = f'{target} was not linked to {source} - {exp}'
+            logging.debug(_msg)
+            return False
+        self.linked_count += 1
+        if not downloaded:
+            self.saved_traffic += size
+        if method != 'copy':
+            self.saved_disk += size
+        return True
+
+    def add_content(self, digest: str, path) -> bool:
+        """True - the same image was downloaded before, path is linked."""
+        source = self._contents.setdefault(digest, path)
+        if source == path or not os.path.isfile(source):
+            self._contents[digest] = path
+            return False
+        return self.link(source, path, downloaded=True)
+
+    def move_folder(self, source, target):
+        """Files of the source folder were moved into the target one."""
+        self._moved_folders[source] = target
+
+    def _current_path(self, path):
+        folder, name = os.path.split(path)
+        target = self._moved_folders.get(folder)
+        if target is None or os.path.exists(path):
+            return path
+        return os.path.join(target, name)
+
+    def log_stats(self):
+        if not self.linked_count:
+            return
+        _msg = (f'Dedup: {self.linked_count} duplicate photos were linked, '
+                f'{self.saved_traffic / 2**20:.1f} MiB of traffic and '
+                f'{self.saved_disk / 2**20:.1f} MiB of disk saved')
+        logging.info(_msg)
@@ -0,0 +1,152 @@
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import fnmatch
+from typing import (Deque, Iterable, Iterator, List, Optional, Pattern, Set,
+                    Tuple)
+
+from api_dog_parser_v2.constants_and_enum import VERIFY_FILE_HEAD
+from api_dog_parser_v2.parser_classes.metrics import metrics
+
+DEFAULT_INCLUDE = ('*.json', )
+_FILE_HEAD = VERIFY_FILE_HEAD.encode()
+_BOM = b'\xef\xbb\xbf'
+
+
+def verify_file(file) -> Optional[str]:
+    """Return the file if it's the ApiDog v2 export."""
+    try:
+        with metrics.timer('discovery.verify'):
+            with open(file, 'rb') as fp:
+                file_head = fp.read(len(_BOM) + len(_FILE_HEAD))
+    except OSError:
+        return None
+    if file_head.startswith(_BOM):
+        file_head = file_head[len(_BOM):]
+    return file if file_head.startswith(_FILE_HEAD) else None
+
+
+class FileDiscovery:
+    """Single pass scandir walk with the header check in a thread pool.
+
+    Folders are yielded with their verified JSON files in the walk order
+    while the walk goes on, so the parsing can start before it's finished.
+    Patterns are matched with the entry name and with its path relative to
+    the root. Excluded folders are not walked into.
+    """
+    def __init__(self,
+                 paths: Iterable[str],
+                 max_depth: Optional[int] = 0,
+                 include: Iterable[str] = DEFAULT_INCLUDE,
+                 exclude: Iterable[str] = (),
+                 workers: int = 16):
+        self._paths = list(paths)
+        self._max_depth = max_depth
+        self._include = self._compile(include or DEFAULT_INCLUDE)
+        self._exclude = self._compile(exclude)
+        self._workers = workers
+        # Max count of the files waiting for the check
+        self._window = workers * 8
+        self.folder_count = 0
+        self.file_count = 0
+        self.rejected_count = 0
+
+    @staticmethod
+    def _compile(patterns: Iterable[str]) -> Optional[Pattern]:
+        patterns = list(patterns)
+        if not patterns:
+            return None
+        return re.compile('|'.join(
+            f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+    @staticmethod
+    def _match(pattern: Optional[Pattern], name, rel_path) -> bool:
+        return bool(pattern and (pattern.match(name)
+                                 or pattern.match(rel_path)))
+
+    def _scan(self, folder, rel_prefix) -> Tuple[List[str], List[str]]:
+        """(files, sub folders) of the folder."""
+        with os.scandir(folder) as scan:
+            entries = sorted(scan, key=lambda entry: entry.name)
+        files = []
+        sub_folders = []
+        for entry in entries:
+            rel_path = rel_prefix + entry.name
+            if self._match(self._exclude, entry.name, rel_path):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    sub_folders.append(entry.path)
+                elif (entry.is_file() and self._match(
+                        self._include, entry.name, rel_path)):
+                    files.append(entry.path)
+            except OSError:
+                continue
+        return files, sub_folders
+
+    def _walk(self) -> Iterator[Tuple[str, List[str], bool]]:
+        visited: Set[str] = set()
+        for root in self._paths:
+            stack = [(root, 0)]
+            while stack:
+                folder, depth = stack.pop()
+                # Nested roots; symlinked folders are not followed
+                if folder in visited:
+                    continue
+                visited.add(folder)
+                rel_folder = os.path.relpath(folder, root).replace(os.sep, '/')
+                rel_prefix = '' if rel_folder == '.' else f'{rel_folder}/'
+                try:
+                    files, sub_folders = self._scan(folder, rel_prefix)
+                except OSError as exp:
+                    _msg = f'Folder {folder} was skipped - {exp}'
+                    logging.warning(_msg)
+                    continue
+                if self._max_depth is None or depth < self._max_depth:
+                    stack.extend((sub_folder, depth + 1)
+                                 for sub_folder in reversed(sub_folders))
+                if files or not depth:
+                    yield folder, files, not depth
+
+    def _resolve(self, futures: List['Future[Optional[str]]']) -> List[str]:
+        files = [future.result() for future in futures]
+        verified = [file for file in files if file]
+        self.rejected_count += len(files) - len(verified)
+        self.file_count += len(verified)
+        self.folder_count += bool(verified)
+        return verified
+
+    def iter_folders(self) -> Iterator[Tuple[str, List[str]]]:
+        """Yield (folder, verified files).
+
+        Roots are yielded even w/o files, sub folders only with them.
+        """
+        pending: Deque[Tuple[str, bool, List[Future]]] = deque()
+        in_flight = 0
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            for folder, files, is_root in self._walk():
+                pending.append((folder, is_root, [
+                    executor.submit(verify_file, file) for file in files
+                ]))
+                in_flight += len(files)
+                while pending and (in_flight > self._window or all(
+                        future.done() for future in pending[0][2])):
+                    folder, is_root, futures = pending.popleft()
+                    in_flight -= len(futures)
+                    files = self._resolve(futures)
+                    if files or is_root:
+                        yield folder, files
+            while pending:
+                folder, is_root, futures = pending.popleft()
+                files = self._resolve(futures)
+                if files or is_root:
+                    yield folder, files
+        _msg = (f'Discovery: {self.file_count} json files in '
+                f'{self.folder_count} folders, {self.rejected_count} '
+                f'rejected')
+        logging.info(_msg)
+        metrics.count('discovery.files', self.file_count)
+        metrics.count('discovery.folders', self.folder_count)
+        metrics.count('discovery.rejected', self.rejected_count)
@@ -0,0 +1,70 @@
+from collections import deque
+from typing import AsyncIterable
+
+from tqdm import tqdm
+
+from api_dog_parser_v2.parser_classes.http_session import create_session
+from api_dog_parser_v2.parser_classes.photo_store import PhotoRecord
+from api_dog_parser_v2.parser_classes.record_export import RecordExporter
+
+
+class ExportMixin:
+    """Export mode of DownloadManager: the records are written w/o
+    downloading."""
+
+    async def export_records(self,
+                             records: AsyncIterable[PhotoRecord],
+                             exporter: RecordExporter,
+                             window: int = 10000) -> int:
+        """Write the target path (the folder naming of the download) and
+        the url of every record w/o downloading. Returns the count.
+
+        Names are got concurrently for up to window records ahead of the
+        written one, the order of the records is kept.
+        """
+        tqdm_ = tqdm(desc='Exported',
+                     unit=' photo',
+                     position=0,
+                     disable=not self._progress)
+        self._name_tqdm = (tqdm(desc='Names',
+                                unit=' id',
+                                position=1,
+                                disable=not self._progress)
+                           if self._get_name else None)
+        ahead = deque()
+
+        def _write(record_, name=None):
+            exporter.write(*self._make_download_tuple(record_, name),
+                           record_)
+            tqdm_.update()
+
+        async with create_session(self._pool_settings,
+                                  self._headers) as session:
+            self._session = session
+            try:
+                async for record in records:
+                    future = self._request_name(record.owner_id)
+                    if future is None and not ahead:
+                        _write(record)
+                        continue
+                    ahead.append((record, future))
+                    # The first one is written when its name is got, or
+                    # waited for when the window is full
+                    while ahead and (len(ahead) >= window
+                                     or ahead[0][1] is None
+                                     or ahead[0][1].done()):
+                        record, future = ahead.popleft()
+                        # The name of the done future - the path mustn't
+                        # depend on when the collection is filled
+                        _write(record,
+                                None if future is None else await future)
+                for record, future in ahead:
+                    _write(record, None if future is None else await future)
+                await self._finish_names()
+            finally:
+                self._session = None
+                self._name_grabber.save_cache()
+        for tqdm_bar in (tqdm_, self._name_tqdm):
+            if tqdm_bar is not None:
+                tqdm_bar.close()
+        return exporter.count
@@ -1,68 +1,243 @@
 import asyncio
 import datetime
+import hashlib
 import logging
 import os
 import time
-from typing import Optional, Dict, Union
+from array import array
+from typing import AsyncIterable, Dict, List, Optional, Set, Tuple
 
 import aiofiles
 import aiohttp
 from tqdm import tqdm
 
-from api_dog_parser_v2.constants_and_enum import HEADER
+from api_dog_parser_v2.constants_and_enum import (HEADER, DownloadStatus,
+                                                  ManifestStatus)
+from api_dog_parser_v2.parser_classes.dedup import PhotoDedup
+from api_dog_parser_v2.parser_classes.download_export import ExportMixin
+from api_dog_parser_v2.parser_classes.download_queue import QueueMixin
+from api_dog_parser_v2.parser_classes.download_scheduler import (
+    ByteBudget, DownloadResult, DownloadScheduler)
+from api_dog_parser_v2.parser_classes.download_verify import VerifyMixin
+from api_dog_parser_v2.parser_classes.http_session import (PoolSettings,
+                                                           create_session)
+from api_dog_parser_v2.parser_classes.flow_control import (
+    THROTTLE_STATUSES, HostLimiters, RetryPolicy, parse_retry_after)
+from api_dog_parser_v2.parser_classes.folder_namer import \
+    DeferredFolderNamer
+from api_dog_parser_v2.parser_classes.http_validators import (
+    IDENTITY, RANGE_NOT_SATISFIABLE, Validators, parse_content_range)
+from api_dog_parser_v2.parser_classes.manifest import DownloadManifest
+from api_dog_parser_v2.parser_classes.metrics import metrics
 from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+from api_dog_parser_v2.parser_classes.output_sink import DirectorySink
+from api_dog_parser_v2.parser_classes.photo_store import (PhotoRecord,
+                                                          PhotoStore)
 
+# Queued photo key - dialog segment index in the high bits, row in the low
+_ROW_BITS = 32
+_ROW_MASK = (1 << _ROW_BITS) - 1
 
-class DownloadManager:
+
+class DownloadManager(VerifyMixin, ExportMixin, QueueMixin):
+    """Downloader of the photo records.
+
+    The coroutines run in the caller's loop, so several managers (one per
+    job) can work in one loop. progress - tqdm bars, handle_sigint - the
+    first Ctrl-C stops feeding the workers (see DownloadScheduler),
+    verify - existing photos are checked against the server (conditional
+    GET / HEAD), truncated and changed ones are downloaded again.
+    """
     def __init__(self,
                  download_limiter,
                  get_name: bool,
                  is_folder_name_as_json: bool,
-                 folder_name: Optional[str] = None):
+                 folder_name: Optional[str] = None,
+                 pool_settings: Optional[PoolSettings] = None,
+                 chunk_size: int = 64 * 1024,
+                 memory_budget: int = 0,
+                 manifest: Optional[DownloadManifest] = None,
+                 name_grabber: Optional[NameGrabber] = None,
+                 defer_names: bool = False,
+                 retry_policy: Optional[RetryPolicy] = None,
+                 adaptive: bool = False,
+                 timeout: float = 60,
+                 dedup: Optional[PhotoDedup] = None,
+                 sink: Optional[DirectorySink] = None,
+                 progress: bool = True,
+                 handle_sigint: bool = True,
+                 verify: bool = False):
+        super().__init__()
         self._get_name = get_name
-        self._download_semaphore = asyncio.Semaphore(download_limiter)
-        self._download_raw_tuple = []
-        self._download_tuple_list = []
+        self._segments: List[Tuple[str, str, PhotoStore]] = []
+        self._queued = array('Q')
         self._is_folder_name_as_json = is_folder_name_as_json
         self._folder_name = folder_name
         self._id_collection = set()
         self._id_name_collection = {}
-        self._name_grabber = NameGrabber(10)
+        self._pool_settings = pool_settings or PoolSettings(
+            pool_size=download_limiter)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._name_grabber = name_grabber or NameGrabber(
+            10, self._pool_settings, progress=progress)
+        self._download_limiter = download_limiter
+        self._name_futures: Dict[int, asyncio.Future] = {}
+        self._download_tqdm: Optional[tqdm] = None
+        self._name_tqdm: Optional[tqdm] = None
+        self._chunk_size = chunk_size
+        self._byte_budget = ByteBudget(memory_budget)
+        self._manifest = manifest
+        self._done_keys: Set[Tuple[str, str]] = set()
+        self._folder_namer = (DeferredFolderNamer(self._move_folder)
+                              if defer_names and get_name else None)
+        self._retry_policy = retry_policy or RetryPolicy()
+        # --limit is the ceiling, the per host limits start lower
+        self._host_limiters = (HostLimiters(max(1, download_limiter // 4),
+                                            download_limiter)
+                               if adaptive else None)
+        self._dedup = dedup
+        self._sink = sink or DirectorySink()
+        self._progress = progress
+        self._handle_sigint = handle_sigint
+        self._scheduler: Optional[DownloadScheduler] = None
+        self._verify = verify
+        self._resumed_count = 0
+        self._resumed_bytes = 0
+        # Path building caches - photos of a message share the date, the
+        # dialog folder depends only on (root_path, json_name)
+        self._dialog_folders: Dict[Tuple[str, str], str] = {}
+        self._last_date: Tuple[int, str] = (-1, '')
+        self._timeout = aiohttp.ClientTimeout(total=None,
+                                              sock_connect=timeout,
+                                              sock_read=timeout)
 
     @staticmethod
     def _convert_timestamp_to_str(timestamp):
         return datetime.datetime.fromtimestamp(timestamp).strftime(
             '%Y%m%d_%H%M%S')
 
-    def _add_download_tuple(self, root_path, json_name,
-                            photo_dict: Dict[str, Union[int, str]]):
-        if not self._is_folder_name_as_json:
-            json_name = self._folder_name or ''
-        owner_id = photo_dict['owner_id']
-        owner_folder = self._id_name_collection.get(owner_id, str(owner_id))
-        str_date = self._convert_timestamp_to_str(photo_dict['date'])
-        url = photo_dict['photo_url']
-        file_name = f'{str_date}_{url.split("/")[-1]}'
-        photo_path = os.path.join(root_path, json_name, owner_folder,
-                                  file_name)
-        self._download_tuple_list.append((photo_path, url))
-
-    def _grab_names(self):
-        if self._get_name:
-            self._id_name_collection = self._name_grabber.bulk_crawl(
-                list(self._id_collection))
-
-    def add_dict(self, file_dict):
+    def _dialog_folder(self, root_path, json_name):
+        key = (root_path, json_name)
+        dialog_folder = self._dialog_folders.get(key)
+        if dialog_folder is None:
+            if not self._is_folder_name_as_json:
+                json_name = self._folder_name or ''
+            dialog_folder = self._dialog_folders[key] = os.path.join(
+                root_path, json_name)
+        return dialog_folder
+
+    def _make_file_name(self, record: PhotoRecord) -> Tuple[str, str]:
+        timestamp, str_date = self._last_date
+        if timestamp != record.date:
+            str_date = self._convert_timestamp_to_str(record.date)
+            self._last_date = (record.date, str_date)
+        url = record.photo_url
+        return f'{str_date}_{url.split("/")[-1]}', url
+
+    def _make_download_tuple(
+            self,
+            record: PhotoRecord,
+            owner_folder: Optional[str] = None) -> Tuple[str, str]:
+        """owner_folder - the resolved name, from the collection if None."""
+        if owner_folder is None:
+            owner_id = record.owner_id
+            owner_folder = self._id_name_collection.get(
+                owner_id, str(owner_id))
+        file_name, url = self._make_file_name(record)
+        photo_path = os.path.join(
+            self._dialog_folder(record.root_path, record.json_name),
+            owner_folder, file_name)
+        return photo_path, url
+
+    def _record(self, key: int) -> PhotoRecord:
+        root_path, json_name, photos = self._segments[key >> _ROW_BITS]
+        return PhotoRecord(root_path, json_name, *photos[key & _ROW_MASK])
+
+    def _owner_id(self, key: int) -> int:
+        return self._segments[key >> _ROW_BITS][2].owner_id(key & _ROW_MASK)
+
+    async def _grab_names(self):
+        if not self._get_name:
+            return
+        id_collection = self._id_collection
+        if self._manifest:
+            # Names only for the photos that are not done yet
+            id_collection = id_collection & {
+                self._owner_id(key)
+                for key in self._queued
+            }
+        with metrics.stage('names'):
+            self._id_name_collection = await self._name_grabber.crawl(
+                list(id_collection), self._session)
+
+    def add_dict(self, file_dict: Dict[str, Dict[str, PhotoStore]]):
+        # The stores are referenced, not copied
         root_path = file_dict['path']
         url_data = file_dict['url_data']
-        for json_name, data in url_data.items():
-            for photo_dict in data:
-                self._download_raw_tuple.append(
-                    (root_path, json_name, photo_dict))
+        for json_name, photos in url_data.items():
+            if photos:
+                self._segments.append((root_path, json_name, photos))
+
+    @property
+    def _photo_count(self):
+        return sum(len(photos) for _, _, photos in self._segments)
+
+    def _is_done_in_manifest(self, record: PhotoRecord):
+        return ((self._dialog_folder(record.root_path, record.json_name),
+                 record.photo_url) in self._done_keys)
+
+    def _load_manifest(self):
+        if not self._manifest:
+            return
+        self._manifest.log_summary()
+        if not self._verify:
+            self._done_keys = self._manifest.done_keys()
+
+    def _queue_not_done_photos(self):
+        queued = array('Q')
+        for index, (root_path, json_name, photos) in enumerate(self._segments):
+            dialog_folder = self._dialog_folder(root_path, json_name)
+            first_key = index << _ROW_BITS
+            if not self._done_keys:
+                queued.extend(range(first_key, first_key + len(photos)))
+                continue
+            for row, (_, _, url) in enumerate(photos):
+                if (dialog_folder, url) not in self._done_keys:
+                    queued.append(first_key + row)
+        self._queued = queued
+        if not self._done_keys:
+            return
+        msg_ = (f'{self._photo_count - len(queued)} pictures are '
+                f'done according to the manifest, they will be ignored')
+        logging.info(msg_)
+
+    def _mark_in_manifest(self, file_name, status: DownloadStatus, size=0):
+        if not self._manifest:
+            return
+        if status is DownloadStatus.FAILED:
+            self._manifest.mark(file_name, ManifestStatus.FAILED)
+        elif status is DownloadStatus.LINKED:
+            self._manifest.mark(file_name,
+                                ManifestStatus.DONE,
+                                self._sink.size(file_name),
+                                attempted=False)
+        else:
+            self._manifest.mark(file_name,
+                                ManifestStatus.DONE,
+                                size,
+                                attempted=status is DownloadStatus.DOWNLOADED)
 
-    def _convert_raw_to_normal(self):
-        for raw_tuple in self._download_raw_tuple:
-            self._add_download_tuple(*raw_tuple)
+    def _finish_manifest(self):
+        if self._manifest:
+            self._manifest.flush()
+            self._manifest.log_summary()
+
+    def _stored_validators(self, file_name) -> Optional[Validators]:
+        return self._manifest.validators(file_name) if self._manifest else None
+
+    def _store_validators(self, file_name, validators: Validators):
+        if self._manifest and validators != Validators():
+            self._manifest.set_validators(file_name, validators)
 
     def add_id_to_collection(self, id_collection: set):
         self._id_collection |= id_collection
@@ -71,26 +246,294 @@ class DownloadManager:
     def _headers(self):
         return HEADER
 
-    async def _download_photo(self, file_name, url, *, tqdm_, try_count=3):
-        async with self._download_semaphore, aiohttp.ClientSession(
-                headers=self._headers) as session:
-            session: aiohttp.ClientSession
+    @staticmethod
+    def _remove_part_file(part_name):
+        try:
+            os.remove(part_name)
+        except OSError:
+            pass
+
+    def _part_size(self, part_name) -> int:
+        if not self._sink.resumable:
+            return 0
+        try:
+            return os.path.getsize(part_name)
+        except OSError:
+            return 0
+
+    @staticmethod
+    async def _hash_part(part_name, digest):
+        async with aiofiles.open(part_name, 'rb') as file:
+            while True:
+                chunk = await file.read(2**20)
+                if not chunk:
+                    return
+                digest.update(chunk)
+
+    async def _write_chunks(self,
+                            request: aiohttp.ClientResponse,
+                            part_name,
+                            digest=None,
+                            append: bool = False) -> int:
+        size = 0
+        async with aiofiles.open(part_name, 'ab' if append else 'wb') as file:
+            while True:
+                await self._byte_budget.acquire(self._chunk_size)
+                try:
+                    chunk = await request.content.read(self._chunk_size)
+                    if not chunk:
+                        return size
+                    await file.write(chunk)
+                finally:
+                    await self._byte_budget.release(self._chunk_size)
+                if digest is not None:
+                    digest.update(chunk)
+                size += len(chunk)
+
+    def _range_error(self, request: aiohttp.ClientResponse, part_name):
+        # The part doesn't match the photo - the next attempt starts over
+        self._remove_part_file(part_name)
+        metrics.count('download.range_rejected')
+        return aiohttp.ClientResponseError(request.request_info,
+                                           request.history,
+                                           status=RANGE_NOT_SATISFIABLE,
+                                           message='Range is rejected',
+                                           headers=request.headers)
+
+    def _request_headers(self, part_name, validators: Optional[Validators],
+                         conditional: bool) -> Tuple[Dict[str, str], int]:
+        """(headers, offset of the resumed part)."""
+        headers = {}
+        offset = 0
+        if conditional:
+            headers.update(validators.conditional_headers())
+        else:
+            offset = self._part_size(part_name)
+        if offset:
+            headers.update(IDENTITY, Range=f'bytes={offset}-')
+            if validators and validators.if_range:
+                headers['If-Range'] = validators.if_range
+        return headers, offset
+
+    def _check_response(self, request: aiohttp.ClientResponse, offset,
+                        part_name) -> Tuple[int, Optional[int]]:
+        """(offset the body is appended at, complete length of the 206)."""
+        total = None
+        if offset and request.status == 206:
+            first, total = parse_content_range(
+                request.headers.get('Content-Range'))
+            if first != offset:
+                raise self._range_error(request, part_name)
+        elif offset and request.status == RANGE_NOT_SATISFIABLE:
+            raise self._range_error(request, part_name)
+        elif request.status != 200:
+            raise aiohttp.ClientResponseError(request.request_info,
+                                              request.history,
+                                              status=request.status,
+                                              message=request.reason or '',
+                                              headers=request.headers)
+        elif offset:
+            # Changed since the part was got or no range support
+            metrics.count('download.resume_restarted')
+            offset = 0
+        return offset, total
+
+    @staticmethod
+    def _received_validators(headers, offset, total: Optional[int],
+                             validators: Optional[Validators]) -> Validators:
+        received = Validators.from_headers(headers)
+        if not offset:
+            return received
+        # Content-Length of the 206 is the length of the range, the whole
+        # one is unknown with bytes a-b/*
+        if total is None and received.content_length is not None:
+            total = offset + received.content_length
+        if not received.has_validator and validators:
+            return validators._replace(content_length=total)
+        return received._replace(content_length=total)
+
+    async def _fetch(
+        self,
+        file_name,
+        url,
+        part_name,
+        validators: Optional[Validators] = None,
+        conditional: bool = False
+    ) -> Optional[Tuple[int, Optional[str]]]:
+        """(size, sha1 of the content if the content dedup is on).
+
+        An existing part is resumed by a Range request, If-Range makes the
+        server send the whole photo if it was changed since. conditional -
+        GET with the validators, None if the photo is not modified (304).
+        """
+        digest = (hashlib.sha1()
+                  if self._dedup and self._dedup.by_content else None)
+        headers, offset = self._request_headers(part_name, validators,
+                                                conditional)
+        limiter = self._host_limiters.get(url) if self._host_limiters else None
+        if limiter:
+            await limiter.acquire()
+        latency = None
+        throttled = False
+        start = time.monotonic()
+        try:
+            async with self._session.get(url,
+                                         headers=headers,
+                                         timeout=self._timeout) as request:
+                if conditional and request.status == 304:
+                    latency = time.monotonic() - start
+                    return None
+                offset, total = self._check_response(request, offset,
+                                                     part_name)
+                latency = time.monotonic() - start
+                received = self._received_validators(request.headers, offset,
+                                                     total, validators)
+                # Stored before the body - an interrupted download is
+                # resumed with them
+                self._store_validators(file_name, received)
+                os.makedirs(os.path.dirname(part_name), exist_ok=True)
+                if offset and digest is not None:
+                    await self._hash_part(part_name, digest)
+                with metrics.timer('download.body'):
+                    size = offset + await self._write_chunks(
+                        request, part_name, digest, append=bool(offset))
+                length = received.content_length
+                if length is not None and size != length:
+                    if size > length:
+                        self._remove_part_file(part_name)
+                    raise aiohttp.ClientPayloadError(
+                        f'{size} of {length} bytes are got')
+                if offset:
+                    self._resumed_count += 1
+                    self._resumed_bytes += offset
+                    metrics.count('download.resumed')
+                    metrics.count('download.resumed_bytes', offset)
+                return size, digest and digest.hexdigest()
+        except asyncio.TimeoutError:
+            throttled = True
+            raise
+        except aiohttp.ClientResponseError as exp:
+            throttled = exp.status in THROTTLE_STATUSES
+            raise
+        finally:
+            if limiter:
+                await limiter.release(latency, throttled)
+
+    @staticmethod
+    def _retry_of_error(exp: Exception) -> Tuple[bool, Optional[float]]:
+        """(is retryable, Retry-After) of the download error."""
+        if isinstance(exp, asyncio.TimeoutError):
+            metrics.count('download.throttled')
+        if not isinstance(exp, aiohttp.ClientResponseError):
+            return True, None
+        if exp.status in THROTTLE_STATUSES:
+            metrics.count('download.throttled')
+        retry_after = parse_retry_after(
+            exp.headers.get('Retry-After') if exp.headers else None)
+        return (exp.status in THROTTLE_STATUSES
+                or exp.status == RANGE_NOT_SATISFIABLE), retry_after
+
+    async def _download_photo(
+            self,
+            file_name,
+            url,
+            *,
+            tqdm_,
+            validators: Optional[Validators] = None,
+            conditional: bool = False) -> Tuple[DownloadStatus, int]:
+        # The photo is streamed into .part and committed to the sink when
+        # it's complete, so a file under the final name is always a whole
+        # one. The part of an interrupted download is kept (if the sink is
+        # resumable) and resumed by the next attempt or run.
+        part_name = self._sink.part_name(file_name)
+        if validators is None and self._part_size(part_name):
+            validators = self._stored_validators(file_name)
+        attempt = 0
+        while True:
             try:
-                async with session.get(url) as request:
-                    os.makedirs(os.path.dirname(file_name), exist_ok=True)
-                    async with aiofiles.open(file_name, 'wb') as file:
-                        await file.write(await request.read())
-                        tqdm_.update()
-                    return 0
-            except (aiohttp.ClientError, OSError) as exp:
-                if not try_count:
-                    _msg = f'Problem with downloading image from {url} - {exp}'
+                fetched = await self._fetch(file_name, url, part_name,
+                                            validators, conditional)
+                if fetched is None:
+                    return DownloadStatus.SKIPPED, 0
+                size, digest = fetched
+                await self._sink.commit(part_name, file_name)
+                if digest:
+                    self._dedup.add_content(digest, file_name)
+                tqdm_.update()
+                return DownloadStatus.DOWNLOADED, size
+            except (aiohttp.ClientError, asyncio.TimeoutError,
+                    OSError) as exp:
+                is_retryable, retry_after = self._retry_of_error(exp)
+                if not is_retryable or not self._sink.resumable:
+                    self._remove_part_file(part_name)
+                if not is_retryable or attempt >= self._retry_policy.retries:
+                    _msg = (f'Problem with downloading image from {url} - '
+                            f'{exp!r}')
                     logging.error(_msg)
-                    return 1
-                return await self._download_photo(file_name,
-                                                  url,
-                                                  try_count=try_count - 1,
-                                                  tqdm_=tqdm_)
+                    return DownloadStatus.FAILED, 0
+            except asyncio.CancelledError:
+                if not self._sink.resumable:
+                    self._remove_part_file(part_name)
+                raise
+            metrics.count('download.retries')
+            await asyncio.sleep(
+                self._retry_policy.delay(attempt, retry_after))
+            attempt += 1
+
+    async def _existing_photo(self, file_name,
+                              url) -> Tuple[DownloadStatus, int]:
+        """The photo is in the output: skipped or verified (--verify)."""
+        status, size = DownloadStatus.SKIPPED, 0
+        if self._verify:
+            status, size = await self._verify_photo(file_name, url)
+        if status is DownloadStatus.SKIPPED:
+            self._add_existing_to_dedup(url, file_name)
+            self._mark_in_manifest(file_name, status,
+                                   self._sink.size(file_name))
+        else:
+            self._mark_in_manifest(file_name, status, size)
+        return status, size
+
+    async def _download_or_link(self, file_name,
+                                url) -> Tuple[DownloadStatus, int]:
+        """Download the photo or link it to the same one of another path."""
+        future = None
+        while self._dedup:
+            is_first, source_future = self._dedup.claim(url)
+            if is_first:
+                future = source_future
+                break
+            source = await source_future
+            if source is None:
+                # The first download failed - try it again
+                continue
+            if source == file_name:
+                return DownloadStatus.SKIPPED, 0
+            if self._dedup.link(source, file_name):
+                self._download_tqdm.update()
+                return DownloadStatus.LINKED, 0
+            break
+        status = DownloadStatus.FAILED
+        try:
+            status, size = await self._download_photo(
+                file_name, url, tqdm_=self._download_tqdm)
+            return status, size
+        finally:
+            if future is not None:
+                future.set_result(
+                    file_name if status is DownloadStatus.DOWNLOADED else None)
+
+    def _add_existing_to_dedup(self, url, file_name):
+        if self._dedup:
+            self._dedup.add_existing(url, file_name)
+
+    async def _download_item(self, key: int) -> Tuple[DownloadStatus, int]:
+        file_name, url = self._make_download_tuple(self._record(key))
+        if self._verify and self._sink.exists(file_name):
+            return await self._existing_photo(file_name, url)
+        status, size = await self._download_or_link(file_name, url)
+        self._mark_in_manifest(file_name, status, size)
+        return status, size
 
     @staticmethod
     def _is_file_exist(file_name):
@@ -99,48 +542,320 @@ class DownloadManager:
         return False
 
     def _filter_existing_photos(self):
-        delete_list = []
-        for tuple_object in self._download_tuple_list:
-            file_name, _ = tuple_object
-            if self._is_file_exist(file_name):
-                delete_list.append(tuple_object)
-        if not delete_list:
+        queued = array('Q')
+        exist_count = 0
+        for key in self._queued:
+            record = self._record(key)
+            file_name, url = self._make_download_tuple(record)
+            self._add_pending_to_manifest(record, file_name, url)
+            # Existing photos are checked by the workers with --verify
+            if not self._verify and self._sink.exists(file_name):
+                exist_count += 1
+                self._add_existing_to_dedup(url, file_name)
+                self._mark_in_manifest(file_name, DownloadStatus.SKIPPED,
+                                       self._sink.size(file_name))
+            else:
+                queued.append(key)
+        self._queued = queued
+        if self._manifest:
+            self._manifest.flush()
+        if not exist_count:
             return
-        msg_ = f'{len(delete_list)} pictures are exists, they will be ignored'
+        msg_ = f'{exist_count} pictures are exists, they will be ignored'
         logging.info(msg_)
-        for data in delete_list:
-            self._download_tuple_list.remove(data)
 
-    def download_photos(self):
-        if not self._download_raw_tuple:
+    def stop(self):
+        """Stop feeding the workers, the files in flight are finished.
+        The second call cancels them."""
+        if self._scheduler:
+            self._scheduler.stop()
+
+    def _create_scheduler(self, handler, queue_size: Optional[int] = None):
+        self._scheduler = DownloadScheduler(handler, self._download_limiter,
+                                            queue_size, self._handle_sigint)
+        return self._scheduler
+
+    async def download_all(self) -> DownloadResult:
+        """Download the photos of the added dicts (see add_dict)."""
+        if not self._segments:
             logging.info('Download list is empty...')
             logging.info('Finished')
-            return
-
-        print('\n')
-        time.sleep(0.1)
+            return DownloadResult()
         logging.info('Download step started')
-        self._grab_names()
-        self._convert_raw_to_normal()
+        with metrics.stage('download'):
+            trace_configs = [metrics.trace_config()]
+            async with create_session(self._pool_settings, self._headers,
+                                      trace_configs) as session, self._sink:
+                self._session = session
+                try:
+                    return await self._download_with_session()
+                finally:
+                    self._session = None
+                    self._scheduler = None
+                    self._finish_manifest()
+
+    async def _download_with_session(self) -> DownloadResult:
+        self._load_manifest()
+        self._queue_not_done_photos()
+        if not self._queued:
+            logging.info('All photos were filtered!')
+            return DownloadResult(skipped=self._photo_count)
+        if self._folder_namer:
+            return await self._download_deferred()
+        await self._grab_names()
         logging.info('Filter existing photos')
-        self._filter_existing_photos()
-        if not self._download_tuple_list:
+        with metrics.stage('filter'):
+            self._filter_existing_photos()
+        if not self._queued:
             logging.info('All photos were filtered!')
-            return
+            return DownloadResult(skipped=self._photo_count)
         logging.info('Downloading pictures')
-        tqdm_ = tqdm(total=len(self._download_tuple_list))
-        download_coroutines = [
-            self._download_photo(*data, tqdm_=tqdm_)
-            for data in self._download_tuple_list
-        ]
-        result = asyncio.get_event_loop().run_until_complete(
-            asyncio.gather(*download_coroutines))
-        error_count = sum(result)
-        if not error_count:
-            tqdm_.close()
-            _msg = f'All {len(download_coroutines)} photos downloaded'
+        total = len(self._queued)
+        self._download_tqdm = tqdm_ = tqdm(total=total,
+                                           disable=not self._progress)
+        async with self._create_scheduler(self._download_item) as scheduler:
+            for key in self._queued:
+                if not await scheduler.put(key):
+                    break
+        tqdm_.close()
+        result = self._log_download_stats(scheduler,
+                                          self._photo_count - total)
+        error_count = scheduler.failed_count
+        if scheduler.stopping:
+            _msg = (f'{scheduler.downloaded_count}/{total} '
+                    f'photos downloaded before the stop')
+            logging.info(_msg)
+        elif not error_count:
+            _msg = f'All {total} photos downloaded'
+            logging.info(_msg)
+        else:
+            _msg = f'{error_count}/{total} was not downloaded'
+            logging.warning(_msg)
+        return result
+
+    async def _download_deferred(self) -> DownloadResult:
+        logging.info('Downloading pictures, names are got in parallel')
+        total = len(self._queued)
+        self._download_tqdm = tqdm(total=total,
+                                   position=0,
+                                   disable=not self._progress)
+        self._name_tqdm = tqdm(desc='Names',
+                               unit=' id',
+                               position=1,
+                               disable=not self._progress)
+        async with self._create_scheduler(
+                self._download_record) as scheduler:
+            for key in self._queued:
+                if not await scheduler.put(self._record(key)):
+                    break
+        await self._finish_names()
+        self._download_tqdm.close()
+        self._name_tqdm.close()
+        return self._log_result(scheduler, total,
+                                self._photo_count - total)
+
+    def _log_download_stats(self,
+                            scheduler: DownloadScheduler,
+                            skipped: int = 0) -> DownloadResult:
+        """skipped - photos that were not put into the scheduler."""
+        scheduler.log_stats()
+        if self._host_limiters:
+            self._host_limiters.log_stats()
+        if self._dedup:
+            self._dedup.log_stats()
+        if self._resumed_count:
+            _msg = (f'{self._resumed_count} photos are resumed, '
+                    f'{self._resumed_bytes / 2**20:.1f} MiB were not '
+                    f'downloaded again')
+            logging.info(_msg)
+        if self._verify:
+            _msg = (f'{self._verified_count} photos are verified, '
+                    f'{self._repaired_count} are repaired')
+            logging.info(_msg)
+        return DownloadResult(downloaded=scheduler.downloaded_count,
+                              skipped=skipped + scheduler.skipped_count,
+                              linked=scheduler.linked_count,
+                              failed=scheduler.failed_count,
+                              stopped=scheduler.stopping)
+
+    def _log_result(self,
+                    scheduler: DownloadScheduler,
+                    total: int,
+                    skipped: int = 0) -> DownloadResult:
+        result = self._log_download_stats(scheduler, skipped)
+        error_count = scheduler.failed_count
+        skip_count = scheduler.skipped_count
+        if skip_count:
+            msg_ = f'{skip_count} pictures are exists, they were ignored'
+            logging.info(msg_)
+        if scheduler.stopping:
+            _msg = (f'{scheduler.downloaded_count} photos downloaded '
+                    f'before the stop')
+            logging.info(_msg)
+        elif not total:
+            logging.info('Download list is empty...')
+        elif total == skip_count:
+            logging.info('All photos were filtered!')
+        elif not error_count:
+            _msg = f'All {total - skip_count} photos downloaded'
             logging.info(_msg)
         else:
-            _msg = (f'{error_count}/{len(download_coroutines)} '
+            _msg = (f'{error_count}/{total - skip_count} '
                     f'was not downloaded')
             logging.warning(_msg)
+        return result
+
+    async def download_records(self,
+                               records: AsyncIterable[PhotoRecord],
+                               queue_size: int = 1000) -> DownloadResult:
+        """Download the records while they are produced.
+
+        A record is taken only when the bounded queue of the workers has a
+        place, so the producer waits while the workers are busy. The
+        records are closed (aclose) when the download is stopped.
+        """
+        logging.info('Pipeline started')
+        with metrics.stage('download'):
+            return await self._download_pipeline(records, queue_size)
+
+    async def _download_pipeline(self, records, queue_size) -> DownloadResult:
+        parse_tqdm = tqdm(desc='Parsed',
+                          unit=' photo',
+                          position=0,
+                          disable=not self._progress)
+        self._download_tqdm = tqdm(desc='Downloaded',
+                                   unit=' photo',
+                                   position=1,
+                                   disable=not self._progress)
+        self._name_tqdm = (tqdm(desc='Names',
+                                unit=' id',
+                                position=2,
+                                disable=not self._progress)
+                           if self._get_name else None)
+        self._load_manifest()
+        trace_configs = [metrics.trace_config()]
+        async with create_session(self._pool_settings, self._headers,
+                                  trace_configs) as session, self._sink:
+            self._session = session
+            try:
+                async with self._create_scheduler(self._download_record,
+                                                  queue_size) as scheduler:
+                    total = await self._put_records(records, scheduler,
+                                                    parse_tqdm)
+                await self._finish_names()
+            finally:
+                self._session = None
+                self._scheduler = None
+                self._finish_manifest()
+                self._name_grabber.save_cache()
+        for tqdm_ in (parse_tqdm, self._download_tqdm, self._name_tqdm):
+            if tqdm_ is not None:
+                tqdm_.close()
+        return self._log_result(scheduler, total)
+
+    @staticmethod
+    async def _put_records(records: AsyncIterable[PhotoRecord],
+                           scheduler: DownloadScheduler, tqdm_: tqdm) -> int:
+        count = 0
+        try:
+            async for record in records:
+                if not await scheduler.put(record):
+                    break
+                count += 1
+                tqdm_.update()
+        finally:
+            aclose = getattr(records, 'aclose', None)
+            if aclose is not None:
+                await aclose()
+        return count
+
+    def _request_name(self, owner_id) -> Optional[asyncio.Future]:
+        if not self._get_name or owner_id in self._id_name_collection:
+            return None
+        if owner_id not in self._name_futures:
+            self._name_futures[owner_id] = asyncio.ensure_future(
+                self._get_and_set_name(owner_id))
+        return self._name_futures[owner_id]
+
+    async def _get_and_set_name(self, owner_id) -> str:
+        # Set before the future is done - a done-callback runs later, so
+        # a path could be built from the empty collection meanwhile
+        name = await self._name_grabber.get_name(owner_id, self._session,
+                                                 self._name_tqdm)
+        self._id_name_collection[owner_id] = name
+        if self._folder_namer:
+            self._folder_namer.set_name(owner_id, name)
+        return name
+
+    async def _resolve_name(self, owner_id):
+        future = self._request_name(owner_id)
+        if future is not None:
+            await future
+
+    def _move_folder(self, source, target):
+        if self._manifest:
+            self._manifest.move_folder(source, target)
+        if self._dedup:
+            self._dedup.move_folder(source, target)
+
+    async def _finish_names(self):
+        if self._name_futures:
+            await asyncio.gather(*self._name_futures.values())
+        if self._folder_namer:
+            self._folder_namer.finalize()
+
+    def _add_pending_to_manifest(self, record: PhotoRecord, file_name, url):
+        if self._manifest:
+            self._manifest.add_pending([
+                (self._dialog_folder(record.root_path,
+                                     record.json_name), url, file_name,
+                 record.owner_id)
+            ])
+
+    def _existing_file(self, dialog_folder, owner_id, file_name):
+        for path in self._folder_namer.existing_paths(dialog_folder, owner_id,
+                                                      file_name):
+            if self._is_file_exist(path):
+                return path
+        return None
+
+    async def _download_record(
+            self, record: PhotoRecord) -> Tuple[DownloadStatus, int]:
+        if self._is_done_in_manifest(record):
+            return DownloadStatus.SKIPPED, 0
+        if self._folder_namer:
+            return await self._download_record_deferred(record)
+        await self._resolve_name(record.owner_id)
+        file_name, url = self._make_download_tuple(record)
+        self._add_pending_to_manifest(record, file_name, url)
+        if self._sink.exists(file_name):
+            return await self._existing_photo(file_name, url)
+        status, size = await self._download_or_link(file_name, url)
+        self._mark_in_manifest(file_name, status, size)
+        return status, size
+
+    async def _download_record_deferred(
+            self, record: PhotoRecord) -> Tuple[DownloadStatus, int]:
+        owner_id = record.owner_id
+        dialog_folder = self._dialog_folder(record.root_path,
+                                            record.json_name)
+        file_name, url = self._make_file_name(record)
+        existing_file = self._existing_file(dialog_folder, owner_id, file_name)
+        if existing_file:
+            if os.path.basename(os.path.dirname(existing_file)) == str(
+                    owner_id):
+                # Left in the id folder by the interrupted run
+                self._folder_namer.track_id_folder(dialog_folder, owner_id)
+                self._request_name(owner_id)
+            self._add_pending_to_manifest(record, existing_file, url)
+            return await self._existing_photo(existing_file, url)
+        self._request_name(owner_id)
+        owner_folder = self._folder_namer.acquire(dialog_folder, owner_id)
+        try:
+            photo_path = os.path.join(dialog_folder, owner_folder, file_name)
+            self._add_pending_to_manifest(record, photo_path, url)
+            status, size = await self._download_or_link(photo_path, url)
+            self._mark_in_manifest(photo_path, status, size)
+        finally:
+            self._folder_namer.release(dialog_folder, owner_id, owner_folder)
+        return status, size
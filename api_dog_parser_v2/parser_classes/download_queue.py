@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Tuple
+
+from tqdm import tqdm
+
+from api_dog_parser_v2.constants_and_enum import DownloadStatus
+from api_dog_parser_v2.parser_classes.download_scheduler import (
+    DownloadResult, DownloadScheduler)
+from api_dog_parser_v2.parser_classes.http_session import create_session
+from api_dog_parser_v2.parser_classes.manifest import Row
+from api_dog_parser_v2.parser_classes.metrics import metrics
+
+# Max wait of a worker for the photos leased by the other ones
+_LEASE_POLL = 0.5
+
+
+class QueueMixin:
+    """Distributed mode of DownloadManager: plan writes the work queue
+    into the manifest, the workers of download_queue share it."""
+
+    async def plan(self) -> int:
+        """Write the photos of the added dicts into the manifest as the work
+        queue of the workers (see download_queue).
+
+        Names are got and the paths are built here, existing photos are
+        marked as done, failed ones are queued again. Returns the count of
+        the queued photos.
+        """
+        logging.info('Planning the download')
+        self._manifest.requeue_failed()
+        trace_configs = [metrics.trace_config()]
+        async with create_session(self._pool_settings, self._headers,
+                                  trace_configs) as session:
+            self._session = session
+            try:
+                self._load_manifest()
+                self._queue_not_done_photos()
+                await self._grab_names()
+                with metrics.stage('filter'):
+                    self._filter_existing_photos()
+            finally:
+                self._session = None
+                self._finish_manifest()
+        _msg = (f'{len(self._queued)} photos are queued for the workers in '
+                f'{self._manifest.db_path}')
+        logging.info(_msg)
+        return len(self._queued)
+
+    async def download_queue(self,
+                             batch_size: int = 100,
+                             lease: float = 300) -> DownloadResult:
+        """Worker of the distributed mode: download the photos queued in
+        the manifest by plan.
+
+        Batches are claimed with leases of lease seconds, they are renewed
+        while the worker is alive. Leases of a crashed worker expire and
+        the photos are claimed by the others. The worker exits when
+        nothing is pending and no other worker holds a lease.
+        """
+        owner = f'{socket.gethostname()}-{os.getpid()}'
+        _msg = f'Worker {owner} started'
+        logging.info(_msg)
+        self._download_tqdm = tqdm(desc='Downloaded',
+                                   unit=' photo',
+                                   disable=not self._progress)
+        trace_configs = [metrics.trace_config()]
+        with metrics.stage('download'):
+            async with create_session(self._pool_settings, self._headers,
+                                      trace_configs) as session, self._sink:
+                self._session = session
+                heartbeat = asyncio.ensure_future(
+                    self._renew_leases(owner, lease))
+                try:
+                    async with self._create_scheduler(
+                            self._download_claimed) as scheduler:
+                        total = await self._put_claimed(
+                            scheduler, owner, batch_size, lease)
+                finally:
+                    heartbeat.cancel()
+                    self._session = None
+                    self._scheduler = None
+                    self._manifest.release(owner)
+                    self._finish_manifest()
+        self._download_tqdm.close()
+        return self._log_result(scheduler, total)
+
+    async def _put_claimed(self, scheduler: DownloadScheduler, owner,
+                           batch_size, lease) -> int:
+        count = 0
+        while True:
+            rows = self._manifest.claim(owner, batch_size, lease)
+            if not rows:
+                # The marks of the own photos done meanwhile - the others
+                # wait for them to exit
+                self._manifest.flush()
+                expiry = self._manifest.next_lease_expiry(owner)
+                if expiry is None:
+                    return count
+                # Wait for the others to finish or their leases to expire
+                # - one of them may be gone
+                await asyncio.sleep(
+                    min(max(expiry - time.time(), 0.1), _LEASE_POLL))
+                continue
+            for row in rows:
+                if not await scheduler.put(row):
+                    return count
+                count += 1
+
+    async def _renew_leases(self, owner, lease):
+        while True:
+            await asyncio.sleep(lease / 3)
+            self._manifest.renew(owner, lease)
+
+    async def _download_claimed(self,
+                                row: Row) -> Tuple[DownloadStatus, int]:
+        _, url, file_name, _ = row
+        if self._sink.exists(file_name):
+            return await self._existing_photo(file_name, url)
+        status, size = await self._download_or_link(file_name, url)
+        self._mark_in_manifest(file_name, status, size)
+        return status, size
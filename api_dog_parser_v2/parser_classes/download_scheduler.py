@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import signal
+import statistics
+import time
+from typing import (Any, Awaitable, Callable, List, NamedTuple, Optional,
+                    Tuple)
+
+from api_dog_parser_v2.constants_and_enum import DownloadStatus
+from api_dog_parser_v2.parser_classes.metrics import metrics
+
+Handler = Callable[[Any], Awaitable[Tuple[DownloadStatus, int]]]
+
+
+class DownloadResult(NamedTuple):
+    """Counts of the download run.
+
+    skipped - photos that are already in the output or done according to
+    the manifest, linked - hardlinks of the dedup, stopped - the run was
+    stopped (Ctrl-C or DownloadManager.stop) before the end.
+    """
+    downloaded: int = 0
+    skipped: int = 0
+    linked: int = 0
+    failed: int = 0
+    stopped: bool = False
+
+
+class ByteBudget:
+    """Global cap for the bytes held in download buffers.
+
+    A chunk bigger than the whole budget is allowed when nothing else is
+    reserved - otherwise it would wait forever.
+    limit - budget in bytes, 0 - unlimited.
+    """
+    def __init__(self, limit: int = 0):
+        self._limit = limit
+        self._used = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    async def acquire(self, size: int):
+        if not self._limit:
+            return
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: not self._used or self._used + size <= self._limit)
+            self._used += size
+
+    async def release(self, size: int):
+        if not self._limit:
+            return
+        async with self._condition:
+            self._used -= size
+            self._condition.notify_all()
+
+
+class WorkerStats:
+    __slots__ = ('worker_id', 'downloaded', 'skipped', 'linked', 'failed',
+                 'bytes', 'busy_time')
+
+    def __init__(self, worker_id: int):
+        self.worker_id = worker_id
+        self.downloaded = 0
+        self.skipped = 0
+        self.linked = 0
+        self.failed = 0
+        self.bytes = 0
+        self.busy_time = 0.0
+
+    def add(self, status: DownloadStatus, size: int, elapsed: float):
+        if status is DownloadStatus.DOWNLOADED:
+            self.downloaded += 1
+        elif status is DownloadStatus.SKIPPED:
+            self.skipped += 1
+        elif status is DownloadStatus.LINKED:
+            self.linked += 1
+        else:
+            self.failed += 1
+        self.bytes += size
+        self.busy_time += elapsed
+
+    @property
+    def photos_per_second(self):
+        return self.downloaded / self.busy_time if self.busy_time else 0.0
+
+    @property
+    def bytes_per_second(self):
+        return self.bytes / self.busy_time if self.busy_time else 0.0
+
+    def __str__(self):
+        return (f'Worker {self.worker_id}: {self.downloaded} downloaded, '
+                f'{self.skipped} skipped, {self.linked} linked, '
+                f'{self.failed} failed, '
+                f'{self.bytes / 2**20:.1f} MiB, '
+                f'{self.photos_per_second:.1f} photos/s')
+
+
+class DownloadScheduler:
+    """Fixed pool of worker tasks pulling items from the bounded queue.
+
+    Memory doesn't depend on the job size: only the queue and the items in
+    work are alive. The first Ctrl-C stops feeding and lets the workers
+    finish the files in flight, the second one cancels them (handlers must
+    clean up partial files on CancelledError).
+
+    Usage:
+        async with DownloadScheduler(handler, 50) as scheduler:
+            for item in items:
+                if not await scheduler.put(item):
+                    break
+    """
+    def __init__(self,
+                 handler: Handler,
+                 worker_count: int,
+                 queue_size: Optional[int] = None,
+                 handle_sigint: bool = True):
+        """handle_sigint - stop on Ctrl-C (the loop's SIGINT handler is
+        replaced while the scheduler works)."""
+        self._handler = handler
+        self._worker_count = worker_count
+        self._queue_size = (worker_count * 2
+                            if queue_size is None else queue_size)
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Future] = []
+        self._stats = [WorkerStats(index) for index in range(worker_count)]
+        self._stopping = False
+        self._busy = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle_sigint = handle_sigint
+        self._signal_installed = False
+
+    @property
+    def stats(self) -> List[WorkerStats]:
+        return self._stats
+
+    @property
+    def stopping(self):
+        return self._stopping
+
+    @property
+    def downloaded_count(self):
+        return sum(stats.downloaded for stats in self._stats)
+
+    @property
+    def skipped_count(self):
+        return sum(stats.skipped for stats in self._stats)
+
+    @property
+    def linked_count(self):
+        return sum(stats.linked for stats in self._stats)
+
+    @property
+    def failed_count(self):
+        return sum(stats.failed for stats in self._stats)
+
+    async def __aenter__(self):
+        self._loop = asyncio.get_event_loop()
+        self._queue = asyncio.Queue(self._queue_size)
+        self._workers = [
+            asyncio.ensure_future(self._worker(stats)) for stats in self._stats
+        ]
+        self._install_signal_handler()
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None and not self._stopping:
+                for _ in self._workers:
+                    await self._queue.put(None)
+                await asyncio.gather(*self._workers)
+            else:
+                if exc_type is not None:
+                    for worker in self._workers:
+                        worker.cancel()
+                await asyncio.gather(*self._workers, return_exceptions=True)
+        finally:
+            self._remove_signal_handler()
+        if self._stopping:
+            logging.warning('Download was stopped by user')
+
+    async def put(self, item) -> bool:
+        """Wait for a free place in the queue. False - scheduler stopped."""
+        if self._stopping:
+            return False
+        await self._queue.put(item)
+        return True
+
+    def stop(self):
+        if self._stopping:
+            logging.warning('Cancelling downloads in flight...')
+            for worker in self._workers:
+                worker.cancel()
+            return
+        logging.warning('Stopping: files in flight will be finished. '
+                        'Press Ctrl-C again to cancel them')
+        self._stopping = True
+        for index, worker in enumerate(self._workers):
+            if index not in self._busy:
+                worker.cancel()
+        # Wake up the producer blocked on the full queue
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def log_stats(self):
+        active = [stats for stats in self._stats if stats.busy_time]
+        for stats in active:
+            logging.debug(str(stats))
+        if not active:
+            return
+        rates = [stats.photos_per_second for stats in active]
+        _msg = (f'{len(active)} workers, photos/s per worker: '
+                f'min {min(rates):.1f}, median {statistics.median(rates):.1f}'
+                f', max {max(rates):.1f}, total '
+                f'{sum(stats.bytes for stats in active) / 2**20:.1f} MiB')
+        logging.info(_msg)
+
+    async def _worker(self, stats: WorkerStats):
+        while not self._stopping:
+            item = await self._queue.get()
+            if item is None:
+                return
+            self._busy.add(stats.worker_id)
+            start = time.perf_counter()
+            try:
+                status, size = await self._handler(item)
+            except asyncio.CancelledError:  # pylint: disable=try-except-raise
+                # An Exception before Python 3.8
+                raise
+            except Exception:  # pylint: disable=broad-except
+                # A bug of the handler must not kill the worker - the
+                # producer would hang on the full queue w/o the workers
+                _msg = f'Unexpected error while downloading {item!r}'
+                logging.exception(_msg)
+                status, size = DownloadStatus.FAILED, 0
+            finally:
+                self._busy.discard(stats.worker_id)
+            elapsed = time.perf_counter() - start
+            stats.add(status, size, elapsed)
+            metrics.count(f'download.{status.value.lower()}')
+            metrics.count('download.bytes', size)
+            metrics.observe('download.item', elapsed)
+
+    def _install_signal_handler(self):
+        if not self._handle_sigint:
+            return
+        try:
+            self._loop.add_signal_handler(signal.SIGINT, self.stop)
+            self._signal_installed = True
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Windows / not the main thread - KeyboardInterrupt as usual
+            self._signal_installed = False
+
+    def _remove_signal_handler(self):
+        if self._signal_installed:
+            self._loop.remove_signal_handler(signal.SIGINT)
+            self._signal_installed = False
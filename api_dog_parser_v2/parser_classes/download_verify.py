@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+from typing import Optional, Tuple
+
+import aiohttp
+
+from api_dog_parser_v2.constants_and_enum import DownloadStatus
+from api_dog_parser_v2.parser_classes.flow_control import (
+    THROTTLE_STATUSES, parse_retry_after)
+from api_dog_parser_v2.parser_classes.http_validators import (IDENTITY,
+                                                              Validators)
+from api_dog_parser_v2.parser_classes.metrics import metrics
+
+
+class VerifyMixin:
+    """--verify of DownloadManager: the existing photos are checked
+    against the server, truncated and changed ones are downloaded again."""
+    def __init__(self):
+        super().__init__()
+        self._verified_count = 0
+        self._repaired_count = 0
+
+    async def _head(self, url) -> Optional[Validators]:
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self._session.head(
+                        url,
+                        headers=IDENTITY,
+                        allow_redirects=True,
+                        timeout=self._timeout) as request:
+                    if request.status < 300:
+                        return Validators.from_headers(request.headers)
+                    if (request.status not in THROTTLE_STATUSES
+                            or attempt >= self._retry_policy.retries):
+                        request.raise_for_status()
+                    retry_after = parse_retry_after(
+                        request.headers.get('Retry-After'))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exp:
+                if (isinstance(exp, aiohttp.ClientResponseError)
+                        or attempt >= self._retry_policy.retries):
+                    _msg = f'Problem with checking image {url} - {exp!r}'
+                    logging.error(_msg)
+                    return None
+            metrics.count('download.retries')
+            await asyncio.sleep(
+                self._retry_policy.delay(attempt, retry_after))
+            attempt += 1
+
+    async def _verify_photo(self, file_name,
+                            url) -> Tuple[DownloadStatus, int]:
+        """Check the existing photo w/o its body (--verify).
+
+        The stored validators are sent in a conditional GET (304 - the
+        same photo), w/o them the length of HEAD is compared. A truncated
+        photo is resumed from its size, a changed one is downloaded again.
+        """
+        size = self._sink.size(file_name)
+        validators = self._stored_validators(file_name)
+        is_conditional = bool(validators and validators.has_validator)
+        if not is_conditional:
+            validators = await self._head(url)
+            if validators is None:
+                return DownloadStatus.FAILED, 0
+            self._store_validators(file_name, validators)
+        length = validators.content_length
+        if length is not None and size != length:
+            return await self._repair_photo(file_name, url, size, validators)
+        if not is_conditional:
+            return self._verified()
+        status, size = await self._download_photo(file_name,
+                                                  url,
+                                                  tqdm_=self._download_tqdm,
+                                                  validators=validators,
+                                                  conditional=True)
+        if status is DownloadStatus.SKIPPED:
+            return self._verified()
+        if status is DownloadStatus.DOWNLOADED:
+            _msg = f'{file_name} was changed on the server, updated'
+            logging.warning(_msg)
+            self._repaired_count += 1
+            metrics.count('download.repaired')
+        return status, size
+
+    async def _repair_photo(self, file_name, url, size,
+                            validators: Validators):
+        length = validators.content_length
+        _msg = f'{file_name} has {size} of {length} bytes, repairing'
+        logging.warning(_msg)
+        part_name = self._sink.part_name(file_name)
+        # The rest is got by a Range request. A hardlink of the dedup is
+        # downloaded again - the appended inode is shared with the others
+        if size < length and os.stat(file_name).st_nlink == 1:
+            os.replace(file_name, part_name)
+        else:
+            self._remove_part_file(part_name)
+        self._repaired_count += 1
+        metrics.count('download.repaired')
+        return await self._download_photo(file_name,
+                                          url,
+                                          tqdm_=self._download_tqdm,
+                                          validators=validators)
+
+    def _verified(self) -> Tuple[DownloadStatus, int]:
+        self._verified_count += 1
+        metrics.count('download.verified')
+        self._download_tqdm.update()
+        return DownloadStatus.SKIPPED, 0
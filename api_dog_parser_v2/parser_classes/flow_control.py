@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import email.utils
+import logging
+import random
+import time
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+# Statuses that mean "too much, slow down"
+THROTTLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from the Retry-After header (delta or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+class RetryPolicy(NamedTuple):
+    """Retries of a single download.
+
+    retries - count of the retries after the first attempt,
+    base_delay - backoff of the first retry (seconds), doubled every time,
+    max_delay - backoff cap (seconds). The delay is jittered in [0, backoff].
+    Retry-After of the server is honored as is.
+    """
+    retries: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None):
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit of a single host.
+
+    The limit grows by one per the limit's worth of healthy responses
+    (latency to the headers is within latency_factor of the best one seen)
+    and is cut by a quarter on throttling - 429/5xx or a timeout. One
+    decrease per smoothed round trip, so a burst of errors is a single
+    signal.
+    """
+    def __init__(self,
+                 initial: int,
+                 max_limit: int,
+                 min_limit: int = 1,
+                 latency_factor: float = 2.0):
+        self._limit = float(max(min_limit, min(initial, max_limit)))
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._latency_factor = latency_factor
+        self._in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._latency: Optional[float] = None
+        self._best_latency: Optional[float] = None
+        self._last_decrease = 0.0
+        self.max_seen = int(self._limit)
+        self.decrease_count = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    async def acquire(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: self._in_flight < int(self._limit))
+            self._in_flight += 1
+
+    async def release(self,
+                      latency: Optional[float] = None,
+                      throttled: bool = False):
+        """latency - seconds to the response headers, None - no signal."""
+        if throttled:
+            self._decrease()
+        elif latency is not None:
+            self._observe(latency)
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _observe(self, latency: float):
+        self._latency = (latency if self._latency is None else
+                         0.8 * self._latency + 0.2 * latency)
+        if self._best_latency is None or self._latency < self._best_latency:
+            self._best_latency = self._latency
+        if self._latency <= self._best_latency * self._latency_factor:
+            self._limit = min(self._max_limit,
+                              self._limit + 1 / self._limit)
+            self.max_seen = max(self.max_seen, self.limit)
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < max(self._latency or 0.0, 0.1):
+            return
+        self._last_decrease = now
+        self._limit = max(self._min_limit, self._limit * 0.75)
+        self.decrease_count += 1
+
+
+class HostLimiters:
+    """AdaptiveLimiter per host of the url."""
+    def __init__(self, initial: int, max_limit: int):
+        self._initial = initial
+        self._max_limit = max_limit
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+
+    def get(self, url) -> AdaptiveLimiter:
+        host = urlsplit(url).netloc
+        if host not in self._limiters:
+            self._limiters[host] = AdaptiveLimiter(self._initial,
+                                                   self._max_limit)
+        return self._limiters[host]
+
+    def log_stats(self):
+        for host, limiter in sorted(self._limiters.items()):
+            _msg = (f'Adaptive limit of {host}: {limiter.limit} '
+                    f'(max {limiter.max_seen}), throttled '
+                    f'{limiter.decrease_count} times')
+            logging.info(_msg)
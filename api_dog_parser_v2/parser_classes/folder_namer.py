@@ -0,0 +1,126 @@
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+OWNER_FOLDER_RE = re.compile(r'^(-?\d+)(?: \(.*\))?$')
+
+
+class DeferredFolderNamer:
+    """Owner folders for the downloads that don't wait for the VK names.
+
+    Photos go into the `id` folder while the name is unknown. When the name
+    arrives the folder is merged into `id (Name)` as soon as there are no
+    downloads in flight for it, the next photos go straight into the named
+    folder. on_move(source, target) is called after the files of the id
+    folder are moved, the paths recorded before point to the source.
+    """
+    def __init__(self, on_move: Optional[Callable[[str, str], None]] = None):
+        self._on_move = on_move
+        self._names: Dict[int, str] = {}
+        self._in_flight: Counter = Counter()
+        self._id_folders: Dict[int, Set[str]] = defaultdict(set)
+        self._existing: Dict[str, Dict[int, List[str]]] = {}
+
+    def folder(self, owner_id: int) -> str:
+        return self._names.get(owner_id, str(owner_id))
+
+    def acquire(self, dialog_folder, owner_id: int) -> str:
+        """Folder name for the download. Must be paired with release."""
+        folder = self.folder(owner_id)
+        if owner_id not in self._names:
+            self._id_folders[owner_id].add(dialog_folder)
+            self._in_flight[dialog_folder, owner_id] += 1
+        return folder
+
+    def release(self, dialog_folder, owner_id: int, folder: str):
+        key = (dialog_folder, owner_id)
+        if folder != str(owner_id) or self._in_flight[key] <= 0:
+            return
+        self._in_flight[key] -= 1
+        if not self._in_flight[key] and owner_id in self._names:
+            del self._in_flight[key]
+            self._merge(dialog_folder, owner_id)
+
+    def track_id_folder(self, dialog_folder, owner_id: int):
+        """Merge the id folder left by the previous run too."""
+        if owner_id in self._names:
+            self._merge(dialog_folder, owner_id)
+        else:
+            self._id_folders[owner_id].add(dialog_folder)
+
+    def set_name(self, owner_id: int, name: str):
+        self._names[owner_id] = name
+        for dialog_folder in list(self._id_folders.get(owner_id, ())):
+            if not self._in_flight[dialog_folder, owner_id]:
+                self._merge(dialog_folder, owner_id)
+
+    def existing_paths(self, dialog_folder, owner_id: int,
+                       file_name) -> List[str]:
+        """Every place where the photo can be after the previous runs."""
+        folders = {str(owner_id), self.folder(owner_id)}
+        folders.update(self._existing_folders(dialog_folder).get(owner_id, ()))
+        return [
+            os.path.join(dialog_folder, folder, file_name)
+            for folder in folders
+        ]
+
+    def finalize(self):
+        for owner_id, dialog_folders in list(self._id_folders.items()):
+            if owner_id not in self._names:
+                continue
+            for dialog_folder in list(dialog_folders):
+                self._merge(dialog_folder, owner_id)
+
+    def _existing_folders(self, dialog_folder) -> Dict[int, List[str]]:
+        if dialog_folder not in self._existing:
+            folders = defaultdict(list)
+            try:
+                with os.scandir(dialog_folder) as entries:
+                    for entry in entries:
+                        match = OWNER_FOLDER_RE.match(entry.name)
+                        if match and entry.is_dir():
+                            folders[int(match.group(1))].append(entry.name)
+            except OSError:
+                pass
+            self._existing[dialog_folder] = folders
+        return self._existing[dialog_folder]
+
+    def _merge(self, dialog_folder, owner_id: int):
+        self._id_folders[owner_id].discard(dialog_folder)
+        name = self._names[owner_id]
+        source = os.path.join(dialog_folder, str(owner_id))
+        target = os.path.join(dialog_folder, name)
+        if name == str(owner_id) or not os.path.isdir(source):
+            return
+        try:
+            if os.path.exists(target):
+                moved, total = self._move_files(source, target)
+            else:
+                os.rename(source, target)
+                moved = total = 1
+            if moved and self._on_move:
+                self._on_move(source, target)
+            if moved != total:
+                _msg = (f'{total - moved} files of {source} are left, '
+                        f'they exist in {target}')
+                logging.warning(_msg)
+        except OSError as exp:
+            _msg = f"Can't rename {source} to {target} - {exp}"
+            logging.warning(_msg)
+
+    @staticmethod
+    def _move_files(source, target) -> Tuple[int, int]:
+        moved = total = 0
+        with os.scandir(source) as entries:
+            for entry in entries:
+                total += 1
+                target_file = os.path.join(target, entry.name)
+                if os.path.exists(target_file):
+                    continue
+                os.replace(entry.path, target_file)
+                moved += 1
+        if moved == total:
+            os.rmdir(source)
+        return moved, total
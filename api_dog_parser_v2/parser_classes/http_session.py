@@ -0,0 +1,37 @@
+from typing import List, NamedTuple, Optional
+
+import aiohttp
+
+from api_dog_parser_v2.constants_and_enum import HEADER
+
+
+class PoolSettings(NamedTuple):
+    """Settings of the connection pool shared by the whole run.
+
+    pool_size - total connection count (0 - unlimited),
+    per_host_limit - connection count for the single host (0 - unlimited),
+    dns_ttl - seconds to cache resolved hosts (0 - don't cache),
+    keepalive - seconds to keep an idle connection open.
+    """
+    pool_size: int = 100
+    per_host_limit: int = 0
+    dns_ttl: int = 300
+    keepalive: float = 30
+
+
+def create_session(
+    pool_settings: Optional[PoolSettings] = None,
+    headers: Optional[dict] = None,
+    trace_configs: Optional[List[aiohttp.TraceConfig]] = None
+) -> aiohttp.ClientSession:
+    """Create a keep-alive session. Must be called inside a running loop."""
+    pool_settings = pool_settings or PoolSettings()
+    connector = aiohttp.TCPConnector(
+        limit=pool_settings.pool_size,
+        limit_per_host=pool_settings.per_host_limit,
+        use_dns_cache=bool(pool_settings.dns_ttl),
+        ttl_dns_cache=pool_settings.dns_ttl or None,
+        keepalive_timeout=pool_settings.keepalive)
+    return aiohttp.ClientSession(connector=connector,
+                                 headers=HEADER if headers is None else headers,
+                                 trace_configs=trace_configs)
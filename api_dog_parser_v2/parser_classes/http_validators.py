@@ -0,0 +1,59 @@
+import re
+from typing import Dict, Mapping, NamedTuple, Optional, Tuple
+
+RANGE_NOT_SATISFIABLE = 416
+# Ranges and lengths are of the photo itself, not of an encoded body
+IDENTITY = {'Accept-Encoding': 'identity'}
+_CONTENT_RANGE_RE = re.compile(r'bytes\s+(?:(\d+)-\d+|\*)/(\d+|\*)')
+
+
+def parse_content_range(
+        value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """(first byte, complete length) of the Content-Range header, None if
+    it's unknown."""
+    match = _CONTENT_RANGE_RE.match(value or '')
+    if not match:
+        return None, None
+    first, total = match.groups()
+    return (int(first) if first is not None else None,
+            int(total) if total != '*' else None)
+
+
+class Validators(NamedTuple):
+    """Validators of the photo got from the server (kept in the manifest).
+
+    content_length - length of the whole photo (not of the range).
+    """
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> 'Validators':
+        # Content-Length of an encoded body isn't the length of the photo
+        content_length = None
+        if ('Content-Length' in headers and
+                headers.get('Content-Encoding', 'identity') == 'identity'):
+            content_length = int(headers['Content-Length'])
+        return cls(headers.get('ETag'), headers.get('Last-Modified'),
+                   content_length)
+
+    @property
+    def has_validator(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+    @property
+    def if_range(self) -> Optional[str]:
+        # Weak ETags can't be used in If-Range
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """Headers of the GET that is answered with 304 if the photo is
+        the same."""
+        if self.etag:
+            return {'If-None-Match': self.etag}
+        if self.last_modified:
+            return {'If-Modified-Since': self.last_modified}
+        return {}
@@ -0,0 +1,112 @@
+import contextlib
+import gc
+import json
+import mmap
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+_BOM = b'\xef\xbb\xbf'
+
+
+class JsonBackend(NamedTuple):
+    """Decoder of the whole export.
+
+    zero_copy - loads takes the memoryview of the mmapped file, otherwise
+    it gets bytes.
+    """
+    name: str
+    loads: Callable[[Any], Any]
+    zero_copy: bool = False
+
+
+def _orjson() -> Optional[JsonBackend]:
+    try:
+        import orjson  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return JsonBackend('orjson', orjson.loads, zero_copy=True)
+
+
+def _simdjson() -> Optional[JsonBackend]:
+    try:
+        import simdjson  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+
+    def loads(data):
+        # A parser per document - the previous one may still be referenced
+        return simdjson.Parser().parse(data, True)
+
+    return JsonBackend('simdjson', loads)
+
+
+def _ujson() -> Optional[JsonBackend]:
+    try:
+        import ujson  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return JsonBackend('ujson', ujson.loads)
+
+
+def _stdlib() -> JsonBackend:
+    return JsonBackend('json', json.loads)
+
+
+# In the order of the auto selection
+_FACTORIES = (('orjson', _orjson), ('simdjson', _simdjson),
+              ('ujson', _ujson), ('json', _stdlib))
+BACKEND_NAMES = tuple(name for name, _ in _FACTORIES)
+_backends: Dict[str, Optional[JsonBackend]] = {}
+
+
+def _load_backend(name) -> Optional[JsonBackend]:
+    if name not in _backends:
+        _backends[name] = dict(_FACTORIES)[name]()
+    return _backends[name]
+
+
+def available_backends() -> List[str]:
+    return [name for name in BACKEND_NAMES if _load_backend(name)]
+
+
+def get_backend(name: str = 'auto') -> JsonBackend:
+    """The backend by name, auto - the fastest installed one."""
+    if name == 'auto':
+        name = available_backends()[0]
+    backend = _load_backend(name)
+    if backend is None:
+        raise ValueError(f'JSON backend {name} is not installed')
+    return backend
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # Decoded exports have millions of containers w/o cycles, the collector
+    # passes over the growing tree take more time than the decoding itself
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def load_json(file, backend: str = 'auto'):
+    """Decode the file from its raw bytes (mmap if it's possible), w/o
+    the text decoding layer. The UTF-8 BOM is skipped."""
+    json_backend = get_backend(backend)
+    with open(file, 'rb') as fp:
+        try:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty file or not a regular one
+            data = fp.read()
+            with _gc_paused():
+                return json_backend.loads(
+                    data[len(_BOM):] if data.startswith(_BOM) else data)
+    with mapped, _gc_paused():
+        offset = len(_BOM) if mapped[:len(_BOM)] == _BOM else 0
+        if not json_backend.zero_copy:
+            return json_backend.loads(mapped[offset:])
+        with memoryview(mapped) as view, view[offset:] as data:
+            return json_backend.loads(data)
@@ -0,0 +1,122 @@
+import json
+from typing import Iterator, Optional
+
+_WHITESPACE = ' \t\n\r'
+
+
+class DialogStream:
+    """Incremental reader for the ApiDog v2 export.
+
+    The export is a single object - ``{"meta": {...}, "data": [...]}``.
+    ``meta`` is decoded first, messages of ``data`` are decoded and yielded
+    one by one, so only the read buffer and the current message live in
+    memory.
+    """
+    def __init__(self, file, chunk_size: int = 64 * 1024):
+        self._file = file
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._fp = None
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    @property
+    def meta(self) -> dict:
+        with open(self._file, 'r', encoding='utf-8-sig') as self._fp:
+            self._reset()
+            meta = None
+            for key in self._iter_top_level_keys():
+                if key == 'meta':
+                    meta = self._decode_value()
+                    break
+                self._decode_value()
+        return meta or {}
+
+    def iter_messages(self) -> Iterator[dict]:
+        with open(self._file, 'r', encoding='utf-8-sig') as self._fp:
+            self._reset()
+            for key in self._iter_top_level_keys():
+                if key != 'data':
+                    self._decode_value()
+                    continue
+                yield from self._iter_array()
+                return
+
+    def _reset(self):
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        if self._eof:
+            return False
+        chunk = self._fp.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._pos:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        self._buffer += chunk
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while (self._pos < len(self._buffer)
+                   and self._buffer[self._pos] in _WHITESPACE):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError(f'Unexpected end of {self._file}')
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            _msg = (f'Expected {char!r} at {self._pos} in {self._file}, '
+                    f'got {self._buffer[self._pos]!r}')
+            raise ValueError(_msg)
+        self._pos += 1
+
+    def _decode_value(self):
+        self._peek()
+        read_size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill(read_size):
+                    raise
+                # A value longer than the chunk - read more on every retry
+                # to keep the re-decoding cost linear.
+                read_size *= 2
+                continue
+            if end == len(self._buffer) and self._fill():
+                # A number may continue in the next chunk
+                continue
+            self._pos = end
+            return value
+
+    def _iter_top_level_keys(self) -> Iterator[str]:
+        self._expect('{')
+        if self._peek() == '}':
+            return
+        while True:
+            key = self._decode_value()
+            self._expect(':')
+            yield key
+            if self._peek() == '}':
+                return
+            self._expect(',')
+
+    def _iter_array(self) -> Iterator:
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._decode_value()
+            if self._peek() == ']':
+                self._pos += 1
+                return
+            self._expect(',')
@@ -0,0 +1,243 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from api_dog_parser_v2.constants_and_enum import ManifestStatus
+from api_dog_parser_v2.parser_classes.http_validators import Validators
+from api_dog_parser_v2.parser_classes.metrics import metrics
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS photos (
+    source TEXT NOT NULL,
+    url TEXT NOT NULL,
+    path TEXT NOT NULL,
+    owner_id INTEGER,
+    size INTEGER,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated REAL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    etag TEXT,
+    last_modified TEXT,
+    content_length INTEGER,
+    PRIMARY KEY (source, url)
+);
+CREATE INDEX IF NOT EXISTS photos_path ON photos (path);
+CREATE INDEX IF NOT EXISTS photos_status ON photos (status);
+'''
+# Columns added after the first version of the schema
+_MIGRATIONS = (('lease_owner', 'TEXT'), ('lease_expires', 'REAL'),
+               ('etag', 'TEXT'), ('last_modified', 'TEXT'),
+               ('content_length', 'INTEGER'))
+# (source, url, path, owner_id)
+Row = Tuple[str, str, str, int]
+
+
+class DownloadManifest:
+    """On-disk (SQLite) state of the downloads shared between the runs.
+
+    A photo is identified by the source - the dialog folder
+    (root/json_name) - and the url, so finished photos can be skipped
+    before the name grabbing and the path building. Status updates are
+    buffered and committed by batches.
+
+    The pending photos are also the work queue of the distributed mode:
+    workers of the same host claim them by batches with expiring leases
+    (the WAL mode doesn't work over a network file system).
+
+    The HTTP validators (ETag, Last-Modified, length) of the photos are
+    kept for the resume of the partial files and for --verify.
+    """
+    def __init__(self, db_path, flush_size: int = 1000):
+        self._db_path = db_path
+        self._flush_size = flush_size
+        self._pending: List[Tuple[str, str, str, int]] = []
+        self._updates: List[tuple] = []
+        self._validators: Dict[str, Validators] = {}
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        # Workers wait for each other's claims
+        self._connection = sqlite3.connect(db_path, timeout=60)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {
+            row[1]
+            for row in self._connection.execute('PRAGMA table_info(photos)')
+        }
+        with self._connection:
+            for column, column_type in _MIGRATIONS:
+                if column not in columns:
+                    self._connection.execute(
+                        f'ALTER TABLE photos ADD COLUMN {column} '
+                        f'{column_type}')
+
+    @property
+    def db_path(self):
+        return self._db_path
+
+    def done_keys(self) -> Set[Tuple[str, str]]:
+        cursor = self._connection.execute(
+            'SELECT source, url FROM photos WHERE status = ?',
+            (ManifestStatus.DONE.value, ))
+        return set(cursor)
+
+    def add_pending(self, rows: Iterable[Row]):
+        """rows - (source, url, path, owner_id). Known rows get a new path."""
+        self._pending.extend(rows)
+        if len(self._pending) >= self._flush_size:
+            self.flush()
+
+    def mark(self,
+             path,
+             status: ManifestStatus,
+             size: int = 0,
+             attempted: bool = True):
+        self._updates.append((status.value, size, int(attempted),
+                              time.time(), path))
+        if len(self._updates) >= self._flush_size:
+            self.flush()
+
+    def set_validators(self, path, validators: Validators):
+        self._validators[path] = validators
+        if len(self._validators) >= self._flush_size:
+            self.flush()
+
+    def validators(self, path) -> Optional[Validators]:
+        if path in self._validators:
+            return self._validators[path]
+        row = self._connection.execute(
+            'SELECT etag, last_modified, content_length FROM photos '
+            'WHERE path = ? LIMIT 1', (path, )).fetchone()
+        if row is None or row == (None, None, None):
+            return None
+        return Validators(*row)
+
+    def flush(self):
+        if not self._pending and not self._updates and not self._validators:
+            return
+        now = time.time()
+        with self._connection:
+            # Pending rows first - updates may refer to them by the path
+            self._connection.executemany(
+                'UPDATE photos SET path = ?, updated = ? '
+                'WHERE source = ? AND url = ?',
+                ((path, now, source, url)
+                 for source, url, path, _ in self._pending))
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO photos '
+                '(source, url, path, owner_id, status, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                ((source, url, path, owner_id, ManifestStatus.PENDING.value,
+                  now) for source, url, path, owner_id in self._pending))
+            self._connection.executemany(
+                'UPDATE photos SET etag = ?, last_modified = ?, '
+                'content_length = ? WHERE path = ?',
+                (tuple(validators) + (path, )
+                 for path, validators in self._validators.items()))
+            self._connection.executemany(
+                'UPDATE photos SET status = ?, size = ?, '
+                'attempts = attempts + ?, updated = ?, lease_owner = NULL, '
+                'lease_expires = NULL WHERE path = ?', self._updates)
+        self._pending.clear()
+        self._updates.clear()
+        self._validators.clear()
+
+    def requeue_failed(self) -> int:
+        """Failed photos go back to the pending ones."""
+        self.flush()
+        with self._connection:
+            cursor = self._connection.execute(
+                'UPDATE photos SET status = ?, lease_owner = NULL, '
+                'lease_expires = NULL WHERE status = ?',
+                (ManifestStatus.PENDING.value, ManifestStatus.FAILED.value))
+        return cursor.rowcount
+
+    def move_folder(self, source, target):
+        """Files of the source folder were moved into the target one."""
+        self.flush()
+        # The range instead of LIKE - the path index is used
+        with self._connection:
+            self._connection.execute(
+                'UPDATE photos SET path = ? || substr(path, ?) '
+                'WHERE path >= ? AND path < ?',
+                (target, len(source) + 1, source + os.sep,
+                 source + chr(ord(os.sep) + 1)))
+
+    def claim(self, owner: str, count: int, lease: float) -> List[Row]:
+        """Lease up to count pending photos for lease seconds.
+
+        Photos with an expired lease (of a crashed worker) are claimed as
+        well as the free ones.
+        """
+        self.flush()
+        now = time.time()
+        with self._connection:
+            # The write lock at once - two workers can't select the same rows
+            self._connection.execute('BEGIN IMMEDIATE')
+            rows = self._connection.execute(
+                'SELECT rowid, source, url, path, owner_id, lease_expires '
+                'FROM photos WHERE status = ? AND (lease_expires IS NULL '
+                'OR lease_expires < ?) LIMIT ?',
+                (ManifestStatus.PENDING.value, now, count)).fetchall()
+            self._connection.executemany(
+                'UPDATE photos SET lease_owner = ?, lease_expires = ? '
+                'WHERE rowid = ?',
+                ((owner, now + lease, row[0]) for row in rows))
+        reclaimed = sum(row[5] is not None for row in rows)
+        if reclaimed:
+            metrics.count('queue.reclaimed', reclaimed)
+            _msg = f'{reclaimed} photos of expired leases are claimed again'
+            logging.warning(_msg)
+        metrics.count('queue.claimed', len(rows))
+        return [row[1:5] for row in rows]
+
+    def renew(self, owner: str, lease: float):
+        """Extend the leases of the pending photos of the owner."""
+        self.flush()
+        with self._connection:
+            self._connection.execute(
+                'UPDATE photos SET lease_expires = ? WHERE lease_owner = ? '
+                'AND status = ?',
+                (time.time() + lease, owner, ManifestStatus.PENDING.value))
+
+    def release(self, owner: str):
+        """Give the not finished photos of the owner back to the queue."""
+        self.flush()
+        with self._connection:
+            self._connection.execute(
+                'UPDATE photos SET lease_owner = NULL, lease_expires = NULL '
+                'WHERE lease_owner = ?', (owner, ))
+
+    def next_lease_expiry(self, owner: str) -> Optional[float]:
+        """The nearest expiry of the leases held by the other workers."""
+        cursor = self._connection.execute(
+            'SELECT MIN(lease_expires) FROM photos WHERE status = ? AND '
+            'lease_expires >= ? AND lease_owner != ?',
+            (ManifestStatus.PENDING.value, time.time(), owner))
+        return cursor.fetchone()[0]
+
+    def summary(self) -> Dict[str, int]:
+        self.flush()
+        cursor = self._connection.execute(
+            'SELECT status, COUNT(*) FROM photos GROUP BY status')
+        summary = {status.value: 0 for status in ManifestStatus}
+        summary.update(dict(cursor))
+        return summary
+
+    def log_summary(self):
+        summary = self.summary()
+        _msg = (f'Manifest {self._db_path}: '
+                f'{summary[ManifestStatus.DONE.value]} done, '
+                f'{summary[ManifestStatus.FAILED.value]} failed, '
+                f'{summary[ManifestStatus.PENDING.value]} pending')
+        logging.info(_msg)
+
+    def close(self):
+        self.flush()
+        self._connection.close()
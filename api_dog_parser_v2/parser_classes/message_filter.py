@@ -0,0 +1,59 @@
+from typing import FrozenSet, Iterable, Iterator, NamedTuple, Optional
+
+
+class MessageFilter(NamedTuple):
+    """Prefilter of the parsing.
+
+    since / until - unix time window [since, until) of the dialog messages
+    (forwarded ones go with their message), owner_ids - owners of the
+    photos to keep. None - no limit. date_ordered - the messages are
+    declared to be ordered by date, so the window is cut w/o reading the
+    rest of the dialog.
+    """
+    since: Optional[int] = None
+    until: Optional[int] = None
+    owner_ids: Optional[FrozenSet[int]] = None
+    date_ordered: bool = False
+
+    @property
+    def has_window(self):
+        return self.since is not None or self.until is not None
+
+    @property
+    def cache_key(self) -> str:
+        if not self.has_window and self.owner_ids is None:
+            return ''
+        owner_ids = ','.join(map(str, sorted(self.owner_ids or ())))
+        return f'{self.since}-{self.until}-{owner_ids}'
+
+    def iter_window(self, messages: Iterable[dict]) -> Iterator[dict]:
+        """Yield the messages of the window.
+
+        Only the declared order stops the iteration at the first message
+        past the far end of the window - a few ordered dates at the start
+        don't mean the whole dialog is ordered.
+        """
+        since = self.since
+        until = self.until
+        direction = 0 if self.date_ordered else None
+        previous = None
+        for message in messages:
+            date = message.get('date', 0)
+            if (direction is not None and previous is not None
+                    and date != previous):
+                step = 1 if date > previous else -1
+                if not direction:
+                    direction = step
+                elif step != direction:
+                    # Not ordered in fact - filter up to the end
+                    direction = None
+            previous = date
+            if since is not None and date < since:
+                if direction == -1:
+                    return
+                continue
+            if until is not None and date >= until:
+                if direction == 1:
+                    return
+                continue
+            yield message
@@ -0,0 +1,255 @@
+import contextlib
+import cProfile
+import io
+import json
+import logging
+import math
+import pstats
+import threading
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import aiohttp
+
+# Stages for --profile
+STAGES = ('discovery', 'parse', 'names', 'filter', 'download')
+# Histogram buckets per octave (the error of a percentile is < 19%)
+_BUCKETS_PER_OCTAVE = 4
+_MIN_SECONDS = 1e-6
+
+# hook(name, kind, value) - kind is 'counter' (value - increment) or
+# 'timing' (value - seconds)
+Hook = Callable[[str, str, float], None]
+
+
+class Histogram:
+    """Timing histogram with the log buckets."""
+    __slots__ = ('count', 'total', 'min', 'max', '_buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self._buckets: Dict[int, int] = {}
+
+    @staticmethod
+    def _bucket(seconds: float) -> int:
+        if seconds <= _MIN_SECONDS:
+            return 0
+        return int(math.log2(seconds / _MIN_SECONDS) * _BUCKETS_PER_OCTAVE)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        bucket = self._bucket(seconds)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+    def percentile(self, share: float) -> float:
+        """Upper bound of the bucket with the share of the values."""
+        if not self.count:
+            return 0.0
+        rank = share * self.count
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                upper = _MIN_SECONDS * 2**((bucket + 1) / _BUCKETS_PER_OCTAVE)
+                return min(self.max, max(self.min, upper))
+        return self.max
+
+    def merge(self, state: dict):
+        self.count += state['count']
+        self.total += state['total']
+        self.min = min(self.min, state['min'])
+        self.max = max(self.max, state['max'])
+        for bucket, count in state['buckets'].items():
+            bucket = int(bucket)
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+
+    def state(self) -> dict:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict(self._buckets),
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+        }
+
+
+class Metrics:
+    """Counters and timing histograms of the run stages (thread-safe).
+
+    Hooks get every event, so the numbers can be sent to the own
+    monitoring. A stage set with set_profile is run under cProfile.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Histogram] = {}
+        self._hooks: List[Hook] = []
+        self._profile_stage: Optional[str] = None
+        self._profiler: Optional[cProfile.Profile] = None
+
+    def add_hook(self, hook: Hook):
+        self._hooks.append(hook)
+
+    def remove_hook(self, hook: Hook):
+        self._hooks.remove(hook)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+        for hook in self._hooks:
+            hook(name, 'counter', value)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._timings.get(name)
+            if histogram is None:
+                histogram = self._timings[name] = Histogram()
+            histogram.add(seconds)
+        for hook in self._hooks:
+            hook(name, 'timing', seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def set_profile(self, stage: Optional[str]):
+        self._profile_stage = stage
+        self._profiler = cProfile.Profile() if stage else None
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Time the stage (stage.<name>), profile it if it's chosen."""
+        profiler = self._profiler if name == self._profile_stage else None
+        if profiler:
+            profiler.enable()
+        try:
+            with self.timer(f'stage.{name}'):
+                yield
+        finally:
+            if profiler:
+                profiler.disable()
+
+    def iter_stage(self, name: str, iterable: Iterable) -> Iterator:
+        """Iterate under the stage: only the time in the iterable counts."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def dump_profile(self, path: str, top: int = 25):
+        if not self._profiler:
+            return
+        self._profiler.dump_stats(path)
+        output = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=output)
+        stats.sort_stats('cumulative').print_stats(top)
+        _msg = (f'Profile of the {self._profile_stage} stage is saved to '
+                f'{path}\n{output.getvalue()}')
+        logging.info(_msg)
+
+    def pop_state(self) -> dict:
+        """Take the collected numbers (a worker process sends them)."""
+        with self._lock:
+            state = {
+                'counters': self._counters,
+                'timings': {
+                    name: histogram.state()
+                    for name, histogram in self._timings.items()
+                },
+            }
+            self._counters = {}
+            self._timings = {}
+        return state
+
+    def merge(self, state: dict):
+        for name, value in state['counters'].items():
+            self.count(name, value)
+        with self._lock:
+            for name, histogram_state in state['timings'].items():
+                histogram = self._timings.get(name)
+                if histogram is None:
+                    histogram = self._timings[name] = Histogram()
+                histogram.merge(histogram_state)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'counters': dict(sorted(self._counters.items())),
+                'timings': {
+                    name: histogram.to_dict()
+                    for name, histogram in sorted(self._timings.items())
+                },
+            }
+
+    def write_json(self, path: str):
+        try:
+            with open(path, 'w', encoding='utf-8') as fp:
+                json.dump(self.to_dict(), fp, indent=2)
+        except OSError as exp:
+            _msg = f'Stats were not saved to {path} - {exp}'
+            logging.warning(_msg)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Split of the request latency: connect (new connections only)
+        and first byte (request start -> response headers)."""
+        async def on_request_start(_session, context: SimpleNamespace,
+                                   _params):
+            context.start = time.perf_counter()
+
+        async def on_connection_create_start(_session,
+                                             context: SimpleNamespace,
+                                             _params):
+            context.connect_start = time.perf_counter()
+
+        async def on_connection_create_end(_session, context: SimpleNamespace,
+                                           _params):
+            self.observe('http.connect',
+                         time.perf_counter() - context.connect_start)
+
+        async def on_connection_reuseconn(_session, _context, _params):
+            self.count('http.connection_reused')
+
+        async def on_request_end(_session, context: SimpleNamespace,
+                                 _params):
+            self.observe('http.first_byte',
+                         time.perf_counter() - context.start)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_start.append(
+            on_connection_create_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+
+# Shared registry of the process
+metrics = Metrics()
@@ -0,0 +1,90 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Union
+
+
+def default_cache_dir():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'api_dog_parser_v2')
+
+
+def default_cache_path():
+    return os.path.join(default_cache_dir(), 'names.json')
+
+
+class NameCache:
+    """VK id -> folder name cache stored in the JSON file.
+
+    Entries older than ttl seconds are ignored, the oldest entries are
+    evicted when there are more than max_size of them.
+    """
+    def __init__(self,
+                 path: Optional[str] = None,
+                 ttl: float = 30 * 24 * 3600,
+                 max_size: int = 100000):
+        self._path = path or default_cache_path()
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries: Dict[int, List[Union[str, float]]] = self._load()
+        self._changed = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with open(self._path, 'r', encoding='utf-8') as fp:
+                raw_entries = json.load(fp)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exp:
+            _msg = f'Name cache {self._path} is ignored - {exp}'
+            logging.warning(_msg)
+            return {}
+        return {int(vk_id): entry for vk_id, entry in raw_entries.items()}
+
+    def get(self, vk_id: int) -> Optional[str]:
+        entry = self._entries.get(vk_id)
+        if entry is None:
+            return None
+        name, timestamp = entry
+        if time.time() - timestamp > self._ttl:
+            return None
+        return name
+
+    def set(self, vk_id: int, name: str):
+        self._entries[vk_id] = [name, time.time()]
+        self._changed = True
+
+    def _evict(self):
+        if len(self._entries) <= self._max_size:
+            return
+        now = time.time()
+        entries = sorted(
+            ((vk_id, entry) for vk_id, entry in self._entries.items()
+             if now - entry[1] <= self._ttl),
+            key=lambda item: item[1][1])
+        self._entries = dict(entries[-self._max_size:])
+
+    def save(self):
+        if not self._changed:
+            return
+        self._evict()
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)),
+                    exist_ok=True)
+        tmp_path = f'{self._path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fp:
+                json.dump({str(vk_id): entry
+                           for vk_id, entry in self._entries.items()},
+                          fp,
+                          ensure_ascii=False)
+            os.replace(tmp_path, self._path)
+        except OSError as exp:
+            _msg = f'Name cache {self._path} was not saved - {exp}'
+            logging.warning(_msg)
+            return
+        self._changed = False
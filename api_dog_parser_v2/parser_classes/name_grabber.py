@@ -1,56 +1,139 @@
 import asyncio
 import logging
-from typing import Tuple, Match, List, Union
+import time
+from typing import Tuple, Match, List, Union, Optional, Dict
 
 import aiohttp
 from tqdm import tqdm
 
-from api_dog_parser_v2.constants_and_enum import TITLE_RE
+from api_dog_parser_v2.constants_and_enum import TITLE_RE, VK_PROFILE_URL
+from api_dog_parser_v2.parser_classes.http_session import (PoolSettings,
+                                                           create_session)
+from api_dog_parser_v2.parser_classes.metrics import metrics
+from api_dog_parser_v2.parser_classes.name_cache import NameCache
+
+
+class RateLimiter:
+    """Spread request starts: not more than `rate` requests per second."""
+    def __init__(self, rate: float = 0):
+        self._interval = 1 / rate if rate else 0
+        self._next_time = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def wait(self):
+        if not self._interval:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            delay = self._next_time - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_time = time.monotonic() + self._interval
 
 
 class NameGrabber:
-    def __init__(self, name_grabber_limiter):
+    def __init__(self,
+                 name_grabber_limiter,
+                 pool_settings: Optional[PoolSettings] = None,
+                 name_cache: Optional[NameCache] = None,
+                 rate: float = 0,
+                 profile_url: str = VK_PROFILE_URL,
+                 progress: bool = True):
         self._name_grabber_semaphore = asyncio.Semaphore(name_grabber_limiter)
+        self._pool_settings = pool_settings
+        self._name_cache = name_cache
+        self._rate_limiter = RateLimiter(rate)
+        self._profile_url = profile_url
+        self._progress = progress
 
     @staticmethod
-    async def _parse(vk_id: int, session: aiohttp.ClientSession,
-                     tqdm_: tqdm) -> Tuple[int, str]:
-        url = f'https://m.vk.com/id{vk_id}'
+    def _name_from_html(vk_id: int, html: str) -> str:
+        str_vk_id = str(vk_id)
+        title: Match = TITLE_RE.search(html)
+        if not title:
+            return str_vk_id
+        str_title = title.group(1).split('|')[0].strip()
+        if str_title.lower() in ('ВКонтакте'.lower(), 'VK'.lower()):
+            return str_vk_id
+        return f'{vk_id} ({str_title})'
+
+    async def _fetch_name(self, vk_id: int,
+                          session: aiohttp.ClientSession) -> str:
+        url = self._profile_url.format(vk_id=vk_id)
+        async with self._name_grabber_semaphore:
+            await self._rate_limiter.wait()
+            with metrics.timer('names.request'):
+                async with session.get(url) as request:
+                    # The title of an error page isn't a name
+                    request.raise_for_status()
+                    html = await request.text()
+        return self._name_from_html(vk_id, html)
+
+    async def _parse(self, vk_id: int, session: aiohttp.ClientSession,
+                     tqdm_: Optional[tqdm]) -> Tuple[int, str]:
         str_vk_id = str(vk_id)
-        async with session.get(url) as request:
-            try:
-                html = await request.text()
-                title: Match = TITLE_RE.search(html)
-                if not title:
-                    return vk_id, str_vk_id
-                str_title = title.group(1).split('|')[0].strip()
-                if str_title.lower() in ('ВКонтакте'.lower(), 'VK'.lower()):
-                    return vk_id, str_vk_id
-                return vk_id, f'{vk_id} ({str_title})'
-
-            except aiohttp.ClientError:
-                return vk_id, str_vk_id
-            except Exception as e:  # pylint: disable=broad-except
-                msg_ = (f'Exception while trying to get name for {vk_id}'
-                        f' - {e}')
-                logging.exception(msg_)
-                return vk_id, str_vk_id
-            finally:
+        try:
+            if self._name_cache is not None:
+                name = self._name_cache.get(vk_id)
+                if name is not None:
+                    metrics.count('names.cached')
+                    return vk_id, name
+            name = await self._fetch_name(vk_id, session)
+            # The bare id (no name on the page) isn't cached - the next
+            # run will try again
+            if self._name_cache is not None and name != str_vk_id:
+                self._name_cache.set(vk_id, name)
+            return vk_id, name
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exp:
+            # Not cached - the next run will try again
+            metrics.count('names.failed')
+            msg_ = (f'Name of {vk_id} was not got - '
+                    f'{type(exp).__name__} {exp}')
+            logging.warning(msg_)
+            return vk_id, str_vk_id
+        except Exception as e:  # pylint: disable=broad-except
+            msg_ = (f'Exception while trying to get name for {vk_id}'
+                    f' - {e}')
+            logging.exception(msg_)
+            return vk_id, str_vk_id
+        finally:
+            if tqdm_ is not None:
                 tqdm_.update()
 
-    async def _bulk_crawl(self, id_list: list) -> None:
-        async with self._name_grabber_semaphore, aiohttp.ClientSession(
-        ) as session:
-            logging.info('Getting VK real names')
-            tqdm_ = tqdm(total=len(id_list))
-            tasks = [
-                self._parse(vk_id=int(vk_id), session=session, tqdm_=tqdm_)
-                for vk_id in id_list
-            ]
-            results = await asyncio.gather(*tasks)
+    async def _bulk_crawl(self, id_list: list,
+                          session: aiohttp.ClientSession) -> None:
+        logging.info('Getting VK real names')
+        tqdm_ = tqdm(total=len(id_list), disable=not self._progress)
+        tasks = [
+            self._parse(vk_id=int(vk_id), session=session, tqdm_=tqdm_)
+            for vk_id in id_list
+        ]
+        results = await asyncio.gather(*tasks)
+        tqdm_.close()
         return results
 
-    def bulk_crawl(self, id_list: List[Union[str, int]]):
-        result = asyncio.get_event_loop().run_until_complete(
-            self._bulk_crawl(id_list))
-        return dict(result)
+    async def get_name(self, vk_id: Union[str, int],
+                       session: aiohttp.ClientSession,
+                       tqdm_: Optional[tqdm] = None) -> str:
+        """Get a name for the single id (used by the pipeline mode)."""
+        _, name = await self._parse(int(vk_id), session, tqdm_)
+        return name
+
+    def save_cache(self):
+        if self._name_cache is not None:
+            self._name_cache.save()
+
+    async def crawl(
+            self,
+            id_list: List[Union[str, int]],
+            session: Optional[aiohttp.ClientSession] = None
+    ) -> Dict[int, str]:
+        """Get names using the shared session (own session if it's None)."""
+        if session is None:
+            async with create_session(self._pool_settings) as own_session:
+                return await self.crawl(id_list, own_session)
+        try:
+            return dict(await self._bulk_crawl(id_list, session))
+        finally:
+            self.save_cache()
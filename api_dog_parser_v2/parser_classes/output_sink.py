@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+import logging
+import os
+import shutil
+import tarfile
+import time
+import zipfile
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+_BLOCK_SIZE = tarfile.BLOCKSIZE
+_END_OF_ARCHIVE = b'\0' * (_BLOCK_SIZE * 2)
+
+
+class DirectorySink:
+    """Default output: every photo is a file of the directory layout.
+
+    Downloads are written into part_name(path) and handed over with
+    commit, so the sink decides where the complete photo is stored.
+    resumable - the part name of a path is the same in every run, so the
+    part of an interrupted download is resumed by the next one.
+    """
+    resumable = True
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        pass
+
+    def exists(self, path) -> bool:
+        return os.path.isfile(path) and bool(os.path.getsize(path))
+
+    def size(self, path) -> int:
+        return os.path.getsize(path)
+
+    def part_name(self, path) -> str:
+        return f'{path}.part'
+
+    async def commit(self, part_name, path):
+        os.replace(part_name, path)
+
+
+class ArchiveSink(DirectorySink):
+    """Photos are appended to archives by a single writer task.
+
+    One archive per dialog (``<dialog folder>.<ext>``, members are
+    ``owner folder/file``) or per owner (``<dialog folder>/<owner
+    folder>.<ext>``). Downloads are spooled into .part files near the
+    archive, the skip check uses the member index of the archive.
+    """
+    extension = ''
+    # Part names are unique per process
+    resumable = False
+
+    def __init__(self, per_owner: bool = False):
+        self._per_owner = per_owner
+        self._indexes: Dict[str, Dict[str, int]] = {}
+        self._counter = itertools.count()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Future] = None
+        self.member_count = 0
+
+    async def __aenter__(self):
+        self._queue = asyncio.Queue()
+        self._writer = asyncio.ensure_future(self._write_loop())
+        return self
+
+    async def __aexit__(self, *_):
+        await self._queue.put(None)
+        await self._writer
+        self._close_archives()
+        if self.member_count:
+            _msg = (f'{self.member_count} photos were written into '
+                    f'{len(self._indexes)} {self.extension} archives')
+            logging.info(_msg)
+
+    def _locate(self, path) -> Tuple[str, str]:
+        owner_folder, file_name = os.path.split(path)
+        if self._per_owner:
+            return f'{owner_folder}{self.extension}', file_name
+        dialog_folder, owner_name = os.path.split(owner_folder)
+        archive = f'{dialog_folder.rstrip(os.sep)}{self.extension}'
+        return archive, f'{owner_name}/{file_name}'
+
+    def _index(self, archive) -> Dict[str, int]:
+        if archive not in self._indexes:
+            self._indexes[archive] = self._load_index(archive)
+        return self._indexes[archive]
+
+    def exists(self, path) -> bool:
+        archive, member = self._locate(path)
+        return bool(self._index(archive).get(member))
+
+    def size(self, path) -> int:
+        archive, member = self._locate(path)
+        return self._index(archive).get(member, 0)
+
+    def part_name(self, path) -> str:
+        archive, _ = self._locate(path)
+        return f'{archive}.{os.getpid()}-{next(self._counter)}.part'
+
+    async def commit(self, part_name, path):
+        # The index is loaded here, in the loop thread - the writer thread
+        # only updates it
+        self._index(self._locate(path)[0])
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((part_name, path, future))
+        await future
+
+    async def _write_loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            part_name, path, future = item
+            if future.cancelled():
+                continue
+            try:
+                await loop.run_in_executor(None, self._write, part_name,
+                                           path)
+            except OSError as exp:
+                if not future.done():
+                    future.set_exception(exp)
+            else:
+                if not future.done():
+                    future.set_result(None)
+
+    def _write(self, part_name, path):
+        archive, member = self._locate(path)
+        index = self._indexes[archive]
+        if not index.get(member):
+            size = os.path.getsize(part_name)
+            self._add(archive, member, part_name, size)
+            index[member] = size
+            self.member_count += 1
+        try:
+            os.remove(part_name)
+        except OSError:
+            pass
+
+    def _load_index(self, archive) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def _add(self, archive, member, part_name, size):
+        raise NotImplementedError
+
+    def _close_archives(self):
+        pass
+
+
+class TarSink(ArchiveSink):
+    """Uncompressed tar written member by member.
+
+    The end-of-archive blocks are rewritten after every member, so the
+    archive is valid whenever the run stops. A member cut by a crash is
+    dropped from the index and overwritten by the next run.
+    """
+    extension = '.tar'
+
+    def __init__(self, per_owner: bool = False):
+        super().__init__(per_owner)
+        self._ends: Dict[str, int] = {}
+
+    def _load_index(self, archive) -> Dict[str, int]:
+        index = {}
+        end = 0
+        try:
+            file_size = os.path.getsize(archive)
+        except OSError:
+            file_size = 0
+        if file_size:
+            try:
+                with tarfile.open(archive, 'r:') as tar:
+                    for member in tar:
+                        if member.offset_data + member.size > file_size:
+                            break
+                        index[member.name] = member.size
+                        end = member.offset_data + (
+                            -(-member.size // _BLOCK_SIZE) * _BLOCK_SIZE)
+            except tarfile.ReadError as exp:
+                _msg = f'{archive} is read up to {end} byte - {exp}'
+                logging.warning(_msg)
+        self._ends[archive] = end
+        return index
+
+    def _add(self, archive, member, part_name, size):
+        info = tarfile.TarInfo(member)
+        info.size = size
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        os.makedirs(os.path.dirname(archive) or '.', exist_ok=True)
+        mode = 'r+b' if os.path.exists(archive) else 'wb'
+        with open(archive, mode) as fp, open(part_name, 'rb') as part:
+            fp.seek(self._ends[archive])
+            fp.write(
+                info.tobuf(tarfile.PAX_FORMAT, 'utf-8', 'surrogateescape'))
+            shutil.copyfileobj(part, fp)
+            fp.write(b'\0' * (-size % _BLOCK_SIZE))
+            self._ends[archive] = fp.tell()
+            fp.write(_END_OF_ARCHIVE)
+            fp.truncate()
+
+
+class ZipSink(ArchiveSink):
+    """Zip with the stored (not compressed) members.
+
+    The central directory is written on close, the last archives are kept
+    open. A zip broken by a crash is renamed to .broken and started over.
+    """
+    extension = '.zip'
+    max_open = 32
+
+    def __init__(self, per_owner: bool = False):
+        super().__init__(per_owner)
+        self._open: 'OrderedDict[str, zipfile.ZipFile]' = OrderedDict()
+
+    def _load_index(self, archive) -> Dict[str, int]:
+        if not os.path.exists(archive):
+            return {}
+        try:
+            with zipfile.ZipFile(archive) as zip_file:
+                return {
+                    info.filename: info.file_size
+                    for info in zip_file.infolist()
+                }
+        except zipfile.BadZipFile as exp:
+            broken_name = f'{archive}.broken'
+            os.replace(archive, broken_name)
+            _msg = f'{archive} is broken ({exp}), moved to {broken_name}'
+            logging.warning(_msg)
+            return {}
+
+    def _zip_file(self, archive) -> zipfile.ZipFile:
+        if archive in self._open:
+            self._open.move_to_end(archive)
+            return self._open[archive]
+        while len(self._open) >= self.max_open:
+            _, zip_file = self._open.popitem(last=False)
+            zip_file.close()
+        os.makedirs(os.path.dirname(archive) or '.', exist_ok=True)
+        # Kept open for the next photos, closed by the LRU or on exit
+        zip_file = zipfile.ZipFile(  # pylint: disable=consider-using-with
+            archive, 'a', zipfile.ZIP_STORED)
+        self._open[archive] = zip_file
+        return zip_file
+
+    def _add(self, archive, member, part_name, size):
+        self._zip_file(archive).write(part_name, member)
+
+    def _close_archives(self):
+        while self._open:
+            _, zip_file = self._open.popitem()
+            zip_file.close()
+
+
+def create_sink(kind: str = 'dir', per_owner: bool = False) -> DirectorySink:
+    if kind == 'tar':
+        return TarSink(per_owner)
+    if kind == 'zip':
+        return ZipSink(per_owner)
+    return DirectorySink()
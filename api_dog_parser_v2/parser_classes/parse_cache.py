@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import zlib
+from typing import Optional
+
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.message_filter import MessageFilter
+from api_dog_parser_v2.parser_classes.metrics import metrics
+from api_dog_parser_v2.parser_classes.name_cache import default_cache_dir
+from api_dog_parser_v2.parser_classes.photo_store import PhotoStore
+from api_dog_parser_v2.parser_classes.single_parser import ParsedDialog
+
+# marshal format depends on the interpreter version
+_FORMAT = f'2-{sys.version_info[0]}.{sys.version_info[1]}'
+
+
+def default_parse_cache_dir():
+    return os.path.join(default_cache_dir(), 'parsed')
+
+
+class ParseCache:
+    """Per-file cache of the extracted photos (zlib-compressed marshal).
+
+    An entry is valid while path, size, mtime (and the content hash if
+    use_hash is set) of the JSON are the same. Every grabbing filter and
+    message filter has its own entry.
+    """
+    def __init__(self,
+                 cache_dir: Optional[str] = None,
+                 use_hash: bool = False):
+        self._cache_dir = cache_dir or default_parse_cache_dir()
+        self._use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self._cache_dir, exist_ok=True)
+
+    @staticmethod
+    def _content_hash(file):
+        digest = hashlib.sha1()
+        with open(file, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(2**20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _fingerprint(self, file):
+        stat = os.stat(file)
+        return (_FORMAT, os.path.abspath(file), stat.st_size, stat.st_mtime_ns,
+                self._content_hash(file) if self._use_hash else None)
+
+    def _entry_path(self, file, grabbing_filter: GrabbingFilter,
+                    message_filter: Optional[MessageFilter]):
+        key = f'{os.path.abspath(file)}\0{grabbing_filter.value}'
+        if message_filter and message_filter.cache_key:
+            key = f'{key}\0{message_filter.cache_key}'
+        return os.path.join(self._cache_dir,
+                            hashlib.sha1(key.encode()).hexdigest() + '.bin')
+
+    def get(
+        self,
+        file,
+        grabbing_filter: GrabbingFilter,
+        message_filter: Optional[MessageFilter] = None
+    ) -> Optional[ParsedDialog]:
+        entry_path = self._entry_path(file, grabbing_filter, message_filter)
+        try:
+            with open(entry_path, 'rb') as fp:
+                fingerprint, file_key, columns, id_collection = marshal.loads(
+                    zlib.decompress(fp.read()))
+            if fingerprint != self._fingerprint(file):
+                raise ValueError('outdated')
+            photos = PhotoStore.from_columns(columns)
+        except (OSError, ValueError, TypeError, EOFError, zlib.error):
+            self.misses += 1
+            metrics.count('parse_cache.misses')
+            return None
+        self.hits += 1
+        metrics.count('parse_cache.hits')
+        return ParsedDialog(file_key, photos, id_collection)
+
+    def put(self,
+            file,
+            grabbing_filter: GrabbingFilter,
+            parsed_dialog: ParsedDialog,
+            message_filter: Optional[MessageFilter] = None):
+        entry_path = self._entry_path(file, grabbing_filter, message_filter)
+        tmp_path = f'{entry_path}.tmp'
+        try:
+            data = marshal.dumps(
+                (self._fingerprint(file), parsed_dialog.file_key,
+                 parsed_dialog.photos.columns(), parsed_dialog.id_collection))
+            with open(tmp_path, 'wb') as fp:
+                fp.write(zlib.compress(data, 1))
+            os.replace(tmp_path, entry_path)
+        except (OSError, ValueError) as exp:
+            _msg = f'Parse cache for {file} was not saved - {exp}'
+            logging.warning(_msg)
+
+    def log_stats(self):
+        if self.hits or self.misses:
+            _msg = (f'Parse cache: {self.hits} files loaded from the cache, '
+                    f'{self.misses} parsed')
+            logging.info(_msg)
@@ -1,15 +1,36 @@
 import logging
+import multiprocessing
 import os
-from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from api_dog_parser_v2.constants_and_enum import VERIFY_FILE_HEAD, GrabbingFilter
-from api_dog_parser_v2.parser_classes.single_parser import SingleDialogParser
+from tqdm import tqdm
+
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.discovery import verify_file
+from api_dog_parser_v2.parser_classes.message_filter import MessageFilter
+from api_dog_parser_v2.parser_classes.metrics import metrics
+from api_dog_parser_v2.parser_classes.parse_cache import ParseCache
+from api_dog_parser_v2.parser_classes.photo_store import (PhotoRecord,
+                                                          PhotoStore)
+from api_dog_parser_v2.parser_classes.single_parser import (SingleDialogParser,
+                                                            ParsedDialog,
+                                                            parse_file)
+from api_dog_parser_v2.parser_classes.watch_state import MessageMark
+
+
+def _parse_in_worker(*args) -> Tuple[ParsedDialog, dict]:
+    """parse_file for the pool, the metrics of the worker go back too."""
+    return parse_file(*args), metrics.pop_state()
 
 
 class ParserManager:
-    def __init__(self, folder_with_json):
+    def __init__(self, folder_with_json, files: Optional[List[str]] = None):
+        """files - already verified JSON files of the folder (discovery),
+        the folder is listed if they aren't set."""
         self._folder_with_json = folder_with_json
-        self._files = self._filter_folder_files()
+        self._files = (self._filter_folder_files()
+                       if files is None else files)
         abspath = os.path.abspath(folder_with_json)
         file_count = len(self._files)
         file_substring = (('is', '', 'was') if file_count == 1 else
@@ -22,10 +43,12 @@ class ParserManager:
         else:
             _msg = f'No allowed JSON files in the {abspath}'
         logging.info(_msg)
-        self._parsed_data: Dict[str, List[SingleDialogParser]] = {
+        self._parsed_data: Dict[str, List[Union[SingleDialogParser,
+                                                ParsedDialog]]] = {
             'path': abspath,
             'url_data': [],
         }
+        self._last_messages: Dict[str, MessageMark] = {}
 
     @property
     def id_collection(self):
@@ -34,12 +57,17 @@ class ParserManager:
             id_collection |= parser.id_collection
         return id_collection
 
+    @property
+    def files(self):
+        return self._files
+
     @property
     def is_contain_files(self):
         return bool(self._files)
 
     @property
-    def data_dict(self):
+    def data_dict(self) -> Dict[str, Union[str, Dict[str, PhotoStore]]]:
+        # The stores are shared, not copied
         url_data = {}
         for parser in self._parsed_data['url_data']:
             url_data.update(parser.data_dict)
@@ -47,30 +75,33 @@ class ParserManager:
 
     @property
     def has_content(self):
-        return bool(sum(self.data_dict.get('url_data', {}).values(), []))
+        return any(
+            parser.photos for parser in self._parsed_data['url_data'])
 
-    @staticmethod
-    def _verify_file(file):
-        if not os.path.isfile(file):
-            return None
-        try:
-            with open(file, mode='r', encoding='utf-8') as fp:
-                file_head = fp.read(len(VERIFY_FILE_HEAD) + 1)
-                if VERIFY_FILE_HEAD in file_head:
-                    return file
-            return None
-        except OSError:
-            return None
-
-    def _add_parser(self, parser: SingleDialogParser):
+    @property
+    def last_messages(self) -> Dict[str, MessageMark]:
+        """Newest message of every parsed dialog (for the watch mode)."""
+        return self._last_messages
+
+    def _track_last_message(self, parser: Union[SingleDialogParser,
+                                                ParsedDialog]):
+        last_message = parser.last_message
+        if last_message is None:
+            return
+        current = self._last_messages.get(parser.dialog_key)
+        if current is None or last_message > current:
+            self._last_messages[parser.dialog_key] = last_message
+
+    def add_parser(self, parser: Union[SingleDialogParser, ParsedDialog]):
         self._parsed_data['url_data'].append(parser)
+        self._track_last_message(parser)
 
     def _filter_folder_files(self):
         folder = self._folder_with_json
         if not os.path.isdir(folder):
             return []
         files = [
-            self._verify_file(os.path.join(folder, file))
+            verify_file(os.path.join(folder, file))
             for file in os.listdir(folder) if file.endswith('.json')
         ]
         return [file for file in files if file]
@@ -83,14 +114,135 @@ class ParserManager:
             size /= 1024.0
         return "%.1f%s%s" % (size, 'Gi', suffix)
 
-    def parse_files(self, grabbing_filter: GrabbingFilter):
+    def parse_files(self,
+                    grabbing_filter: GrabbingFilter,
+                    streaming: bool = False,
+                    parse_cache: Optional[ParseCache] = None,
+                    marks: Optional[Dict[str, MessageMark]] = None,
+                    message_filter: Optional[MessageFilter] = None,
+                    json_backend: str = 'auto'):
         if not self.is_contain_files:
             return
 
         for file in self._files:
-            parser = SingleDialogParser(file, grabbing_filter=grabbing_filter)
-            self._add_parser(parser)
+            if parse_cache:
+                parsed_dialog = parse_cache.get(file, grabbing_filter,
+                                                message_filter)
+                if parsed_dialog is not None:
+                    self.add_parser(parsed_dialog)
+                    continue
             size = self.sizeof_fmt(os.path.getsize(file))
             msg_ = f'Parsing {file} [{size}]'
             logging.info(msg_)
-            parser.parse_messages()
+            with metrics.stage('parse'):
+                parser = SingleDialogParser(file,
+                                            grabbing_filter=grabbing_filter,
+                                            streaming=streaming,
+                                            marks=marks,
+                                            message_filter=message_filter,
+                                            json_backend=json_backend)
+                parser.parse_messages()
+            if parse_cache:
+                # The compact result only - the decoded JSON is released
+                parsed_dialog = parser.to_parsed_dialog()
+                parse_cache.put(file, grabbing_filter, parsed_dialog,
+                                message_filter)
+                self.add_parser(parsed_dialog)
+            else:
+                self.add_parser(parser)
+
+    def iter_photo_records(
+            self,
+            grabbing_filter: GrabbingFilter,
+            parse_cache: Optional[ParseCache] = None,
+            marks: Optional[Dict[str, MessageMark]] = None,
+            message_filter: Optional[MessageFilter] = None
+    ) -> Iterator[PhotoRecord]:
+        """Stream photo records for the pipeline.
+
+        Files are read with the streaming parser and nothing is kept,
+        so data_dict and id_collection stay empty.
+        """
+        abspath = self._parsed_data['path']
+        for file in self._files:
+            parsed_dialog = (parse_cache.get(
+                file, grabbing_filter, message_filter)
+                             if parse_cache else None)
+            if parsed_dialog is not None:
+                json_name = parsed_dialog.file_key
+                for photo in parsed_dialog.photos:
+                    yield PhotoRecord(abspath, json_name, *photo)
+                continue
+            parser = SingleDialogParser(file,
+                                        grabbing_filter=grabbing_filter,
+                                        streaming=True,
+                                        marks=marks,
+                                        message_filter=message_filter)
+            json_name = parser.file_key
+            photos = PhotoStore()
+            for photo in metrics.iter_stage('parse', parser.iter_photos()):
+                if parse_cache:
+                    photos.append(*photo)
+                yield PhotoRecord(abspath, json_name, *photo)
+            self._track_last_message(parser)
+            if parse_cache:
+                parse_cache.put(
+                    file, grabbing_filter,
+                    ParsedDialog(json_name, photos, parser.id_collection),
+                    message_filter)
+
+    @classmethod
+    def parse_files_parallel(
+            cls,
+            parsers: Iterable['ParserManager'],
+            grabbing_filter: GrabbingFilter,
+            jobs: int,
+            streaming: bool = False,
+            parse_cache: Optional[ParseCache] = None,
+            marks: Optional[Dict[str, MessageMark]] = None,
+            message_filter: Optional[MessageFilter] = None,
+            json_backend: str = 'auto') -> List['ParserManager']:
+        """Parse files of all the managers with a process pool.
+
+        Files are sent to the pool while the managers are produced (the
+        discovery may still be walking). Workers send back only the compact
+        ParsedDialog. Results are added in the same order as the sequential
+        parse_files does. Files from the parse cache don't go to the pool.
+        """
+        managers = []
+        tasks = []
+        # Not fork - the discovery threads may be running
+        with ProcessPoolExecutor(
+                max_workers=jobs,
+                mp_context=multiprocessing.get_context('spawn')) as executor:
+            for parser in parsers:
+                managers.append(parser)
+                for file in parser.files:
+                    parsed_dialog = (parse_cache.get(
+                        file, grabbing_filter, message_filter)
+                                     if parse_cache else None)
+                    tasks.append(
+                        (parser, file, parsed_dialog
+                         if parsed_dialog is not None else executor.submit(
+                             _parse_in_worker, file, grabbing_filter,
+                             streaming, marks, message_filter,
+                             json_backend)))
+            submitted = sum(
+                not isinstance(result, ParsedDialog) for *_, result in tasks)
+            _msg = f'Parsing {submitted} files with {jobs} processes'
+            logging.info(_msg)
+            for parser, file, result in tqdm(tasks):
+                if isinstance(result, ParsedDialog):
+                    parser.add_parser(result)
+                    continue
+                with metrics.stage('parse'):
+                    parsed_dialog, worker_metrics = result.result()
+                metrics.merge(worker_metrics)
+                size = cls.sizeof_fmt(os.path.getsize(file))
+                msg_ = f'Parsed {file} [{size}]'
+                logging.debug(msg_)
+                if parse_cache:
+                    parse_cache.put(file, grabbing_filter, parsed_dialog,
+                                    message_filter)
+                parser.add_parser(parsed_dialog)
+        return managers
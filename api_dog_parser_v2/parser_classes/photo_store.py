@@ -0,0 +1,104 @@
+from array import array
+from typing import Iterator, Tuple
+
+PhotoTuple = Tuple[int, int, str]
+
+
+class PhotoRecord:
+    """Single photo on its way from the parser to the downloader."""
+    __slots__ = ('root_path', 'json_name', 'owner_id', 'date', 'photo_url')
+
+    def __init__(self, root_path: str, json_name: str, owner_id: int,
+                 date: int, photo_url: str):
+        self.root_path = root_path
+        self.json_name = json_name
+        self.owner_id = owner_id
+        self.date = date
+        self.photo_url = photo_url
+
+
+class PhotoStore:
+    """Columnar storage of the dialog photos.
+
+    owner_id and date live in the int64 arrays, urls are kept as one utf-8
+    blob with the end offsets, so a photo costs its url bytes + 24 bytes
+    instead of a dict with three boxed values. The store is filled by the
+    parser and read by the downloader w/o copying.
+    """
+    __slots__ = ('_owner_ids', '_dates', '_urls', '_url_ends')
+
+    def __init__(self):
+        self._owner_ids = array('q')
+        self._dates = array('q')
+        self._urls = bytearray()
+        self._url_ends = array('Q')
+
+    def __len__(self):
+        return len(self._owner_ids)
+
+    def __bool__(self):
+        return bool(self._owner_ids)
+
+    def __eq__(self, other):
+        if not isinstance(other, PhotoStore):
+            return NotImplemented
+        return self.columns() == other.columns()
+
+    def append(self, owner_id: int, date: int, photo_url: str):
+        self._urls += photo_url.encode()
+        self._url_ends.append(len(self._urls))
+        self._owner_ids.append(owner_id)
+        self._dates.append(date)
+
+    def clear(self):
+        del self._owner_ids[:], self._dates[:], self._url_ends[:]
+        del self._urls[:]
+
+    def url(self, index: int) -> str:
+        start = self._url_ends[index - 1] if index else 0
+        return self._urls[start:self._url_ends[index]].decode()
+
+    def __getitem__(self, index: int) -> PhotoTuple:
+        if index < 0:
+            index += len(self)
+        return self._owner_ids[index], self._dates[index], self.url(index)
+
+    def __iter__(self) -> Iterator[PhotoTuple]:
+        start = 0
+        urls = self._urls
+        for owner_id, date, end in zip(self._owner_ids, self._dates,
+                                       self._url_ends):
+            yield owner_id, date, urls[start:end].decode()
+            start = end
+
+    def owner_id(self, index: int) -> int:
+        return self._owner_ids[index]
+
+    def columns(self) -> Tuple[bytes, bytes, bytes, bytes]:
+        """Raw columns - for marshal/pickle w/o per photo objects."""
+        return (self._owner_ids.tobytes(), self._dates.tobytes(),
+                bytes(self._urls), self._url_ends.tobytes())
+
+    def _load(self, columns: Tuple[bytes, bytes, bytes, bytes]):
+        owner_ids, dates, urls, url_ends = columns
+        self._owner_ids.frombytes(owner_ids)
+        self._dates.frombytes(dates)
+        self._urls += urls
+        self._url_ends.frombytes(url_ends)
+        if not len(self._owner_ids) == len(self._dates) == len(
+                self._url_ends):
+            raise ValueError('Broken photo store columns')
+
+    @classmethod
+    def from_columns(cls, columns: Tuple[bytes, bytes, bytes,
+                                         bytes]) -> 'PhotoStore':
+        store = cls()
+        store._load(columns)
+        return store
+
+    def __getstate__(self):
+        return self.columns()
+
+    def __setstate__(self, state):
+        self.__init__()
+        self._load(state)
@@ -0,0 +1,99 @@
+import csv
+import os
+import sys
+from json.encoder import encode_basestring
+from typing import Dict, List, TextIO, Tuple
+
+from api_dog_parser_v2.parser_classes.photo_store import PhotoRecord
+
+EXPORT_FORMATS = ('jsonl', 'csv', 'aria2')
+_BUFFER_SIZE = 2**20
+
+
+class _Writer:
+    def __init__(self, fp: TextIO):
+        self._fp = fp
+
+    def write(self, path: str, url: str, record: PhotoRecord):
+        raise NotImplementedError
+
+
+class JsonlWriter(_Writer):
+    def write(self, path, url, record):
+        # Strings are quoted by the C encoder, w/o the dumps machinery
+        self._fp.write(f'{{"path": {encode_basestring(path)}, '
+                       f'"url": {encode_basestring(url)}, '
+                       f'"owner_id": {record.owner_id}, '
+                       f'"date": {record.date}}}\n')
+
+
+class CsvWriter(_Writer):
+    def __init__(self, fp: TextIO):
+        super().__init__(fp)
+        self._writer = csv.writer(fp)
+        self._writer.writerow(('path', 'url', 'owner_id', 'date'))
+
+    def write(self, path, url, record):
+        self._writer.writerow((path, url, record.owner_id, record.date))
+
+
+class Aria2Writer(_Writer):
+    """Input file of aria2c (aria2c -i FILE)."""
+    def write(self, path, url, record):
+        self._fp.write(f'{url}\n  dir={os.path.dirname(path)}\n'
+                       f'  out={os.path.basename(path)}\n')
+
+
+_WRITERS = {'jsonl': JsonlWriter, 'csv': CsvWriter, 'aria2': Aria2Writer}
+
+
+class RecordExporter:
+    """Writers of the resolved records (target path, url, owner id, date).
+
+    targets - {format: path}, "-" is stdout. The records are written as
+    they come, nothing is kept. Files are written into .part ones and
+    renamed when the export is complete.
+    """
+    def __init__(self, targets: Dict[str, str]):
+        self._targets = targets
+        self._files: List[Tuple[TextIO, str]] = []
+        self._writers: List[_Writer] = []
+        self.count = 0
+
+    def __enter__(self):
+        try:
+            for export_format, path in self._targets.items():
+                self._writers.append(_WRITERS[export_format](
+                    self._open(path)))
+        except OSError as exp:
+            self.__exit__(type(exp), exp, None)
+            raise
+        return self
+
+    def _open(self, path) -> TextIO:
+        if path == '-':
+            return sys.stdout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Closed in __exit__
+        fp = open(  # pylint: disable=consider-using-with
+            f'{path}.part',
+            'w',
+            encoding='utf-8',
+            newline='',
+            buffering=_BUFFER_SIZE)
+        self._files.append((fp, path))
+        return fp
+
+    def __exit__(self, exc_type, exc, traceback):
+        sys.stdout.flush()
+        for fp, path in self._files:
+            fp.close()
+            if exc_type is None:
+                os.replace(f'{path}.part', path)
+            else:
+                os.remove(f'{path}.part')
+
+    def write(self, path: str, url: str, record: PhotoRecord):
+        for writer in self._writers:
+            writer.write(path, url, record)
+        self.count += 1
@@ -1,49 +1,162 @@
-import json
+import sys
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Set
 
 from tqdm.auto import tqdm
 
 from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.json_backends import load_json
+from api_dog_parser_v2.parser_classes.json_stream import DialogStream
+from api_dog_parser_v2.parser_classes.message_filter import MessageFilter
+from api_dog_parser_v2.parser_classes.metrics import metrics
+from api_dog_parser_v2.parser_classes.photo_store import (PhotoStore,
+                                                          PhotoTuple)
+from api_dog_parser_v2.parser_classes.watch_state import MessageMark
+
+
+class ParsedDialog:
+    """Compact parse result of a single dialog.
+
+    Photos are kept in the PhotoStore columns - it's cheap to send them
+    back from a worker process.
+    """
+    __slots__ = ('_file_key', '_photos', '_id_collection', '_dialog_key',
+                 '_last_message')
+
+    def __init__(self,
+                 file_key: str,
+                 photos: PhotoStore,
+                 id_collection: Set[int],
+                 dialog_key: Optional[str] = None,
+                 last_message: Optional[MessageMark] = None):
+        self._file_key = file_key
+        self._photos = photos
+        self._id_collection = id_collection
+        self._dialog_key = dialog_key
+        self._last_message = last_message
+
+    @property
+    def file_key(self):
+        return self._file_key
+
+    @property
+    def photos(self) -> PhotoStore:
+        return self._photos
+
+    @property
+    def data_dict(self) -> Dict[str, PhotoStore]:
+        return {self._file_key: self._photos}
+
+    @property
+    def id_collection(self):
+        return self._id_collection
+
+    @property
+    def dialog_key(self) -> Optional[str]:
+        return self._dialog_key
+
+    @property
+    def last_message(self) -> Optional[MessageMark]:
+        return self._last_message
 
 
 class SingleDialogParser:
-    def __init__(self, file, grabbing_filter: GrabbingFilter):
-        self._file_key = self._convert_file_name_to_key(file)
-        self._parsed_data = {self._file_key: []}
-        self._json_data: dict = self._parse_json(file)
+    def __init__(self,
+                 file,
+                 grabbing_filter: GrabbingFilter,
+                 streaming: bool = False,
+                 marks: Optional[Dict[str, MessageMark]] = None,
+                 message_filter: Optional[MessageFilter] = None,
+                 json_backend: str = 'auto'):
+        """marks - high-water marks of the watch mode, the messages up to
+        the mark of the dialog are skipped. json_backend - decoder of the
+        whole file (not used by the streaming parse)."""
+        self._file = file
+        self._file_key = sys.intern(self._convert_file_name_to_key(file))
+        self._photos = PhotoStore()
+        self._streaming = streaming
+        self._json_data: dict = ({} if streaming else self._parse_json(
+            file, json_backend))
         self._owner = None
         self._peer = None
         self._id_collection = set()
         self._message_data = []
         self._grabbing_filter = grabbing_filter
+        self._message_filter = message_filter or MessageFilter()
+        self._owner_ids = self._message_filter.owner_ids
+        self._marks = marks
+        self._dialog_key = None
+        self._last_message: Optional[MessageMark] = None
         self._parse_json_data()
 
     @property
-    def data_dict(self):
-        return self._parsed_data
+    def data_dict(self) -> Dict[str, PhotoStore]:
+        return {self._file_key: self._photos}
+
+    @property
+    def photos(self) -> PhotoStore:
+        return self._photos
 
     @property
     def id_collection(self):
         return self._id_collection
 
+    @property
+    def file_key(self):
+        return self._file_key
+
+    @property
+    def dialog_key(self) -> Optional[str]:
+        return self._dialog_key
+
+    @property
+    def last_message(self) -> Optional[MessageMark]:
+        return self._last_message
+
+    def to_parsed_dialog(self) -> ParsedDialog:
+        return ParsedDialog(self._file_key, self._photos, self._id_collection,
+                            self._dialog_key, self._last_message)
+
     @staticmethod
     def _convert_file_name_to_key(file_name):
         return Path(file_name).stem
 
     @staticmethod
-    def _parse_json(file):
-        with open(file, 'r', encoding='utf-8-sig') as fp:
-            return json.load(fp)
+    def _parse_json(file, json_backend: str = 'auto'):
+        with metrics.timer('parse.decode'):
+            return load_json(file, json_backend)
 
     def _parse_json_data(self):
-        assert self._json_data
-        meta_info: dict = self._json_data.get('meta')
+        if self._streaming:
+            dialog_stream = DialogStream(self._file)
+            meta_info: dict = dialog_stream.meta
+            self._message_data = dialog_stream.iter_messages()
+        else:
+            assert self._json_data
+            meta_info: dict = self._json_data.get('meta')
+            self._message_data = self._json_data.get('data', [])
         self._owner = meta_info.get('ownerId')
         self._peer = meta_info.get('peer')
-        self._message_data = self._json_data.get('data', [])
+        self._dialog_key = f'{self._owner}_{self._peer}'
+        if self._marks is not None:
+            self._message_data = self._iter_new_messages(
+                self._message_data, self._marks.get(self._dialog_key))
+        if self._message_filter.has_window:
+            self._message_data = self._message_filter.iter_window(
+                self._message_data)
+
+    def _iter_new_messages(self, messages: Iterable[dict],
+                           since: Optional[MessageMark]) -> Iterator[dict]:
+        for message in messages:
+            mark = (message.get('date', 0), message.get('id', 0))
+            if self._last_message is None or mark > self._last_message:
+                self._last_message = mark
+            if since is None or mark > since:
+                yield message
 
     def _need_to_add(self, owner_id):
+        if self._owner_ids is not None and owner_id not in self._owner_ids:
+            return False
         pair = (self._owner, self._peer)
         if self._grabbing_filter == GrabbingFilter.ALL:
             return True
@@ -62,14 +175,8 @@ class SingleDialogParser:
         return True
 
     def _add_photo_to_parsed_data(self, owner_id, date, photo_url):
-        if not self._need_to_add(owner_id):
-            return
         self._id_collection.add(owner_id)
-        self._parsed_data[self._file_key].append({
-            'owner_id': owner_id,
-            'date': date,
-            'photo_url': photo_url
-        })
+        self._photos.append(owner_id, date, photo_url)
 
     def _parse_attachments(self, attachment_list: List[dict]):
         if not attachment_list:
@@ -80,10 +187,13 @@ class SingleDialogParser:
             photo = attachment_dict.get('photo', {})
             if not photo:
                 continue
+            # Filters go before the sizes are walked
+            owner_id = photo.get('owner_id', 0)
+            if not self._need_to_add(owner_id):
+                continue
             sizes = photo.get('sizes', [])
             if not sizes:
                 continue
-            owner_id = photo.get('owner_id', 0)
             date = photo.get('date', 0)
             photo_dict = max(sizes, key=lambda x: x.get('width', 0))
             if not photo_dict or 'url' not in photo_dict:
@@ -101,6 +211,48 @@ class SingleDialogParser:
         for fwd_message in fwd_messages:
             self._parse_message(fwd_message)
 
-    def parse_messages(self):
-        for data in tqdm(self._message_data, position=1):
+    def parse_messages(self, progress: bool = True):
+        """The streaming decode goes into parse.walk too."""
+        message_data = self._message_data
+        if progress:
+            message_data = tqdm(message_data, position=1)
+        message_count = 0
+        with metrics.timer('parse.walk'):
+            for data in message_data:
+                self._parse_message(data)
+                message_count += 1
+        metrics.count('parse.files')
+        metrics.count('parse.messages', message_count)
+        metrics.count('parse.photos', len(self._photos))
+
+    def iter_photos(self) -> Iterator[PhotoTuple]:
+        """Parse messages and yield photos w/o keeping them."""
+        photos = self._photos
+        message_count = 0
+        photo_count = 0
+        for data in self._message_data:
             self._parse_message(data)
+            message_count += 1
+            photo_count += len(photos)
+            yield from photos
+            photos.clear()
+        metrics.count('parse.files')
+        metrics.count('parse.messages', message_count)
+        metrics.count('parse.photos', photo_count)
+
+
+def parse_file(file,
+               grabbing_filter: GrabbingFilter,
+               streaming: bool = False,
+               marks: Optional[Dict[str, MessageMark]] = None,
+               message_filter: Optional[MessageFilter] = None,
+               json_backend: str = 'auto') -> ParsedDialog:
+    """Entry point for the worker processes of the parallel parsing."""
+    parser = SingleDialogParser(file,
+                                grabbing_filter=grabbing_filter,
+                                streaming=streaming,
+                                marks=marks,
+                                message_filter=message_filter,
+                                json_backend=json_backend)
+    parser.parse_messages(progress=False)
+    return parser.to_parsed_dialog()
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+from typing import (TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional,
+                    Tuple)
+
+from api_dog_parser_v2.parser_classes.name_cache import default_cache_dir
+
+if TYPE_CHECKING:
+    from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+
+# (date, id) of the newest processed top-level message
+MessageMark = Tuple[int, int]
+
+
+def default_watch_state_path():
+    return os.path.join(default_cache_dir(), 'watch.json')
+
+
+class WatchState:
+    """State of the watch mode stored in the JSON file.
+
+    marks - per dialog ("ownerId_peer" of the meta) high-water mark, only
+    the messages after it are parsed. files - (size, mtime) of the exports
+    seen, unchanged ones are not opened again. The changes are staged
+    while the poll is going and committed when its photos are downloaded.
+    """
+    def __init__(self, path: Optional[str] = None):
+        self._path = path or default_watch_state_path()
+        self.marks: Dict[str, MessageMark] = {}
+        self._files: Dict[str, List[int]] = {}
+        self._load()
+        self._staged_marks: Dict[str, MessageMark] = {}
+        self._staged_files: Dict[str, List[int]] = {}
+
+    def _load(self):
+        try:
+            with open(self._path, 'r', encoding='utf-8') as fp:
+                raw_state = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exp:
+            _msg = f'Watch state {self._path} is ignored - {exp}'
+            logging.warning(_msg)
+            return
+        self.marks = {
+            dialog_key: tuple(mark)
+            for dialog_key, mark in raw_state.get('marks', {}).items()
+        }
+        self._files = raw_state.get('files', {})
+
+    @staticmethod
+    def _fingerprint(file) -> Optional[List[int]]:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return None
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def filter_changed(
+        self, folders: Iterable[Tuple[str, List[str]]]
+    ) -> Iterator[Tuple[str, List[str]]]:
+        """Pass (folder, files) of the discovery with new / changed files
+        only. Folders w/o them are dropped."""
+        unchanged_count = 0
+        for folder, files in folders:
+            changed = []
+            for file in files:
+                file_key = os.path.abspath(file)
+                fingerprint = self._fingerprint(file)
+                if fingerprint is not None and self._files.get(
+                        file_key) == fingerprint:
+                    unchanged_count += 1
+                    continue
+                self._staged_files[file_key] = fingerprint
+                changed.append(file)
+            if changed:
+                yield folder, changed
+        if unchanged_count:
+            _msg = f'{unchanged_count} unchanged exports were skipped'
+            logging.info(_msg)
+
+    def track(self, parsers: Iterable['ParserManager']
+              ) -> Iterator['ParserManager']:
+        """Pass the managers through and stage their last messages when
+        the consumer is done with them."""
+        for parser in parsers:
+            yield parser
+            self.stage_marks(parser.last_messages)
+
+    def stage_marks(self, marks: Dict[str, MessageMark]):
+        for dialog_key, mark in marks.items():
+            current = self._staged_marks.get(dialog_key,
+                                             self.marks.get(dialog_key))
+            if current is None or mark > current:
+                self._staged_marks[dialog_key] = mark
+
+    @property
+    def has_changes(self):
+        return bool(self._staged_files or self._staged_marks)
+
+    def commit(self):
+        self.marks.update(self._staged_marks)
+        self._files.update((file_key, fingerprint)
+                           for file_key, fingerprint in
+                           self._staged_files.items() if fingerprint)
+        self.rollback()
+        self.save()
+
+    def rollback(self):
+        self._staged_marks = {}
+        self._staged_files = {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self._path)),
+                    exist_ok=True)
+        tmp_path = f'{self._path}.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as fp:
+                json.dump({'marks': self.marks, 'files': self._files}, fp)
+            os.replace(tmp_path, self._path)
+        except OSError as exp:
+            _msg = f'Watch state {self._path} was not saved - {exp}'
+            logging.warning(_msg)
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""DownloadManager throughput against the local stub CDN.
+
+--max-concurrency/--error-rate make the stub throttle, compare the fixed
+limit with --adaptive.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from api_dog_parser_v2.parser_classes.download_manager import DownloadManager
+from api_dog_parser_v2.parser_classes.flow_control import RetryPolicy
+from api_dog_parser_v2.parser_classes.photo_store import PhotoStore
+from benchmarks.stub_server import StubServer
+
+
+def make_file_dict(root_path, base_url, photo_count, owner_count=10):
+    photos = PhotoStore()
+    for index in range(photo_count):
+        photos.append(index % owner_count + 1, 1500000000 + index,
+                      f'{base_url}/c{index}/photo_{index}.jpg')
+    return {'path': root_path, 'url_data': {'dialog': photos}}
+
+
+def main():
+    parser = argparse.ArgumentParser('DownloadManager benchmark')
+    parser.add_argument('-p', '--photos', type=int, default=2000)
+    parser.add_argument('-l', '--limit', type=int, default=50)
+    parser.add_argument('--size', type=int, default=64 * 1024)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--max-concurrency', type=int, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--adaptive', action='store_true', default=False)
+    parser.add_argument('--retries', type=int, default=3)
+    args = parser.parse_args()
+    with StubServer(body_size=args.size,
+                    latency=args.latency,
+                    max_concurrency=args.max_concurrency,
+                    retry_after=args.retry_after,
+                    error_rate=args.error_rate) as server, \
+            tempfile.TemporaryDirectory() as root_path:
+        manager = DownloadManager(args.limit,
+                                  False,
+                                  True,
+                                  retry_policy=RetryPolicy(args.retries),
+                                  adaptive=args.adaptive)
+        manager.add_dict(
+            make_file_dict(root_path, server.base_url, args.photos))
+        start = time.perf_counter()
+        asyncio.get_event_loop().run_until_complete(manager.download_all())
+        elapsed = time.perf_counter() - start
+        downloaded = sum(
+            len(files) for _, _, files in os.walk(root_path))
+    print(f'{downloaded}/{args.photos} photos in {elapsed:.2f}s - '
+          f'{downloaded / elapsed:.0f} photos/s, '
+          f'{downloaded * args.size / elapsed / 2**20:.1f} MiB/s, '
+          f'{server.request_count} requests, {server.throttled_count} '
+          f'throttled, {server.error_count} errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Decode time and peak RSS of every installed JSON backend.
+
+decode - load_json only, parse - SingleDialogParser in the load mode with
+the backend. Every backend is measured in a fresh subprocess, so the peak
+RSS of one backend does not hide the other ones.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from api_dog_parser_v2.parser_classes.json_backends import available_backends
+from benchmarks.generate_export import generate_export
+
+_CHILD = '''
+import json, resource, sys, time
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.json_backends import load_json
+from api_dog_parser_v2.parser_classes.single_parser import SingleDialogParser
+file, backend, repeat = sys.argv[1], sys.argv[2], int(sys.argv[3])
+decode = []
+for _ in range(repeat):
+    start = time.perf_counter()
+    data = load_json(file, backend)
+    decode.append(time.perf_counter() - start)
+    del data
+parse = []
+for _ in range(repeat):
+    start = time.perf_counter()
+    parser = SingleDialogParser(file, GrabbingFilter.ALL,
+                                json_backend=backend)
+    parser.parse_messages(progress=False)
+    parse.append(time.perf_counter() - start)
+    records = len(parser.photos)
+    del parser
+print(json.dumps({
+    'decode_seconds': min(decode),
+    'parse_seconds': min(parse),
+    'records': records,
+    'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+
+def run_backend(file, backend, repeat):
+    env = {**os.environ, 'TQDM_DISABLE': '1'}
+    output = subprocess.run(
+        [sys.executable, '-c', _CHILD, file, backend,
+         str(repeat)],
+        check=True,
+        stdout=subprocess.PIPE,
+        env=env).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser('JSON backends benchmark')
+    parser.add_argument('-m', '--messages', type=int, default=200000)
+    parser.add_argument('--file', help='Use existing export')
+    parser.add_argument('-r',
+                        '--repeat',
+                        type=int,
+                        default=3,
+                        help='Runs per backend, the best one is shown')
+    parser.add_argument('-o', '--output', help='JSON file of the results')
+    args = parser.parse_args()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file = args.file
+        if not file:
+            file = os.path.join(tmp_dir, 'dialog.json')
+            start = time.perf_counter()
+            generate_export(file, args.messages)
+            print(f'Generated {os.path.getsize(file) / 2**20:.1f} MiB in '
+                  f'{time.perf_counter() - start:.1f}s')
+        size_mib = os.path.getsize(file) / 2**20
+        for backend in available_backends():
+            result = results[backend] = run_backend(file, backend,
+                                                    args.repeat)
+            result['decode_mib_per_s'] = size_mib / result['decode_seconds']
+            print(f'{backend:>8}: decode {result["decode_seconds"]:.2f}s '
+                  f'({result["decode_mib_per_s"]:.0f} MiB/s), '
+                  f'parse {result["parse_seconds"]:.2f}s, '
+                  f'peak RSS {result["max_rss_kib"] / 1024:.1f} MiB, '
+                  f'{result["records"]} records')
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump({'size_mib': size_mib, 'results': results}, fp,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Peak RSS and wall time of SingleDialogParser: json.load vs streaming.
+
+Every mode is measured in a fresh subprocess, so the peak RSS of one mode
+does not hide the other one.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate_export import generate_export
+
+_CHILD = '''
+import json, resource, sys, time
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.single_parser import SingleDialogParser
+start = time.perf_counter()
+parser = SingleDialogParser(sys.argv[1], GrabbingFilter.ALL,
+                            streaming=sys.argv[2] == 'stream')
+parser.parse_messages()
+print(json.dumps({
+    'seconds': time.perf_counter() - start,
+    'records': sum(len(data) for data in parser.data_dict.values()),
+    'max_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+'''
+
+
+def run_mode(file, mode):
+    env = {**os.environ, 'TQDM_DISABLE': '1'}
+    output = subprocess.run([sys.executable, '-c', _CHILD, file, mode],
+                            check=True,
+                            stdout=subprocess.PIPE,
+                            env=env).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser('SingleDialogParser benchmark')
+    parser.add_argument('-m', '--messages', type=int, default=500000)
+    parser.add_argument('--file', help='Use existing export')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file = args.file
+        if not file:
+            file = os.path.join(tmp_dir, 'dialog.json')
+            start = time.perf_counter()
+            generate_export(file, args.messages)
+            print(f'Generated {os.path.getsize(file) / 2**20:.1f} MiB in '
+                  f'{time.perf_counter() - start:.1f}s')
+        for mode in ('load', 'stream'):
+            result = run_mode(file, mode)
+            print(f'{mode:>6}: {result["seconds"]:.2f}s, '
+                  f'peak RSS {result["max_rss_kib"] / 1024:.1f} MiB, '
+                  f'{result["records"]} records')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Memory and time of the photo containers on synthetic records.
+
+dicts - a dict per photo, as the parser kept them before PhotoStore.
+store - PhotoStore columns.
+
+Every container is measured in a fresh subprocess.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+_CHILD = '''
+import json, resource, sys, time
+from api_dog_parser_v2.parser_classes.photo_store import PhotoStore
+
+def rss_kib():
+    with open('/proc/self/statm') as fp:
+        return int(fp.read().split()[1]) * resource.getpagesize() // 1024
+
+mode, count = sys.argv[1], int(sys.argv[2])
+urls = ('https://sun9-{}.userapi.com/impg/c{}/v{}/{:x}/photo_{}.jpg'.format(
+    index % 90, 850000 + index % 9000, index, index * 2654435761 % 2**32,
+    index) for index in range(count))
+start_rss = rss_kib()
+start = time.perf_counter()
+if mode == 'dicts':
+    photos = []
+    for index, url in enumerate(urls):
+        photos.append({'owner_id': index % 500 + 1,
+                       'date': 1500000000 + index,
+                       'photo_url': url})
+else:
+    photos = PhotoStore()
+    for index, url in enumerate(urls):
+        photos.append(index % 500 + 1, 1500000000 + index, url)
+build = time.perf_counter() - start
+used_kib = rss_kib() - start_rss
+start = time.perf_counter()
+if mode == 'dicts':
+    for photo in photos:
+        photo['owner_id'], photo['date'], photo['photo_url']
+else:
+    for photo in photos:
+        pass
+print(json.dumps({
+    'build_seconds': build,
+    'iterate_seconds': time.perf_counter() - start,
+    'used_kib': used_kib,
+}))
+'''
+
+
+def run_mode(mode, count):
+    output = subprocess.run([sys.executable, '-c', _CHILD, mode,
+                             str(count)],
+                            check=True,
+                            stdout=subprocess.PIPE,
+                            env=os.environ).stdout
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser('Photo container benchmark')
+    parser.add_argument('-n', '--records', type=int, default=2000000)
+    parser.add_argument('--json', action='store_true', default=False)
+    args = parser.parse_args()
+    results = {mode: run_mode(mode, args.records)
+               for mode in ('dicts', 'store')}
+    if args.json:
+        print(json.dumps(results))
+        return
+    for mode, result in results.items():
+        per_photo = result['used_kib'] * 1024 / args.records
+        print(f'{mode:>6}: build {result["build_seconds"]:.2f}s, '
+              f'iterate {result["iterate_seconds"]:.2f}s, '
+              f'{result["used_kib"] / 1024:.1f} MiB '
+              f'({per_photo:.0f} B/photo)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Generator of synthetic ApiDog v2 JSON exports for benchmarks."""
+import argparse
+import json
+import random
+from typing import NamedTuple, Sequence, Tuple
+
+OWNER_ID = 1000
+PEER_ID = 2000
+SIZE_TYPES = (('s', 75), ('m', 130), ('x', 604), ('y', 807), ('z', 1280),
+              ('w', 2560))
+
+
+class ExportProfile(NamedTuple):
+    """Shape of the generated messages.
+
+    photo_rate - share of the messages with photos (1..max_photos of them),
+    sticker_rate / doc_rate - share of the other ones with a sticker / a
+    document (the parser skips them), fwd_rate - share of the messages with
+    1-3 forwarded ones down to fwd_depth, foreign_owners - count of the
+    owners of the forwarded photos, size_types - (type, width) of every
+    photo size.
+    """
+    photo_rate: float = 0.3
+    fwd_rate: float = 0.1
+    fwd_depth: int = 2
+    max_photos: int = 4
+    sticker_rate: float = 0.1
+    doc_rate: float = 0.0
+    foreign_owners: int = 10**6
+    size_types: Sequence[Tuple[str, int]] = SIZE_TYPES
+    base_url: str = ''
+
+
+def _photo(rnd: random.Random, owner_id, date, profile: ExportProfile):
+    photo_id = rnd.randrange(10**8, 10**9)
+    host = (profile.base_url
+            or f'https://sun9-{rnd.randrange(1, 90)}.userapi.com')
+    sizes = [{
+        'type': size_type,
+        'url': (f'{host}/c{photo_id}/v{photo_id}/'
+                f'{size_type}{photo_id:x}.jpg'),
+        'width': width,
+        'height': width * 3 // 4
+    } for size_type, width in profile.size_types]
+    return {
+        'type': 'photo',
+        'photo': {
+            'id': photo_id,
+            'album_id': -3,
+            'owner_id': owner_id,
+            'date': date,
+            'sizes': sizes,
+            'text': ''
+        }
+    }
+
+
+def _attachments(rnd: random.Random, from_id, date, profile: ExportProfile):
+    if rnd.random() < profile.photo_rate:
+        return [
+            _photo(
+                rnd,
+                rnd.choice(
+                    (from_id, rnd.randrange(1, profile.foreign_owners + 1))),
+                date, profile) for _ in range(rnd.randint(
+                    1, profile.max_photos))
+        ]
+    if rnd.random() < profile.sticker_rate:
+        return [{'type': 'sticker', 'sticker': {'sticker_id': 1}}]
+    if rnd.random() < profile.doc_rate:
+        return [{
+            'type': 'doc',
+            'doc': {
+                'id': rnd.randrange(10**8),
+                'title': 'file.pdf',
+                'url': 'https://vk.com/doc1'
+            }
+        }]
+    return []
+
+
+def _message(rnd: random.Random, message_id, date, profile: ExportProfile,
+             depth):
+    from_id = rnd.choice((OWNER_ID, PEER_ID))
+    message = {
+        'id': message_id,
+        'date': date,
+        'from_id': from_id,
+        'text': 'lorem ipsum ' * rnd.randint(0, 20),
+        'attachments': _attachments(rnd, from_id, date, profile),
+    }
+    if depth and rnd.random() < profile.fwd_rate:
+        message['fwd_messages'] = [
+            _message(rnd, 0, date - rnd.randrange(1, 10**5), profile,
+                     depth - 1) for _ in range(rnd.randint(1, 3))
+        ]
+    return message
+
+
+def generate_export(file,
+                    message_count: int,
+                    photo_rate: float = 0.3,
+                    fwd_rate: float = 0.1,
+                    fwd_depth: int = 2,
+                    seed: int = 0,
+                    base_url: str = '',
+                    profile: ExportProfile = None):
+    """Write an export. base_url replaces the VK CDN host of photo urls.
+
+    profile - full shape of the messages, the other arguments are ignored
+    if it's set.
+    """
+    if profile is None:
+        profile = ExportProfile(photo_rate=photo_rate,
+                                fwd_rate=fwd_rate,
+                                fwd_depth=fwd_depth,
+                                base_url=base_url)
+    rnd = random.Random(seed)
+    meta = {'v': '2.0', 'ownerId': OWNER_ID, 'peer': PEER_ID, 'count': 0}
+    date = 1500000000
+    with open(file, 'w', encoding='utf-8') as fp:
+        # Same layout as ApiDog - "meta" first, no spaces (VERIFY_FILE_HEAD)
+        fp.write('{"meta":')
+        fp.write(json.dumps(meta, separators=(',', ':')))
+        fp.write(',"data":[')
+        for message_id in range(1, message_count + 1):
+            date += rnd.randrange(1, 3600)
+            if message_id > 1:
+                fp.write(',')
+            fp.write(
+                json.dumps(_message(rnd, message_id, date, profile,
+                                    profile.fwd_depth),
+                           ensure_ascii=False,
+                           separators=(',', ':')))
+        fp.write(']}')
+
+
+def parse_size_types(value: str) -> Tuple[Tuple[str, int], ...]:
+    """"s:75,m:130" -> (('s', 75), ('m', 130))"""
+    size_types = []
+    for item in value.split(','):
+        size_type, width = item.split(':')
+        size_types.append((size_type, int(width)))
+    return tuple(size_types)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser):
+    defaults = ExportProfile()
+    parser.add_argument('--photo-rate', type=float,
+                        default=defaults.photo_rate)
+    parser.add_argument('--fwd-rate', type=float, default=defaults.fwd_rate)
+    parser.add_argument('--fwd-depth', type=int, default=defaults.fwd_depth)
+    parser.add_argument('--max-photos', type=int,
+                        default=defaults.max_photos)
+    parser.add_argument('--sticker-rate', type=float,
+                        default=defaults.sticker_rate)
+    parser.add_argument('--doc-rate', type=float, default=defaults.doc_rate)
+    parser.add_argument('--foreign-owners', type=int,
+                        default=defaults.foreign_owners)
+    parser.add_argument('--sizes',
+                        type=parse_size_types,
+                        default=defaults.size_types,
+                        help='Photo sizes - type:width,... Default - '
+                        + ','.join(f'{size_type}:{width}'
+                                   for size_type, width in SIZE_TYPES))
+
+
+def profile_from_args(args: argparse.Namespace,
+                      base_url: str = '') -> ExportProfile:
+    return ExportProfile(photo_rate=args.photo_rate,
+                         fwd_rate=args.fwd_rate,
+                         fwd_depth=args.fwd_depth,
+                         max_photos=args.max_photos,
+                         sticker_rate=args.sticker_rate,
+                         doc_rate=args.doc_rate,
+                         foreign_owners=args.foreign_owners,
+                         size_types=args.sizes,
+                         base_url=base_url)
+
+
+def main():
+    parser = argparse.ArgumentParser('ApiDog v2 export generator')
+    parser.add_argument('file')
+    parser.add_argument('-m', '--messages', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--base-url', default='')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    generate_export(args.file,
+                    args.messages,
+                    seed=args.seed,
+                    profile=profile_from_args(args, args.base_url))
+
+
+if __name__ == '__main__':
+    main()
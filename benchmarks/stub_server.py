@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Local stub CDN (and VK profile pages) for the benchmarks."""
+import argparse
+import asyncio
+import random
+import re
+import threading
+
+from aiohttp import web
+
+_RANGE_RE = re.compile(r'bytes=(\d+)-$')
+_LAST_MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+class StubServer:
+    """aiohttp server in a background thread.
+
+    Every GET returns ``body_size`` bytes after ``latency`` seconds,
+    ``bandwidth`` (bytes/s per response, 0 - unlimited) paces the body.
+    Throttling is simulated with ``max_concurrency`` - requests above it
+    get 429 with ``Retry-After: retry_after`` (0 - no limit), and with
+    ``error_rate`` - share of the random 503 responses. ``/id<N>`` is a
+    profile page with the title for NameGrabber (profile_url).
+    Photos have ETag / Last-Modified, open ranges (``bytes=N-``) with
+    If-Range and If-None-Match are supported, ``bytes_sent`` counts the
+    body bytes.
+    """
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 body_size: int = 64 * 1024,
+                 latency: float = 0.0,
+                 max_concurrency: int = 0,
+                 retry_after: int = 1,
+                 error_rate: float = 0.0,
+                 bandwidth: int = 0,
+                 seed: int = 0):
+        self.host = host
+        self.port = port
+        self._body = b'\xff' * body_size
+        self._latency = latency
+        self._max_concurrency = max_concurrency
+        self._retry_after = retry_after
+        self._error_rate = error_rate
+        self._bandwidth = bandwidth
+        self._random = random.Random(seed)
+        self._active = 0
+        self.request_count = 0
+        self.throttled_count = 0
+        self.error_count = 0
+        self.bytes_sent = 0
+        self._etag = f'"stub-{body_size}"'
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    @property
+    def profile_url(self):
+        return f'{self.base_url}/id{{vk_id}}'
+
+    async def _handle_profile(self, request: web.Request):
+        self.request_count += 1
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        vk_id = request.match_info['vk_id']
+        return web.Response(text=f'<html><title>User {vk_id} | VK</title>'
+                            '</html>',
+                            content_type='text/html')
+
+    def _select(self, request: web.Request):
+        """(status, headers, body) of the conditional / range request."""
+        headers = {
+            'ETag': self._etag,
+            'Last-Modified': _LAST_MODIFIED,
+            'Accept-Ranges': 'bytes'
+        }
+        if request.headers.get('If-None-Match') == self._etag:
+            return 304, headers, b''
+        match = _RANGE_RE.match(request.headers.get('Range', ''))
+        if_range = request.headers.get('If-Range')
+        if not match or if_range not in (None, self._etag, _LAST_MODIFIED):
+            return 200, headers, self._body
+        first = int(match.group(1))
+        total = len(self._body)
+        if first >= total:
+            headers['Content-Range'] = f'bytes */{total}'
+            return 416, headers, b''
+        headers['Content-Range'] = f'bytes {first}-{total - 1}/{total}'
+        return 206, headers, self._body[first:]
+
+    async def _send_paced(self, request: web.Request, status, headers,
+                          body):
+        response = web.StreamResponse(
+            status=status,
+            headers={**headers, 'Content-Length': str(len(body))})
+        response.content_type = 'image/jpeg'
+        await response.prepare(request)
+        chunk_size = 16 * 1024
+        try:
+            for offset in range(0, len(body), chunk_size):
+                chunk = body[offset:offset + chunk_size]
+                await response.write(chunk)
+                self.bytes_sent += len(chunk)
+                await asyncio.sleep(len(chunk) / self._bandwidth)
+        except ConnectionResetError:
+            # The client is gone (interrupted download)
+            return response
+        await response.write_eof()
+        return response
+
+    async def _handle(self, request: web.Request):
+        self.request_count += 1
+        if self._max_concurrency and self._active >= self._max_concurrency:
+            self.throttled_count += 1
+            return web.Response(
+                status=429, headers={'Retry-After': str(self._retry_after)})
+        if self._random.random() < self._error_rate:
+            self.error_count += 1
+            return web.Response(status=503)
+        self._active += 1
+        try:
+            if self._latency:
+                await asyncio.sleep(self._latency)
+            status, headers, body = self._select(request)
+            # aiohttp drops the body of HEAD (but not its length)
+            is_head = request.method == 'HEAD'
+            if self._bandwidth and body and not is_head:
+                return await self._send_paced(request, status, headers,
+                                              body)
+            if not is_head:
+                self.bytes_sent += len(body)
+            return web.Response(status=status,
+                                headers=headers,
+                                body=body,
+                                content_type='image/jpeg')
+        finally:
+            self._active -= 1
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get(r'/id{vk_id:\d+}', self._handle_profile)
+        app.router.add_get('/{tail:.*}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._start())
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *_):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser('Stub CDN')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--size', type=int, default=64 * 1024)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--max-concurrency', type=int, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--bandwidth',
+                        type=int,
+                        default=0,
+                        help='Bytes/s per response, 0 - unlimited')
+    args = parser.parse_args()
+    with StubServer(port=args.port,
+                    body_size=args.size,
+                    latency=args.latency,
+                    max_concurrency=args.max_concurrency,
+                    retry_after=args.retry_after,
+                    error_rate=args.error_rate,
+                    bandwidth=args.bandwidth) as server:
+        print(f'Serving on {server.base_url}')
+        threading.Event().wait()
+
+
+if __name__ == '__main__':
+    main()
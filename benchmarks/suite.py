@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""Benchmark suite of the parse, download and name hot paths.
+
+Stages:
+  single_parser.load / single_parser.stream - SingleDialogParser per file,
+  parser_manager.sequential / parser_manager.jobs - ParserManager over the
+      dataset folders (parse_files / parse_files_parallel),
+  download - DownloadManager.download_all against the stub CDN,
+  names - NameGrabber.crawl against the stub profile pages,
+  end_to_end / end_to_end.pipeline - the CLI over a small dataset with the
+      stub urls (w/o names).
+
+Every stage runs in a fresh subprocess, so the peak RSS of one stage does
+not hide the others, while the stub server stays in this process. The
+results (throughput, latency percentiles in ms, peak RSS) are printed as
+one JSON document or written to --output.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.generate_export import (ExportProfile, add_profile_arguments,
+                                        generate_export, profile_from_args)
+from benchmarks.stub_server import StubServer
+
+STAGES = ('single_parser.load', 'single_parser.stream',
+          'parser_manager.sequential', 'parser_manager.jobs', 'download',
+          'names', 'end_to_end', 'end_to_end.pipeline')
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Seconds -> p50/p90/p99/max/mean in ms (nearest rank)."""
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def rank(share):
+        return values[min(len(values) - 1, int(share * len(values)))]
+
+    return {
+        'p50': rank(0.5) * 1000,
+        'p90': rank(0.9) * 1000,
+        'p99': rank(0.99) * 1000,
+        'max': values[-1] * 1000,
+        'mean': sum(values) / len(values) * 1000,
+        'count': len(values),
+    }
+
+
+def peak_rss_mib():
+    # KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _json_files(folder):
+    return sorted(
+        os.path.join(root, file) for root, _, files in os.walk(folder)
+        for file in files if file.endswith('.json'))
+
+
+def _folder_size(folder):
+    return sum(os.path.getsize(file) for file in _json_files(folder))
+
+
+# Stages - run in the child process
+
+
+def _stage_single_parser(config, streaming):
+    from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+    from api_dog_parser_v2.parser_classes.single_parser import \
+        SingleDialogParser
+    latencies = []
+    photo_count = 0
+    start = time.perf_counter()
+    for file in _json_files(config['dataset']):
+        file_start = time.perf_counter()
+        parser = SingleDialogParser(file,
+                                    GrabbingFilter.ALL,
+                                    streaming=streaming,
+                                    json_backend=config['json_backend'])
+        parser.parse_messages(progress=False)
+        photo_count += len(parser.photos)
+        latencies.append(time.perf_counter() - file_start)
+        del parser
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'throughput': {
+            'messages_per_s': config['message_count'] / seconds,
+            'photos_per_s': photo_count / seconds,
+            'mib_per_s': config['dataset_size'] / 2**20 / seconds,
+        },
+        'latency_ms': percentiles(latencies),
+        'photos': photo_count,
+    }
+
+
+def _stage_parser_manager(config, jobs, parallel):
+    from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+    from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+    folders = sorted({os.path.dirname(file)
+                      for file in _json_files(config['dataset'])})
+    start = time.perf_counter()
+    managers = (ParserManager(folder) for folder in folders)
+    if parallel:
+        managers = ParserManager.parse_files_parallel(
+            managers,
+            GrabbingFilter.ALL,
+            jobs,
+            json_backend=config['json_backend'])
+    latencies = []
+    photo_count = 0
+    folder_start = time.perf_counter()
+    for manager in managers:
+        if not parallel:
+            manager.parse_files(GrabbingFilter.ALL,
+                                json_backend=config['json_backend'])
+        photo_count += sum(
+            len(photos) for photos in manager.data_dict['url_data'].values())
+        latencies.append(time.perf_counter() - folder_start)
+        folder_start = time.perf_counter()
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'jobs': jobs,
+        'throughput': {
+            'messages_per_s': config['message_count'] / seconds,
+            'photos_per_s': photo_count / seconds,
+            'mib_per_s': config['dataset_size'] / 2**20 / seconds,
+        },
+        'latency_ms': percentiles(latencies),
+        'photos': photo_count,
+    }
+
+
+def _stage_download(config):
+    from api_dog_parser_v2.parser_classes.download_manager import \
+        DownloadManager
+    from api_dog_parser_v2.parser_classes.flow_control import RetryPolicy
+    from api_dog_parser_v2.parser_classes.photo_store import PhotoStore
+    latencies = []
+
+    class TimedDownloadManager(DownloadManager):
+        async def _download_photo(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await super()._download_photo(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as root_path:
+        photos = PhotoStore()
+        for index in range(config['photos']):
+            photos.append(index % 50 + 1, 1500000000 + index,
+                          f'{config["base_url"]}/c{index}/p{index}.jpg')
+        manager = TimedDownloadManager(config['limit'],
+                                       False,
+                                       True,
+                                       retry_policy=RetryPolicy(
+                                           config['retries'], 0.05, 1.0),
+                                       adaptive=config['adaptive'])
+        manager.add_dict({'path': root_path, 'url_data': {'d': photos}})
+        start = time.perf_counter()
+        asyncio.get_event_loop().run_until_complete(manager.download_all())
+        seconds = time.perf_counter() - start
+        downloaded = sum(
+            len(files) for _, _, files in os.walk(root_path))
+    return {
+        'seconds': seconds,
+        'throughput': {
+            'photos_per_s': downloaded / seconds,
+            'mib_per_s': downloaded * config['size'] / 2**20 / seconds,
+        },
+        'latency_ms': percentiles(latencies),
+        'photos': downloaded,
+        'failed': config['photos'] - downloaded,
+    }
+
+
+def _stage_names(config):
+    from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+    latencies = []
+
+    class TimedNameGrabber(NameGrabber):
+        async def _fetch_name(self, vk_id, session):
+            start = time.perf_counter()
+            try:
+                return await super()._fetch_name(vk_id, session)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+    grabber = TimedNameGrabber(config['names_limit'],
+                               profile_url=config['profile_url'])
+    ids = list(range(1, config['ids'] + 1))
+    start = time.perf_counter()
+    names = asyncio.get_event_loop().run_until_complete(grabber.crawl(ids))
+    seconds = time.perf_counter() - start
+    return {
+        'seconds': seconds,
+        'throughput': {
+            'ids_per_s': len(ids) / seconds
+        },
+        'latency_ms': percentiles(latencies),
+        'resolved': sum(name != str(vk_id)
+                        for vk_id, name in names.items()),
+    }
+
+
+def _stage_end_to_end(config, pipeline):
+    from api_dog_parser_v2 import parser
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Fresh copy - the photos are downloaded near the exports
+        for file in _json_files(config['e2e_dataset']):
+            target = os.path.join(
+                work_dir, os.path.relpath(file, config['e2e_dataset']))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(file, 'rb') as source, open(target, 'wb') as copy:
+                copy.write(source.read())
+        sys.argv = ['parser', work_dir, '-r', '-n', '-l',
+                    str(config['limit'])] + (['-p'] if pipeline else [])
+        start = time.perf_counter()
+        parser.main()
+        seconds = time.perf_counter() - start
+        photo_count = sum(
+            file.endswith('.jpg') for _, _, files in os.walk(work_dir)
+            for file in files)
+    return {
+        'seconds': seconds,
+        'throughput': {
+            'photos_per_s': photo_count / seconds,
+            'messages_per_s': config['e2e_message_count'] / seconds,
+        },
+        'photos': photo_count,
+    }
+
+
+def run_stage(stage, config):
+    start_rss = peak_rss_mib()
+    if stage.startswith('single_parser.'):
+        result = _stage_single_parser(config, stage.endswith('stream'))
+    elif stage == 'parser_manager.sequential':
+        result = _stage_parser_manager(config, 1, False)
+    elif stage == 'parser_manager.jobs':
+        result = _stage_parser_manager(config, config['jobs'], True)
+    elif stage == 'download':
+        result = _stage_download(config)
+    elif stage == 'names':
+        result = _stage_names(config)
+    else:
+        result = _stage_end_to_end(config, stage.endswith('pipeline'))
+    result['peak_rss_mib'] = peak_rss_mib()
+    result['start_rss_mib'] = start_rss
+    return result
+
+
+# Suite - the parent process
+
+
+def _make_dataset(folder, dialogs, messages, profile: ExportProfile, seed):
+    for index in range(dialogs):
+        # Two dialogs per folder - ParserManager takes a folder
+        dialog_folder = os.path.join(folder, f'export_{index // 2}')
+        os.makedirs(dialog_folder, exist_ok=True)
+        generate_export(os.path.join(dialog_folder, f'dialog_{index}.json'),
+                        messages,
+                        seed=seed + index,
+                        profile=profile)
+
+
+def _run_child(stage, config):
+    with tempfile.NamedTemporaryFile('r', suffix='.json') as result_file:
+        env = {**os.environ, 'TQDM_DISABLE': '1'}
+        subprocess.run([
+            sys.executable, '-m', 'benchmarks.suite', '--stage', stage,
+            '--config',
+            json.dumps(config), '--result', result_file.name
+        ],
+                       check=True,
+                       stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL,
+                       env=env)
+        return json.load(result_file)
+
+
+def _parse_arguments():
+    parser = argparse.ArgumentParser('Benchmark suite')
+    parser.add_argument('--stages',
+                        default=','.join(STAGES),
+                        help='Comma separated stages. Default - all: '
+                        + ','.join(STAGES))
+    parser.add_argument('-o', '--output', help='JSON file of the results')
+    parser.add_argument('--seed', type=int, default=0)
+    dataset = parser.add_argument_group('dataset')
+    dataset.add_argument('--dialogs', type=int, default=4)
+    dataset.add_argument('-m', '--messages', type=int, default=20000,
+                         help='Messages per dialog')
+    add_profile_arguments(dataset)
+    parse = parser.add_argument_group('parse')
+    parse.add_argument('-j',
+                       '--jobs',
+                       type=int,
+                       default=max(2, os.cpu_count() or 1),
+                       help='Processes of parser_manager.jobs')
+    parse.add_argument('--json-backend',
+                       default='auto',
+                       help='Decoder of the load stages (see bench_json for '
+                       'the comparison of the backends)')
+    download = parser.add_argument_group('download / names (stub CDN)')
+    download.add_argument('--photos', type=int, default=2000)
+    download.add_argument('-l', '--limit', type=int, default=50)
+    download.add_argument('--size', type=int, default=64 * 1024)
+    download.add_argument('--latency', type=float, default=0.01)
+    download.add_argument('--bandwidth', type=int, default=0,
+                          help='Bytes/s per response, 0 - unlimited')
+    download.add_argument('--error-rate', type=float, default=0.0)
+    download.add_argument('--retries', type=int, default=3)
+    download.add_argument('--adaptive', action='store_true', default=False)
+    download.add_argument('--ids', type=int, default=500)
+    download.add_argument('--names-limit', type=int, default=10)
+    e2e = parser.add_argument_group('end to end')
+    e2e.add_argument('--e2e-dialogs', type=int, default=2)
+    e2e.add_argument('--e2e-messages', type=int, default=2000)
+    # Child process
+    parser.add_argument('--stage', help=argparse.SUPPRESS)
+    parser.add_argument('--config', help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_arguments()
+    if args.stage:
+        result = run_stage(args.stage, json.loads(args.config))
+        with open(args.result, 'w', encoding='utf-8') as fp:
+            json.dump(result, fp)
+        return
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        sys.exit(f'Unknown stages: {", ".join(sorted(unknown))}')
+    with StubServer(body_size=args.size,
+                    latency=args.latency,
+                    bandwidth=args.bandwidth,
+                    error_rate=args.error_rate,
+                    seed=args.seed) as server, \
+            tempfile.TemporaryDirectory() as work_dir:
+        dataset = os.path.join(work_dir, 'dataset')
+        e2e_dataset = os.path.join(work_dir, 'e2e')
+        start = time.perf_counter()
+        if any(stage.startswith('single_parser')
+               or stage.startswith('parser_manager') for stage in stages):
+            _make_dataset(dataset, args.dialogs, args.messages,
+                          profile_from_args(args), args.seed)
+        if any(stage.startswith('end_to_end') for stage in stages):
+            _make_dataset(e2e_dataset, args.e2e_dialogs, args.e2e_messages,
+                          profile_from_args(args, server.base_url),
+                          args.seed)
+        generate_seconds = time.perf_counter() - start
+        config = {
+            'dataset': dataset,
+            'dataset_size': (_folder_size(dataset)
+                             if os.path.isdir(dataset) else 0),
+            'message_count': args.dialogs * args.messages,
+            'e2e_dataset': e2e_dataset,
+            'e2e_message_count': args.e2e_dialogs * args.e2e_messages,
+            'jobs': args.jobs,
+            'json_backend': args.json_backend,
+            'base_url': server.base_url,
+            'profile_url': server.profile_url,
+            'photos': args.photos,
+            'limit': args.limit,
+            'size': args.size,
+            'retries': args.retries,
+            'adaptive': args.adaptive,
+            'ids': args.ids,
+            'names_limit': args.names_limit,
+        }
+        results = {}
+        for stage in stages:
+            requests_before = server.request_count
+            results[stage] = _run_child(stage, config)
+            results[stage]['stub_requests'] = (server.request_count
+                                               - requests_before)
+            print(f'{stage}: {results[stage]["seconds"]:.2f}s',
+                  file=sys.stderr)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'generate_seconds': generate_seconds,
+        'params': {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ('stage', 'config', 'result', 'output')
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
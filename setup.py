@@ -14,6 +14,7 @@ setup(name='api-dog-json-v2-parser',
       packages=find_packages(),
       author='rotten_meat',
       install_requires=load_requirements(),
+      extras_require={'fast-json': ['orjson']},
       long_description=long_description,
       long_description_content_type="text/markdown",
       url='https://github.com/benhacka/api-dog-json-v2-parser/',
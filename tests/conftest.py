@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+import pytest
+
+from api_dog_parser_v2.parser_classes.download_manager import DownloadManager
+from benchmarks.bench_download import make_file_dict
+from benchmarks.stub_server import StubServer
+
+PHOTO_SIZE = 20000
+
+
+@pytest.fixture(name='run')
+def run_fixture():
+    """run(coroutine) - result of the coroutine in a new event loop."""
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop.run_until_complete
+    loop.close()
+    asyncio.set_event_loop(None)
+
+
+@pytest.fixture(name='stub')
+def stub_fixture():
+    with StubServer(body_size=PHOTO_SIZE) as server:
+        yield server
+
+
+def create_manager(get_name=False, **kwargs) -> DownloadManager:
+    return DownloadManager(8,
+                           get_name=get_name,
+                           is_folder_name_as_json=True,
+                           progress=False,
+                           handle_sigint=False,
+                           **kwargs)
+
+
+def download(run, root, server, count=20, **kwargs):
+    """Download count photos of make_file_dict into the root."""
+    manager = create_manager(**kwargs)
+    manager.add_dict(make_file_dict(str(root), server.base_url, count))
+    return run(manager.download_all())
+
+
+def list_files(root):
+    return sorted(
+        os.path.join(folder, name) for folder, _, names in os.walk(root)
+        for name in names)
@@ -0,0 +1,65 @@
+import asyncio
+import os
+
+from api_dog_parser_v2.api import (download, iter_photo_records,
+                                   resolve_names)
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.parse_cache import ParseCache
+from api_dog_parser_v2.parser_classes.single_parser import parse_file
+from api_dog_parser_v2.parser_classes.watch_state import WatchState
+from benchmarks.generate_export import generate_export
+from tests.conftest import list_files
+
+
+def _export(folder, base_url='', messages=100):
+    os.makedirs(str(folder), exist_ok=True)
+    path = str(folder / 'dialog.json')
+    generate_export(path, messages, seed=6, base_url=base_url)
+    return path
+
+
+async def _collect(records):
+    return [(record.owner_id, record.date, record.photo_url)
+            async for record in records]
+
+
+def test_records_are_the_photos_of_the_exports(run, tmp_path):
+    path = _export(tmp_path / 'export')
+    records = run(_collect(iter_photo_records([str(tmp_path)],
+                                              max_depth=None)))
+    assert records == list(parse_file(path, GrabbingFilter.ALL).photos)
+
+
+def test_jobs_run_in_the_same_loop(run, tmp_path, stub):
+    folders = [tmp_path / 'job1', tmp_path / 'job2']
+    for folder in folders:
+        _export(folder, stub.base_url)
+
+    async def jobs():
+        return await asyncio.gather(*(download(
+            iter_photo_records([str(folder)])) for folder in folders))
+
+    results = run(jobs())
+    photo_count = len(list_files(folders[0] / 'dialog'))
+    assert photo_count
+    assert [result.downloaded for result in results] == [photo_count] * 2
+    assert len(list_files(folders[1] / 'dialog')) == photo_count
+
+
+def test_parse_cache_is_ignored_with_watch_state(run, tmp_path, caplog):
+    _export(tmp_path / 'export')
+    cache_dir = tmp_path / 'cache'
+    records = iter_photo_records(
+        [str(tmp_path / 'export')],
+        parse_cache=ParseCache(str(cache_dir)),
+        watch_state=WatchState(str(tmp_path / 'watch.json')))
+    assert run(_collect(records))
+    assert 'parse_cache is ignored' in caplog.text
+    assert not os.listdir(str(cache_dir))
+
+
+def test_resolve_names(run, stub):
+    assert run(resolve_names([1, '2'], profile_url=stub.profile_url)) == {
+        1: '1 (User 1)',
+        2: '2 (User 2)'
+    }
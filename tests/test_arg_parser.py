@@ -0,0 +1,38 @@
+import sys
+
+import pytest
+
+from api_dog_parser_v2.arg_parser import arg_parser
+from api_dog_parser_v2.parser_classes.json_backends import (
+    BACKEND_NAMES, available_backends)
+
+
+def _parse(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['parser', '.', *args])
+    return arg_parser()
+
+
+@pytest.mark.parametrize('args', [
+    ['--backoff', '0'],
+    ['--backoff', '-1'],
+    ['--backoff', 'nan'],
+    ['--backoff-max', 'inf'],
+    ['--backoff', '5', '--backoff-max', '2'],
+])
+def test_wrong_backoff_is_rejected(monkeypatch, args):
+    with pytest.raises(SystemExit):
+        _parse(monkeypatch, *args)
+
+
+def test_backoff(monkeypatch):
+    args = _parse(monkeypatch, '--backoff', '0.25', '--backoff-max', '0.25')
+    assert (args.backoff, args.backoff_max) == (0.25, 0.25)
+
+
+def test_json_backend_must_be_installed(monkeypatch):
+    assert _parse(monkeypatch, '--json-backend', 'json').json_backend == 'json'
+    missing = [name for name in BACKEND_NAMES
+               if name not in available_backends()]
+    for name in missing[:1] + ['unknown']:
+        with pytest.raises(SystemExit):
+            _parse(monkeypatch, '--json-backend', name)
@@ -0,0 +1,62 @@
+import os
+
+from api_dog_parser_v2.parser_classes.dedup import (PhotoDedup, link_or_copy,
+                                                    normalize_url)
+from benchmarks.bench_download import make_file_dict
+from tests.conftest import PHOTO_SIZE, create_manager, list_files
+
+
+def test_url_key():
+    assert normalize_url(
+        'HTTPS://sun9-35.userapi.com/c1/a.jpg?size=1&type=album#x'
+    ) == normalize_url('https://sun1-2.userapi.com/c1/a.jpg?type=album&size=1')
+    assert normalize_url('https://a.com/1.jpg') != normalize_url(
+        'https://a.com/2.jpg')
+
+
+def test_link_keeps_the_part_of_the_target(tmp_path):
+    source = tmp_path / 'source.jpg'
+    source.write_bytes(b'photo')
+    target = tmp_path / 'folder' / 'target.jpg'
+    target.parent.mkdir()
+    part = tmp_path / 'folder' / 'target.jpg.part'
+    part.write_bytes(b'ph')
+    assert link_or_copy(str(source), str(target)) == 'hardlink'
+    assert os.path.samefile(str(source), str(target))
+    assert part.read_bytes() == b'ph'
+    assert sorted(os.listdir(str(target.parent))) == [
+        'target.jpg', 'target.jpg.part'
+    ]
+
+
+def _download_twice(run, root, server, dedup):
+    """Two dialogs with the same photos."""
+    file_dict = make_file_dict(str(root), server.base_url, 10)
+    photos = file_dict['url_data']['dialog']
+    file_dict['url_data'] = {'dialog1': photos, 'dialog2': photos}
+    manager = create_manager(dedup=dedup)
+    manager.add_dict(file_dict)
+    return run(manager.download_all())
+
+
+def test_duplicates_are_linked(run, tmp_path, stub):
+    dedup = PhotoDedup()
+    result = _download_twice(run, tmp_path, stub, dedup)
+    assert (result.downloaded, result.linked, result.failed) == (10, 10, 0)
+    assert stub.request_count == 10
+    assert dedup.saved_traffic == 10 * PHOTO_SIZE
+    files = list_files(tmp_path)
+    assert len(files) == 20
+    assert all(os.stat(file).st_nlink == 2 for file in files)
+
+
+def test_same_content_is_linked(run, tmp_path, stub):
+    # The stub serves the same body for every url
+    dedup = PhotoDedup(by_content=True)
+    manager = create_manager(dedup=dedup)
+    manager.add_dict(make_file_dict(str(tmp_path), stub.base_url, 5))
+    result = run(manager.download_all())
+    assert result.downloaded == 5
+    assert stub.request_count == 5
+    assert dedup.saved_disk == 4 * PHOTO_SIZE
+    assert all(os.stat(file).st_nlink == 5 for file in list_files(tmp_path))
@@ -0,0 +1,57 @@
+import os
+
+from api_dog_parser_v2.constants_and_enum import VERIFY_FILE_HEAD
+from api_dog_parser_v2.parser_classes.discovery import (FileDiscovery,
+                                                        verify_file)
+
+EXPORT = VERIFY_FILE_HEAD + '},"data":[]}'
+
+
+def _write(root, rel_path, text=EXPORT, bom=False):
+    path = os.path.join(str(root), *rel_path.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write((b'\xef\xbb\xbf' if bom else b'') + text.encode())
+    return path
+
+
+def _discover(root, **kwargs):
+    discovery = FileDiscovery([str(root)], **kwargs)
+    return [(os.path.relpath(folder, str(root)),
+             [os.path.basename(file) for file in files])
+            for folder, files in discovery.iter_folders()], discovery
+
+
+def test_only_exports_are_taken(tmp_path):
+    assert verify_file(_write(tmp_path, 'a.json'))
+    assert verify_file(_write(tmp_path, 'bom.json', bom=True))
+    assert not verify_file(_write(tmp_path, 'other.json', '{"a": 1}'))
+    assert not verify_file(str(tmp_path / 'missing.json'))
+
+
+def test_walk_depth_and_order(tmp_path):
+    for rel_path in ('b.json', 'a.json', 'x/1.json', 'x/y/2.json',
+                     'z/3.json'):
+        _write(tmp_path, rel_path)
+    _write(tmp_path, 'x/not_export.json', '[]')
+    assert _discover(tmp_path)[0] == [('.', ['a.json', 'b.json'])]
+    folders, discovery = _discover(tmp_path, max_depth=None)
+    assert folders == [('.', ['a.json', 'b.json']), ('x', ['1.json']),
+                       (os.path.join('x', 'y'), ['2.json']),
+                       ('z', ['3.json'])]
+    assert (discovery.file_count, discovery.folder_count,
+            discovery.rejected_count) == (5, 4, 1)
+
+
+def test_include_and_exclude(tmp_path):
+    for rel_path in ('a.json', 'a.txt', 'skip/1.json', 'x/skip.json'):
+        _write(tmp_path, rel_path)
+    folders, _ = _discover(tmp_path,
+                           max_depth=None,
+                           include=['*.json', '*.txt'],
+                           exclude=['skip', 'x/skip.json'])
+    assert folders == [('.', ['a.json', 'a.txt'])]
+
+
+def test_root_is_yielded_wo_files(tmp_path):
+    assert _discover(tmp_path)[0] == [('.', [])]
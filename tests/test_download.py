@@ -0,0 +1,97 @@
+import os
+
+from aiohttp import web
+
+from api_dog_parser_v2.parser_classes.flow_control import RetryPolicy
+from api_dog_parser_v2.parser_classes.photo_store import PhotoRecord
+from benchmarks.stub_server import StubServer
+from tests.conftest import (PHOTO_SIZE, create_manager, download,
+                            list_files)
+
+
+class CuttingStub(StubServer):
+    """Drops the connection in the middle of every body."""
+    async def _handle(self, request):
+        self.request_count += 1
+        status, headers, body = self._select(request)
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        await response.write(body[:len(body) // 2])
+        request.transport.close()
+        return response
+
+
+def test_pipeline_downloads_while_records_are_produced(run, tmp_path, stub):
+    requests_before_last = []
+
+    async def records():
+        for index in range(50):
+            if index == 49:
+                requests_before_last.append(stub.request_count)
+            yield PhotoRecord(str(tmp_path), 'dialog', index % 5 + 1,
+                              1500000000 + index,
+                              f'{stub.base_url}/c{index}/photo_{index}.jpg')
+
+    result = run(create_manager().download_records(records(), queue_size=4))
+    assert (result.downloaded, result.failed) == (50, 0)
+    # The producer waits for the workers instead of reading everything
+    assert requests_before_last[0] > 0
+    files = list_files(tmp_path)
+    assert len(files) == 50
+    assert all(os.path.getsize(file) == PHOTO_SIZE for file in files)
+
+
+def test_every_photo_is_downloaded_through_errors(run, tmp_path):
+    with StubServer(body_size=PHOTO_SIZE, error_rate=0.3,
+                    retry_after=0) as server:
+        result = download(run,
+                          tmp_path,
+                          server,
+                          retry_policy=RetryPolicy(10, base_delay=0.01))
+        assert server.error_count
+    assert (result.downloaded, result.failed) == (20, 0)
+    files = list_files(tmp_path)
+    assert len(files) == 20
+    assert all(os.path.getsize(file) == PHOTO_SIZE for file in files)
+
+
+def test_throttled_photos_are_downloaded(run, tmp_path):
+    # The adaptive limit starts at 2 (--limit / 4)
+    with StubServer(body_size=PHOTO_SIZE,
+                    latency=0.01,
+                    max_concurrency=1,
+                    retry_after=0) as server:
+        result = download(run,
+                          tmp_path,
+                          server,
+                          adaptive=True,
+                          retry_policy=RetryPolicy(100,
+                                                   base_delay=0.01,
+                                                   max_delay=0.05))
+        assert server.throttled_count
+    assert (result.downloaded, result.failed) == (20, 0)
+
+
+def test_photos_are_written_by_chunks_within_the_budget(run, tmp_path, stub):
+    result = download(run,
+                       tmp_path,
+                       stub,
+                       chunk_size=1000,
+                       memory_budget=4000)
+    assert (result.downloaded, result.failed) == (20, 0)
+    files = list_files(tmp_path)
+    assert len(files) == 20
+    assert all(os.path.getsize(file) == PHOTO_SIZE for file in files)
+
+
+def test_cut_download_leaves_no_final_photo(run, tmp_path):
+    with CuttingStub(body_size=PHOTO_SIZE) as server:
+        result = download(run,
+                           tmp_path,
+                           server,
+                           count=5,
+                           retry_policy=RetryPolicy(1, base_delay=0.01))
+        assert server.request_count == 10
+    assert (result.downloaded, result.failed) == (0, 5)
+    assert all(file.endswith('.part') for file in list_files(tmp_path))
@@ -0,0 +1,93 @@
+import asyncio
+
+from api_dog_parser_v2.constants_and_enum import DownloadStatus
+from api_dog_parser_v2.parser_classes.download_scheduler import (
+    ByteBudget, DownloadScheduler)
+
+
+def test_workers_are_bounded_and_every_item_is_handled(run):
+    active = set()
+    concurrency = []
+    handled = []
+
+    async def handler(item):
+        active.add(item)
+        concurrency.append(len(active))
+        await asyncio.sleep(0.001)
+        active.discard(item)
+        handled.append(item)
+        return DownloadStatus.DOWNLOADED, 1
+
+    async def schedule():
+        async with DownloadScheduler(handler, 4,
+                                     handle_sigint=False) as scheduler:
+            for item in range(100):
+                assert await scheduler.put(item)
+        return scheduler
+
+    scheduler = run(schedule())
+    assert sorted(handled) == list(range(100))
+    assert max(concurrency) == 4
+    assert scheduler.downloaded_count == 100
+    assert sum(stats.bytes for stats in scheduler.stats) == 100
+
+
+def test_handler_error_does_not_kill_the_worker(run):
+    async def handler(item):
+        if item % 2:
+            raise ValueError(item)
+        return DownloadStatus.DOWNLOADED, 0
+
+    async def schedule():
+        async with DownloadScheduler(handler, 1, queue_size=1,
+                                     handle_sigint=False) as scheduler:
+            for item in range(10):
+                await scheduler.put(item)
+        return scheduler
+
+    scheduler = run(asyncio.wait_for(schedule(), 10))
+    assert (scheduler.downloaded_count, scheduler.failed_count) == (5, 5)
+
+
+def test_stop_finishes_the_items_in_flight(run):
+    started = []
+    finished = []
+
+    async def handler(item):
+        started.append(item)
+        await asyncio.sleep(0.01)
+        finished.append(item)
+        return DownloadStatus.DOWNLOADED, 0
+
+    async def schedule():
+        started_on_stop = []
+        async with DownloadScheduler(handler, 2,
+                                     handle_sigint=False) as scheduler:
+            for item in range(100):
+                if item == 10:
+                    scheduler.stop()
+                    started_on_stop = list(started)
+                if not await scheduler.put(item):
+                    break
+        return scheduler, started_on_stop
+
+    scheduler, started_on_stop = run(schedule())
+    assert scheduler.stopping
+    assert len(started_on_stop) < 10
+    assert finished == started_on_stop
+    assert scheduler.downloaded_count == len(finished)
+
+
+def test_byte_budget_waits_for_the_release(run):
+    async def reserve():
+        budget = ByteBudget(100)
+        # Bigger than the budget - allowed when nothing is reserved
+        await budget.acquire(150)
+        waiting = asyncio.ensure_future(budget.acquire(10))
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+        await budget.release(150)
+        await asyncio.wait_for(waiting, 1)
+        return blocked
+
+    assert run(reserve())
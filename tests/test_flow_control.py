@@ -0,0 +1,25 @@
+from api_dog_parser_v2.parser_classes.flow_control import (AdaptiveLimiter,
+                                                           RetryPolicy)
+
+
+def test_backoff_is_doubled_up_to_the_max():
+    policy = RetryPolicy(base_delay=1, max_delay=5)
+    for attempt, ceiling in ((0, 1), (1, 2), (2, 4), (3, 5), (10, 5)):
+        assert all(0 <= policy.delay(attempt) <= ceiling for _ in range(50))
+    assert all(7 <= policy.delay(0, retry_after=7) <= 8 for _ in range(50))
+
+
+def test_adaptive_limit_grows_and_is_cut_once(run):
+    limiter = AdaptiveLimiter(2, 10)
+
+    async def requests(count, **kwargs):
+        for _ in range(count):
+            await limiter.acquire()
+            await limiter.release(**kwargs)
+
+    run(requests(200, latency=0.01))
+    assert limiter.limit == 10
+    run(requests(5, throttled=True))
+    # A burst of errors is a single signal
+    assert (limiter.limit, limiter.decrease_count) == (7, 1)
+    assert limiter.max_seen == 10
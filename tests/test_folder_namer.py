@@ -0,0 +1,113 @@
+import os
+import sqlite3
+
+from api_dog_parser_v2.api import iter_photo_records
+from api_dog_parser_v2.constants_and_enum import ManifestStatus
+from api_dog_parser_v2.parser_classes.dedup import PhotoDedup
+from api_dog_parser_v2.parser_classes.folder_namer import DeferredFolderNamer
+from api_dog_parser_v2.parser_classes.manifest import DownloadManifest
+from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+from benchmarks.generate_export import generate_export
+from tests.conftest import create_manager
+
+
+def _touch(path, data=b'photo'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def test_id_folder_is_renamed_after_the_downloads(tmp_path):
+    moves = []
+    namer = DeferredFolderNamer(lambda *move: moves.append(move))
+    dialog = str(tmp_path)
+    folder = namer.acquire(dialog, 5)
+    assert folder == '5'
+    _touch(os.path.join(dialog, folder, '1.jpg'))
+    namer.set_name(5, '5 (Name)')
+    assert namer.folder(5) == '5 (Name)'
+    assert os.path.isdir(os.path.join(dialog, '5'))
+    namer.release(dialog, 5, folder)
+    assert os.listdir(dialog) == ['5 (Name)']
+    assert moves == [(os.path.join(dialog, '5'),
+                      os.path.join(dialog, '5 (Name)'))]
+
+
+def test_id_folder_is_merged_into_the_existing_one(tmp_path):
+    namer = DeferredFolderNamer()
+    dialog = str(tmp_path)
+    _touch(os.path.join(dialog, '5', '1.jpg'))
+    _touch(os.path.join(dialog, '5', '2.jpg'), b'new')
+    _touch(os.path.join(dialog, '5 (Name)', '2.jpg'), b'old')
+    namer.track_id_folder(dialog, 5)
+    namer.set_name(5, '5 (Name)')
+    assert sorted(os.listdir(os.path.join(dialog, '5 (Name)'))) == [
+        '1.jpg', '2.jpg'
+    ]
+    # The existing photo is kept, the id folder is left with the other one
+    with open(os.path.join(dialog, '5 (Name)', '2.jpg'), 'rb') as file:
+        assert file.read() == b'old'
+    assert os.listdir(os.path.join(dialog, '5')) == ['2.jpg']
+
+
+def test_manifest_paths_follow_the_folder(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.sqlite3'))
+    old = os.path.join('dialog', '5')
+    paths = [os.path.join(old, '1.jpg'), os.path.join('dialog', '55', '1.jpg')]
+    manifest.add_pending(
+        ('dialog', f'url{index}', path, 5) for index, path in enumerate(paths))
+    manifest.mark(paths[0], ManifestStatus.DONE, 10)
+    manifest.move_folder(old, os.path.join('dialog', '5 (Name)'))
+    rows = sqlite3.connect(manifest.db_path).execute(
+        'SELECT path, status FROM photos ORDER BY url').fetchall()
+    manifest.close()
+    assert rows == [(os.path.join('dialog', '5 (Name)', '1.jpg'),
+                     ManifestStatus.DONE.value),
+                    (paths[1], ManifestStatus.PENDING.value)]
+
+
+def test_dedup_links_the_moved_source(tmp_path):
+    dedup = PhotoDedup()
+    source = os.path.join(str(tmp_path), '5', '1.jpg')
+    _touch(source)
+    os.rename(os.path.join(str(tmp_path), '5'),
+              os.path.join(str(tmp_path), '5 (Name)'))
+    target = os.path.join(str(tmp_path), '6', '1.jpg')
+    assert not dedup.link(source, target)
+    dedup.move_folder(os.path.join(str(tmp_path), '5'),
+                      os.path.join(str(tmp_path), '5 (Name)'))
+    assert dedup.link(source, target)
+    assert os.path.isfile(target)
+
+
+def test_deferred_names_keep_manifest_and_dedup_paths(run, tmp_path, stub):
+    export_folder = tmp_path / 'export'
+    export_folder.mkdir()
+    # The same photos in both dialogs
+    for name in ('dialog1', 'dialog2'):
+        generate_export(str(export_folder / f'{name}.json'),
+                        300,
+                        seed=1,
+                        base_url=stub.base_url)
+    manifest = DownloadManifest(str(tmp_path / 'manifest.sqlite3'))
+    dedup = PhotoDedup()
+    manager = create_manager(manifest=manifest,
+                             dedup=dedup,
+                             defer_names=True,
+                             get_name=True,
+                             name_grabber=NameGrabber(
+                                 4,
+                                 profile_url=stub.profile_url,
+                                 progress=False))
+    result = run(
+        manager.download_records(iter_photo_records([str(export_folder)])))
+    paths = [
+        path for path, in sqlite3.connect(manifest.db_path).execute(
+            'SELECT path FROM photos')
+    ]
+    manifest.close()
+    assert result.failed == 0
+    assert paths and all(os.path.isfile(path) for path in paths)
+    assert '(User' in paths[0]
+    # Every photo of the second dialog is linked, not downloaded again
+    assert dedup.linked_count == len(paths) // 2
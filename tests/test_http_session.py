@@ -0,0 +1,38 @@
+import aiohttp
+
+from api_dog_parser_v2.constants_and_enum import HEADER
+from api_dog_parser_v2.parser_classes.http_session import (PoolSettings,
+                                                           create_session)
+
+
+def test_connections_are_kept_alive(run, stub):
+    created = []
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_connection_create_end(*_):
+        created.append(1)
+
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+
+    async def fetch():
+        async with create_session(trace_configs=[trace_config]) as session:
+            for index in range(10):
+                url = f'{stub.base_url}/{index}.jpg'
+                async with session.get(url) as response:
+                    await response.read()
+
+    run(fetch())
+    assert stub.request_count == 10
+    assert len(created) == 1
+
+
+def test_pool_settings(run):
+    async def settings():
+        async with create_session(PoolSettings(pool_size=7,
+                                               per_host_limit=3,
+                                               dns_ttl=0)) as session:
+            connector = session.connector
+            return (connector.limit, connector.limit_per_host,
+                    connector.use_dns_cache, dict(session.headers))
+
+    assert run(settings()) == (7, 3, False, HEADER)
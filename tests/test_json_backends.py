@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+from api_dog_parser_v2.parser_classes.json_backends import (
+    BACKEND_NAMES, available_backends, get_backend, load_json)
+
+DATA = {'meta': {'ownerId': 1}, 'data': [{'text': 'фото', 'id': 2}]}
+
+
+@pytest.mark.parametrize('backend', ['auto'] + available_backends())
+@pytest.mark.parametrize('prefix', [b'', b'\xef\xbb\xbf'])
+def test_backends_decode_the_same(tmp_path, backend, prefix):
+    path = tmp_path / 'dialog.json'
+    path.write_bytes(prefix + json.dumps(DATA, ensure_ascii=False).encode())
+    assert load_json(str(path), backend) == DATA
+
+
+def test_auto_is_the_fastest_installed():
+    installed = available_backends()
+    assert installed[-1] == 'json'
+    assert get_backend().name == installed[0]
+    assert installed == [name for name in BACKEND_NAMES if name in installed]
+
+
+def test_missing_backend_is_an_error():
+    missing = [name for name in BACKEND_NAMES
+               if name not in available_backends()]
+    if not missing:
+        pytest.skip('Every backend is installed')
+    with pytest.raises(ValueError, match='not installed'):
+        get_backend(missing[0])
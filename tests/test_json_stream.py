@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.json_stream import DialogStream
+from api_dog_parser_v2.parser_classes.single_parser import parse_file
+from benchmarks.generate_export import generate_export
+
+
+@pytest.fixture(name='export', scope='module')
+def export_fixture(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('export') / 'dialog.json')
+    generate_export(path, 500, seed=3, base_url='http://127.0.0.1')
+    return path
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64 * 1024])
+def test_stream_matches_json_load(export, chunk_size):
+    with open(export, encoding='utf-8') as file:
+        data = json.load(file)
+    stream = DialogStream(export, chunk_size)
+    assert stream.meta == data['meta']
+    assert list(stream.iter_messages()) == data['data']
+
+
+def test_streaming_parse_matches_full_parse(export):
+    full = parse_file(export, GrabbingFilter.ALL, json_backend='json')
+    streamed = parse_file(export, GrabbingFilter.ALL, streaming=True)
+    assert len(full.photos)
+    assert list(streamed.photos) == list(full.photos)
+    assert streamed.id_collection == full.id_collection
+
+
+def test_data_before_meta_and_bom(tmp_path):
+    path = tmp_path / 'dialog.json'
+    messages = [{'id': 1, 'text': 'a "}]" я'}, {'id': 2}]
+    path.write_bytes(b'\xef\xbb\xbf' + json.dumps({
+        'data': messages,
+        'meta': {
+            'ownerId': 1
+        }
+    }).encode('utf-8'))
+    stream = DialogStream(str(path), 3)
+    assert stream.meta == {'ownerId': 1}
+    assert list(stream.iter_messages()) == messages
@@ -0,0 +1,59 @@
+from api_dog_parser_v2.constants_and_enum import ManifestStatus
+from api_dog_parser_v2.parser_classes.flow_control import RetryPolicy
+from api_dog_parser_v2.parser_classes.manifest import DownloadManifest
+from benchmarks.stub_server import StubServer
+from tests.conftest import PHOTO_SIZE, download
+
+DONE = ManifestStatus.DONE.value
+FAILED = ManifestStatus.FAILED.value
+PENDING = ManifestStatus.PENDING.value
+
+
+def _download_with_manifest(run, root, server, **kwargs):
+    manifest = DownloadManifest(str(root / 'manifest.sqlite3'))
+    try:
+        result = download(run, root, server, manifest=manifest, **kwargs)
+        return result, manifest.summary()
+    finally:
+        manifest.close()
+
+
+def test_rerun_skips_the_done_photos_wo_requests(run, tmp_path, stub):
+    result, summary = _download_with_manifest(run, tmp_path, stub)
+    assert result.downloaded == 20
+    assert (summary[DONE], summary[PENDING]) == (20, 0)
+    stub.request_count = 0
+    result, summary = _download_with_manifest(run, tmp_path, stub)
+    assert (result.downloaded, result.failed) == (0, 0)
+    assert stub.request_count == 0
+    assert summary[DONE] == 20
+
+
+def test_failed_photos_are_downloaded_by_the_next_run(run, tmp_path):
+    with StubServer(body_size=PHOTO_SIZE, error_rate=1.0) as server:
+        _, summary = _download_with_manifest(run,
+                                             tmp_path,
+                                             server,
+                                             retry_policy=RetryPolicy(0))
+    assert (summary[DONE], summary[FAILED]) == (0, 20)
+    # The same urls - the same port
+    with StubServer(port=server.port, body_size=PHOTO_SIZE) as server:
+        result, summary = _download_with_manifest(run, tmp_path, server)
+    assert result.downloaded == 20
+    assert (summary[DONE], summary[FAILED]) == (20, 0)
+
+
+def test_updates_are_buffered_until_the_flush(tmp_path):
+    manifest = DownloadManifest(str(tmp_path / 'manifest.sqlite3'),
+                                flush_size=2)
+    reader = DownloadManifest(manifest.db_path)
+    manifest.add_pending([('dialog', 'url1', 'dialog/1.jpg', 1),
+                          ('dialog', 'url2', 'dialog/2.jpg', 1)])
+    assert reader.summary()[PENDING] == 2
+    manifest.mark('dialog/1.jpg', ManifestStatus.DONE, 10)
+    assert reader.done_keys() == set()
+    manifest.mark('dialog/2.jpg', ManifestStatus.FAILED)
+    assert reader.done_keys() == {('dialog', 'url1')}
+    assert reader.summary()[FAILED] == 1
+    manifest.close()
+    reader.close()
@@ -0,0 +1,65 @@
+import pytest
+
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.message_filter import MessageFilter
+from api_dog_parser_v2.parser_classes.single_parser import parse_file
+from benchmarks.generate_export import generate_export
+
+
+def _window(dates, **kwargs):
+    messages = ({'date': date} for date in dates)
+    return [
+        message['date']
+        for message in MessageFilter(**kwargs).iter_window(messages)
+    ]
+
+
+@pytest.mark.parametrize('dates, kwargs, expected', [
+    ([1, 2, 100, 3], {'until': 50}, [1, 2, 3]),
+    ([10, 5, 1, 7], {'since': 4}, [10, 5, 7]),
+])
+def test_unordered_dates_are_filtered_to_the_end(dates, kwargs, expected):
+    assert _window(dates, **kwargs) == expected
+
+
+def test_declared_order_stops_at_the_window_end():
+    read = []
+
+    def _messages():
+        for date in (1, 2, 3, 60, 70):
+            read.append(date)
+            yield {'date': date}
+
+    window = MessageFilter(since=2, until=50, date_ordered=True)
+    assert [message['date']
+            for message in window.iter_window(_messages())] == [2, 3]
+    assert read == [1, 2, 3, 60]
+
+
+def test_filters_of_the_parse(tmp_path):
+    path = str(tmp_path / 'dialog.json')
+    generate_export(path, 300, seed=5)
+    photos = list(parse_file(path, GrabbingFilter.ALL).photos)
+    dates = sorted(date for _, date, _ in photos)
+    owner_id = photos[0][0]
+    message_filter = MessageFilter(since=dates[len(dates) // 4],
+                                   until=dates[len(dates) // 2],
+                                   owner_ids=frozenset([owner_id]))
+    parsed, streamed = (list(
+        parse_file(path,
+                   GrabbingFilter.ALL,
+                   streaming=streaming,
+                   message_filter=message_filter).photos)
+                        for streaming in (False, True))
+    assert parsed == streamed
+    assert parsed and set(parsed) < set(photos)
+    assert {photo[0] for photo in parsed} == {owner_id}
+    # The window drops a part of them
+    assert len(parsed) < sum(photo[0] == owner_id for photo in photos)
+
+
+def test_cache_key():
+    assert MessageFilter().cache_key == ''
+    assert MessageFilter(date_ordered=True).cache_key == ''
+    assert MessageFilter(since=1, owner_ids=frozenset([2, -1])).cache_key \
+        == '1-None--1,2'
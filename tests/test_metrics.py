@@ -0,0 +1,55 @@
+import json
+
+from api_dog_parser_v2.parser_classes.metrics import (Histogram, Metrics,
+                                                      metrics)
+from tests.conftest import PHOTO_SIZE, download
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for index in range(1, 101):
+        histogram.add(index / 1000)
+    summary = histogram.to_dict()
+    assert summary['count'] == 100
+    assert (summary['min'], summary['max']) == (0.001, 0.1)
+    # The error of the log buckets is < 19%
+    for share, expected in ((0.5, 0.05), (0.9, 0.09), (0.99, 0.099)):
+        assert expected <= summary[f'p{int(share * 100)}'] <= expected * 1.19
+
+
+def test_worker_state_is_merged():
+    worker = Metrics()
+    worker.count('parse.files', 2)
+    with worker.stage('parse'):
+        pass
+    main = Metrics()
+    main.count('parse.files')
+    main.merge(json.loads(json.dumps(worker.pop_state())))
+    summary = main.to_dict()
+    assert summary['counters'] == {'parse.files': 3}
+    assert summary['timings']['stage.parse']['count'] == 1
+    assert worker.to_dict() == {'counters': {}, 'timings': {}}
+
+
+def test_hooks_get_every_event():
+    events = []
+    collector = Metrics()
+    collector.add_hook(lambda *event: events.append(event))
+    collector.count('a')
+    collector.observe('b', 0.5)
+    assert events == [('a', 'counter', 1), ('b', 'timing', 0.5)]
+
+
+def test_download_is_measured(run, tmp_path, stub):
+    metrics.pop_state()
+    download(run, tmp_path / 'photos', stub)
+    stats_path = str(tmp_path / 'stats.json')
+    metrics.write_json(stats_path)
+    metrics.pop_state()
+    with open(stats_path, encoding='utf-8') as file:
+        stats = json.load(file)
+    assert stats['counters']['download.downloaded'] == 20
+    assert stats['counters']['download.bytes'] == 20 * PHOTO_SIZE
+    for name in ('stage.download', 'http.first_byte', 'download.item'):
+        assert name in stats['timings']
+    assert stats['timings']['download.item']['count'] == 20
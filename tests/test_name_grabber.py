@@ -0,0 +1,59 @@
+from aiohttp import web
+
+from api_dog_parser_v2.parser_classes.name_cache import NameCache
+from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+from benchmarks.stub_server import StubServer
+
+
+class BrokenProfileStub(StubServer):
+    """Profile pages of the even ids are errors with a title."""
+    async def _handle_profile(self, request):
+        if int(request.match_info['vk_id']) % 2:
+            return await super()._handle_profile(request)
+        self.request_count += 1
+        return web.Response(status=500,
+                            text='<html><title>Error | VK</title></html>',
+                            content_type='text/html')
+
+
+def _crawl(run, server, cache_path, ids):
+    grabber = NameGrabber(4,
+                          name_cache=NameCache(str(cache_path)),
+                          profile_url=server.profile_url,
+                          progress=False)
+    return run(grabber.crawl(ids))
+
+
+def test_cached_names_are_not_requested_again(run, tmp_path, stub):
+    cache_path = tmp_path / 'names.json'
+    names = _crawl(run, stub, cache_path, [1, 2, 3])
+    assert names == {vk_id: f'{vk_id} (User {vk_id})' for vk_id in (1, 2, 3)}
+    assert stub.request_count == 3
+    assert _crawl(run, stub, cache_path, [1, 2, 3, 4]) == {
+        **names, 4: '4 (User 4)'
+    }
+    assert stub.request_count == 4
+
+
+def test_error_pages_are_not_cached(run, tmp_path):
+    cache_path = tmp_path / 'names.json'
+    with BrokenProfileStub() as server:
+        assert _crawl(run, server, cache_path, [1, 2]) == {
+            1: '1 (User 1)',
+            2: '2'
+        }
+        _crawl(run, server, cache_path, [1, 2])
+        assert server.request_count == 3
+    assert len(NameCache(str(cache_path))) == 1
+
+
+def test_expired_and_evicted_entries(tmp_path):
+    cache = NameCache(str(tmp_path / 'names.json'), ttl=60, max_size=2)
+    for vk_id in (1, 2, 3):
+        cache.set(vk_id, f'{vk_id} (Name)')
+    cache.save()
+    cache = NameCache(str(tmp_path / 'names.json'), ttl=60, max_size=2)
+    assert len(cache) == 2
+    assert cache.get(1) is None
+    assert cache.get(3) == '3 (Name)'
+    assert NameCache(str(tmp_path / 'names.json'), ttl=-1).get(3) is None
@@ -0,0 +1,46 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from api_dog_parser_v2.parser_classes.output_sink import create_sink
+from tests.conftest import PHOTO_SIZE, download, list_files
+
+
+def _members(archive):
+    if archive.endswith('.zip'):
+        with zipfile.ZipFile(archive) as zip_file:
+            return {
+                info.filename: info.file_size
+                for info in zip_file.infolist()
+            }
+    with tarfile.open(archive) as tar_file:
+        return {info.name: info.size for info in tar_file.getmembers()}
+
+
+@pytest.mark.parametrize('kind', ['dir', 'zip', 'tar'])
+def test_rerun_skips_saved_photos(run, tmp_path, stub, kind):
+    result = download(run, tmp_path, stub, sink=create_sink(kind))
+    assert result.downloaded == 20
+    stub.request_count = 0
+    result = download(run, tmp_path, stub, sink=create_sink(kind))
+    assert (result.downloaded, result.skipped) == (0, 20)
+    assert stub.request_count == 0
+
+
+@pytest.mark.parametrize('kind', ['zip', 'tar'])
+@pytest.mark.parametrize('per_owner', [False, True])
+def test_photos_are_archive_members(run, tmp_path, stub, kind, per_owner):
+    download(run, tmp_path, stub, sink=create_sink(kind, per_owner))
+    files = list_files(tmp_path)
+    # No .part files are left
+    assert all(file.endswith(f'.{kind}') for file in files)
+    assert len(files) == (10 if per_owner else 1)
+    members = {}
+    for archive in files:
+        members.update(_members(archive))
+    assert len(members) == 20
+    assert set(members.values()) == {PHOTO_SIZE}
+    if not per_owner:
+        assert files == [os.path.join(str(tmp_path), f'dialog.{kind}')]
@@ -0,0 +1,78 @@
+import os
+
+import pytest
+
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.parse_cache import ParseCache
+from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+from api_dog_parser_v2.parser_classes.single_parser import parse_file
+from benchmarks.generate_export import generate_export
+
+
+@pytest.fixture(name='export')
+def export_fixture(tmp_path):
+    path = str(tmp_path / 'export' / 'dialog.json')
+    os.makedirs(os.path.dirname(path))
+    generate_export(path, 200, seed=2)
+    return path
+
+
+def test_hit_after_put(tmp_path, export):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    assert cache.get(export, GrabbingFilter.ALL) is None
+    parsed = parse_file(export, GrabbingFilter.ALL)
+    cache.put(export, GrabbingFilter.ALL, parsed)
+    cached = cache.get(export, GrabbingFilter.ALL)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cached.file_key == parsed.file_key
+    assert list(cached.photos) == list(parsed.photos)
+    assert cached.id_collection == parsed.id_collection
+    # Every filter has its own entry
+    assert cache.get(export, GrabbingFilter.OWNER) is None
+
+
+def test_changed_file_is_a_miss(tmp_path, export):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    cache.put(export, GrabbingFilter.ALL, parse_file(export,
+                                                     GrabbingFilter.ALL))
+    generate_export(export, 201, seed=2)
+    assert cache.get(export, GrabbingFilter.ALL) is None
+
+
+@pytest.mark.parametrize('use_hash', [False, True])
+def test_same_size_and_mtime(tmp_path, export, use_hash):
+    cache = ParseCache(str(tmp_path / 'cache'), use_hash=use_hash)
+    cache.put(export, GrabbingFilter.ALL, parse_file(export,
+                                                     GrabbingFilter.ALL))
+    stat = os.stat(export)
+    with open(export, 'r+b') as file:
+        file.seek(stat.st_size // 2)
+        byte = file.read(1)
+        file.seek(-1, os.SEEK_CUR)
+        file.write(b'0' if byte != b'0' else b'1')
+    os.utime(export, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    # Only the content hash tells the difference
+    assert (cache.get(export, GrabbingFilter.ALL) is None) == use_hash
+
+
+def test_broken_entry_is_a_miss(tmp_path, export):
+    cache_dir = tmp_path / 'cache'
+    cache = ParseCache(str(cache_dir))
+    cache.put(export, GrabbingFilter.ALL, parse_file(export,
+                                                     GrabbingFilter.ALL))
+    for entry in cache_dir.iterdir():
+        entry.write_bytes(b'broken')
+    assert cache.get(export, GrabbingFilter.ALL) is None
+
+
+def test_parser_manager_loads_the_cached_files(tmp_path, export):
+    cache = ParseCache(str(tmp_path / 'cache'))
+    managers = [ParserManager(os.path.dirname(export)) for _ in range(2)]
+    for manager in managers:
+        manager.parse_files(GrabbingFilter.ALL, parse_cache=cache)
+    assert (cache.hits, cache.misses) == (1, 1)
+    first, second = ({
+        key: list(store)
+        for key, store in manager.data_dict['url_data'].items()
+    } for manager in managers)
+    assert first == second
@@ -0,0 +1,23 @@
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+from benchmarks.generate_export import generate_export
+
+
+def _photos(manager: ParserManager):
+    return {
+        key: list(store)
+        for key, store in manager.data_dict['url_data'].items()
+    }
+
+
+def test_parallel_parse_matches_sequential(tmp_path):
+    for seed in range(3):
+        generate_export(str(tmp_path / f'dialog{seed}.json'), 200, seed=seed)
+    sequential = ParserManager(str(tmp_path))
+    sequential.parse_files(GrabbingFilter.ALL)
+    parallel = ParserManager.parse_files_parallel(
+        [ParserManager(str(tmp_path))], GrabbingFilter.ALL, 2)[0]
+    assert len(_photos(sequential)) == 3
+    assert _photos(parallel) == _photos(sequential)
+    assert parallel.id_collection == sequential.id_collection
+    assert parallel.last_messages == sequential.last_messages
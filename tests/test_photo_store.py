@@ -0,0 +1,41 @@
+import pickle
+
+import pytest
+
+from api_dog_parser_v2.parser_classes.photo_store import PhotoStore
+
+PHOTOS = [(1, 1500000000, 'https://sun9-1.userapi.com/a.jpg'),
+          (-2, 1500000001, 'https://example.com/фото.jpg'),
+          (3, 1500000002, '')]
+
+
+def _store():
+    store = PhotoStore()
+    for photo in PHOTOS:
+        store.append(*photo)
+    return store
+
+
+def test_photos_are_read_back():
+    store = _store()
+    assert len(store) == 3
+    assert list(store) == PHOTOS
+    assert [store[index] for index in range(3)] == PHOTOS
+    assert store[-2] == PHOTOS[1]
+    assert store.url(1) == PHOTOS[1][2]
+    assert store.owner_id(1) == -2
+    store.clear()
+    assert not store
+    assert not list(store)
+
+
+def test_columns_and_pickle_round_trip():
+    store = _store()
+    assert PhotoStore.from_columns(store.columns()) == store
+    assert list(pickle.loads(pickle.dumps(store))) == PHOTOS
+
+
+def test_broken_columns_are_rejected():
+    owner_ids, dates, urls, url_ends = _store().columns()
+    with pytest.raises(ValueError):
+        PhotoStore.from_columns((owner_ids, dates[:8], urls, url_ends))
@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+from api_dog_parser_v2.constants_and_enum import ManifestStatus
+from api_dog_parser_v2.parser_classes.manifest import DownloadManifest
+from benchmarks.generate_export import generate_export
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _summary(db_path):
+    manifest = DownloadManifest(db_path)
+    try:
+        return manifest.summary()
+    finally:
+        manifest.close()
+
+
+def test_plan_and_two_workers_complete_every_photo(tmp_path, stub):
+    export_folder = tmp_path / 'export'
+    export_folder.mkdir()
+    generate_export(str(export_folder / 'dialog.json'),
+                    300,
+                    seed=1,
+                    base_url=stub.base_url)
+    db_path = str(tmp_path / 'manifest.sqlite3')
+    command = [
+        sys.executable, '-m', 'api_dog_parser_v2.parser',
+        str(tmp_path), '-r', '-n', '-m', db_path
+    ]
+    # Worker names are host-pid - the workers are separate processes
+    env = {**os.environ, 'PYTHONPATH': PACKAGE_ROOT, 'TQDM_DISABLE': '1'}
+    subprocess.run(command + ['--plan'],
+                   env=env,
+                   check=True,
+                   stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL,
+                   timeout=60)
+    queued = _summary(db_path)[ManifestStatus.PENDING.value]
+    assert queued
+    # Both run at once, they are waited for below
+    workers = [
+        subprocess.Popen(  # pylint: disable=consider-using-with
+            command + ['--worker', '-l', '4'],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL) for _ in range(2)
+    ]
+    assert [worker.wait(timeout=60) for worker in workers] == [0, 0]
+    summary = _summary(db_path)
+    assert summary[ManifestStatus.DONE.value] == queued
+    assert summary[ManifestStatus.PENDING.value] == 0
+    # Every photo is claimed by one worker only
+    assert stub.request_count == queued
+    photo_count = sum(
+        len(names) for _, _, names in os.walk(export_folder / 'dialog'))
+    assert photo_count == queued
+
+
+def test_leases_are_exclusive_until_they_expire(tmp_path):
+    db_path = str(tmp_path / 'manifest.sqlite3')
+    planner = DownloadManifest(db_path)
+    planner.add_pending(('dialog', f'url{index}', f'dialog/{index}.jpg', 1)
+                        for index in range(10))
+    planner.close()
+    first, second = DownloadManifest(db_path), DownloadManifest(db_path)
+    claimed = first.claim('first', 6, lease=60)
+    assert len(claimed) == 6
+    others = second.claim('second', 10, lease=60)
+    assert len(others) == 4
+    assert not set(claimed) & set(others)
+    # The first worker is gone w/o the release - its lease expires
+    first.renew('first', -1)
+    assert len(second.claim('second', 10, lease=60)) == 6
+    second.release('second')
+    assert len(first.claim('first', 10, lease=60)) == 10
+    first.close()
+    second.close()
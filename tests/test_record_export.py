@@ -0,0 +1,64 @@
+import csv
+import json
+import os
+
+import pytest
+
+from api_dog_parser_v2.api import iter_photo_records
+from api_dog_parser_v2.parser_classes.name_grabber import NameGrabber
+from api_dog_parser_v2.parser_classes.photo_store import PhotoRecord
+from api_dog_parser_v2.parser_classes.record_export import RecordExporter
+from benchmarks.generate_export import generate_export
+from tests.conftest import create_manager, list_files
+
+
+def _manager(stub):
+    return create_manager(get_name=True,
+                          name_grabber=NameGrabber(
+                              4, profile_url=stub.profile_url,
+                              progress=False))
+
+
+def test_export_has_the_paths_of_the_download(run, tmp_path, stub):
+    export_folder = tmp_path / 'export'
+    export_folder.mkdir()
+    generate_export(str(export_folder / 'dialog.json'),
+                    200,
+                    seed=7,
+                    base_url=stub.base_url)
+    targets = {
+        'jsonl': str(tmp_path / 'out' / 'photos.jsonl'),
+        'csv': str(tmp_path / 'out' / 'photos.csv'),
+        'aria2': str(tmp_path / 'out' / 'photos.aria2'),
+    }
+    with RecordExporter(targets) as exporter:
+        count = run(
+            _manager(stub).export_records(
+                iter_photo_records([str(export_folder)]), exporter))
+    with open(targets['jsonl'], encoding='utf-8') as file:
+        rows = [json.loads(line) for line in file]
+    with open(targets['csv'], encoding='utf-8', newline='') as file:
+        csv_rows = list(csv.DictReader(file))
+    assert len(rows) == len(csv_rows) == count
+    # Only the names are requested
+    assert stub.request_count == len({row['owner_id'] for row in rows})
+    assert [row['path'] for row in rows] == [row['path'] for row in csv_rows]
+    assert all('(User' in row['path'] for row in rows)
+    with open(targets['aria2'], encoding='utf-8') as file:
+        assert file.read().count('\n  out=') == count
+    run(_manager(stub).download_records(
+        iter_photo_records([str(export_folder)])))
+    assert sorted({row['path'] for row in rows}) == [
+        path for path in list_files(export_folder)
+        if not path.endswith('.json')
+    ]
+
+
+def test_failed_export_leaves_no_file(tmp_path):
+    target = str(tmp_path / 'photos.jsonl')
+    record = PhotoRecord(str(tmp_path), 'dialog', 1, 1500000000, 'url')
+    with pytest.raises(RuntimeError):
+        with RecordExporter({'jsonl': target}) as exporter:
+            exporter.write('path', 'url', record)
+            raise RuntimeError
+    assert not os.listdir(str(tmp_path))
@@ -0,0 +1,65 @@
+import logging
+import os
+
+import pytest
+
+from api_dog_parser_v2.parser_classes.output_sink import DirectorySink
+from benchmarks.stub_server import StubServer
+from tests.conftest import PHOTO_SIZE, download, list_files
+
+
+class UnknownLengthStub(StubServer):
+    """Answers the ranges with Content-Range: bytes a-b/*."""
+
+    def _select(self, request):
+        status, headers, body = super()._select(request)
+        if status == 206:
+            content_range = headers['Content-Range']
+            headers['Content-Range'] = f'{content_range.split("/")[0]}/*'
+        return status, headers, body
+
+
+def _truncate(file_name, size):
+    with open(file_name, 'r+b') as file:
+        file.truncate(size)
+
+
+@pytest.mark.parametrize('server_class', [StubServer, UnknownLengthStub])
+def test_interrupted_part_is_resumed(run, tmp_path, server_class):
+    with server_class(body_size=PHOTO_SIZE) as server:
+        download(run, tmp_path, server, count=5)
+        photo = list_files(tmp_path)[0]
+        part_name = DirectorySink().part_name(photo)
+        os.replace(photo, part_name)
+        _truncate(part_name, PHOTO_SIZE // 4)
+        server.bytes_sent = 0
+        result = download(run, tmp_path, server, count=5)
+        assert server.bytes_sent == PHOTO_SIZE - PHOTO_SIZE // 4
+    assert (result.downloaded, result.skipped) == (1, 4)
+    assert not os.path.exists(part_name)
+    assert os.path.getsize(photo) == PHOTO_SIZE
+
+
+def test_verify_repairs_truncated_photo(run, tmp_path, caplog):
+    caplog.set_level(logging.INFO)
+    with StubServer(body_size=PHOTO_SIZE) as server:
+        download(run, tmp_path, server, count=5)
+        photo = list_files(tmp_path)[0]
+        _truncate(photo, PHOTO_SIZE // 2)
+        server.bytes_sent = 0
+        download(run, tmp_path, server, count=5, verify=True)
+        assert server.bytes_sent == PHOTO_SIZE - PHOTO_SIZE // 2
+    assert os.path.getsize(photo) == PHOTO_SIZE
+    assert '4 photos are verified, 1 are repaired' in caplog.text
+
+
+def test_without_verify_truncated_photo_is_skipped(run, tmp_path):
+    with StubServer(body_size=PHOTO_SIZE) as server:
+        download(run, tmp_path, server, count=5)
+        photo = list_files(tmp_path)[0]
+        _truncate(photo, PHOTO_SIZE // 2)
+        server.bytes_sent = 0
+        result = download(run, tmp_path, server, count=5)
+        assert server.bytes_sent == 0
+    assert result.skipped == 5
+    assert os.path.getsize(photo) == PHOTO_SIZE // 2
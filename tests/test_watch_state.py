@@ -0,0 +1,64 @@
+import os
+
+from api_dog_parser_v2.constants_and_enum import GrabbingFilter
+from api_dog_parser_v2.parser_classes.parser_manager import ParserManager
+from api_dog_parser_v2.parser_classes.watch_state import WatchState
+from benchmarks.generate_export import generate_export
+
+
+def _parse(folder, watch_state):
+    manager = ParserManager(folder)
+    manager.parse_files(GrabbingFilter.ALL, marks=watch_state.marks)
+    watch_state.stage_marks(manager.last_messages)
+    return [
+        photo for store in manager.data_dict['url_data'].values()
+        for photo in store
+    ]
+
+
+def test_only_new_messages_are_parsed(tmp_path):
+    export = str(tmp_path / 'export' / 'dialog.json')
+    os.makedirs(os.path.dirname(export))
+    state_path = str(tmp_path / 'watch.json')
+    generate_export(export, 200, seed=4)
+    watch_state = WatchState(state_path)
+    old_photos = _parse(os.path.dirname(export), watch_state)
+    assert old_photos
+    watch_state.commit()
+    # The same dialog with 100 more messages
+    generate_export(export, 300, seed=4)
+    all_photos = _parse(os.path.dirname(export),
+                        WatchState(str(tmp_path / 'other.json')))
+    new_photos = _parse(os.path.dirname(export), WatchState(state_path))
+    assert new_photos
+    assert sorted(old_photos + new_photos) == sorted(all_photos)
+
+
+def test_unchanged_files_are_skipped_after_the_commit(tmp_path):
+    files = [str(tmp_path / name) for name in ('a.json', 'b.json')]
+    for file in files:
+        generate_export(file, 10)
+    watch_state = WatchState(str(tmp_path / 'watch.json'))
+    assert list(watch_state.filter_changed([('root', files)])) == [
+        ('root', files)
+    ]
+    watch_state.rollback()
+    assert not watch_state.has_changes
+    assert len(list(watch_state.filter_changed([('root', files)]))) == 1
+    watch_state.commit()
+    generate_export(files[1], 11)
+    watch_state = WatchState(str(tmp_path / 'watch.json'))
+    assert list(watch_state.filter_changed([('root', files)])) == [
+        ('root', files[1:])
+    ]
+
+
+def test_marks_only_grow(tmp_path):
+    watch_state = WatchState(str(tmp_path / 'watch.json'))
+    watch_state.marks = {'1_2': (100, 5)}
+    watch_state.stage_marks({'1_2': (90, 4), '1_3': (10, 1)})
+    watch_state.rollback()
+    watch_state.stage_marks({'1_2': (90, 4)})
+    assert not watch_state.has_changes
+    watch_state.stage_marks({'1_2': (100, 6)})
+    assert watch_state.has_changes